@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 from aio_pika import Message
 
@@ -65,7 +65,9 @@ class ClaimPredictionRcpClient:
 
             return
 
-    async def get_model_predictions(self, claim_list: List[str]):
+    async def get_model_predictions(
+        self, claim_list: List[str], model_version: Optional[str] = None
+    ):
 
         correlation_id = str(uuid.uuid4())
 
@@ -100,6 +102,8 @@ class ClaimPredictionRcpClient:
                         body=json.dumps(
                             {
                                 "claim": claim_list,
+                                # None routes to the default version of the inference service
+                                "model_version": model_version,
                             }
                         ).encode(),
                         content_type="application/json",  # describe the mime-type of the encoding
@@ -0,0 +1,125 @@
+"""
+Before/after benchmark of the web search ranking text preprocessing.
+
+"before" is the previous per-text pipeline (stopword set rebuilt and the full
+spaCy pipeline run for every result), "cold" is TextPreprocessor with an empty
+cache and "warm" repeats the same claims so snippets come from the cache.
+Outputs of the old and new pipelines are compared as well.
+
+Usage:
+    python benchmark_preprocessing.py --claims 20 --results 30
+    python benchmark_preprocessing.py --data web_search_results.json
+"""
+import argparse
+import json
+import re
+import string
+import sys
+import time
+from typing import List
+
+import spacy
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize
+
+from text_preprocessing import TextPreprocessor, SPACY_MODEL
+
+SAMPLE_SNIPPETS = [
+    "Says the unemployment rate has fallen to its lowest level in 50 years.",
+    "A viral post claims that drinking hot water cures COVID-19. There is no evidence for this.",
+    "The Finnish government did not ban the sale of petrol cars from 2025, despite claims online.",
+    "Photos shared on Facebook show flooding in 2017, not the storms reported this week.",
+    "Politicians' claims about immigration costs don't add up, according to official statistics.",
+    "Wind turbines are not responsible for the deaths of whales off the US east coast.",
+    "The video of the president stumbling was edited to make it look worse than it was.",
+    "No, the European Union isn't forcing member states to eat insects.",
+]
+
+
+def legacy_english_text_preprocessing(nlp, text: str) -> str:
+    text = text.lower()
+    text = text.translate(str.maketrans('', '', string.punctuation))
+    text = re.sub(r'\s+', ' ', text).strip()
+    stop_words = set(stopwords.words('english'))
+    word_tokens = word_tokenize(text)
+    filtered_text = [word for word in word_tokens if word not in stop_words]
+    doc = nlp(" ".join(filtered_text))
+    return " ".join(token.lemma_ for token in doc)
+
+
+def make_claims(n_claims: int, n_results: int) -> List[List[str]]:
+    """
+    Texts of `n_results` search results per claim; consecutive claims share
+    about half of their snippets, as repeated searches do.
+    """
+    claims = []
+    for c in range(n_claims):
+        texts = []
+        for r in range(n_results):
+            i = c * n_results // 2 + r
+            texts.append(f"{SAMPLE_SNIPPETS[i % len(SAMPLE_SNIPPETS)]} ({i})")
+        claims.append(texts)
+    return claims
+
+
+def load_claims(path: str) -> List[List[str]]:
+    """
+    Read a JSON list of web search responses as returned by the web_scrape service.
+    """
+    with open(path) as f:
+        responses = json.load(f)
+
+    claims = []
+    for response in responses:
+        texts = []
+        for key, result_list in response["response"].items():
+            for result in result_list:
+                texts.append(result["statement"] if key == "politifact" else result["title"] + " " + result["snippet"])
+        claims.append(texts)
+    return claims
+
+
+def timed(fn, claims: List[List[str]]):
+    start = time.perf_counter()
+    outputs = [fn(texts) for texts in claims]
+    return time.perf_counter() - start, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Web search preprocessing benchmark")
+    parser.add_argument("--claims", type=int, default=20)
+    parser.add_argument("--results", type=int, default=30, help="Search results per claim")
+    parser.add_argument("--data", type=str, help="JSON list of web search responses instead of synthetic texts")
+    args = parser.parse_args()
+
+    claims = load_claims(args.data) if args.data else make_claims(args.claims, args.results)
+    n_texts = sum(len(texts) for texts in claims)
+
+    nlp = spacy.load(SPACY_MODEL)
+    before_s, before = timed(lambda texts: [legacy_english_text_preprocessing(nlp, t) for t in texts], claims)
+
+    preprocessor = TextPreprocessor()
+    cold_s, after = timed(preprocessor.process, claims)
+    warm_s, _ = timed(preprocessor.process, claims)
+
+    mismatches = sum(a != b for texts_a, texts_b in zip(before, after) for a, b in zip(texts_a, texts_b))
+
+    report = {
+        "claims": len(claims),
+        "texts": n_texts,
+        "enabled_components": preprocessor.nlp.pipe_names,
+        "before_ms_per_claim": 1000 * before_s / len(claims),
+        "cold_ms_per_claim": 1000 * cold_s / len(claims),
+        "warm_ms_per_claim": 1000 * warm_s / len(claims),
+        "speedup_cold": before_s / cold_s,
+        "speedup_warm": before_s / warm_s,
+        "mismatches": mismatches,
+        "cache": preprocessor.stats(),
+    }
+    print(json.dumps(report, indent=2))
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
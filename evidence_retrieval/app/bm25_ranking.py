@@ -0,0 +1,210 @@
+"""
+BM25 ranking of web search results with corpus statistics kept across claims.
+
+Every scraped fact-check snippet is added once (keyed by the hash of its
+preprocessed text) to document frequencies that are persisted to disk, so the
+IDF reflects all snippets seen so far instead of the handful returned for one
+claim. Scoring only looks at the query terms and uses sparse matrix ops.
+
+The hashes of the snippets already counted live in a SQLite key table next to
+the statistics, and both are written by a background thread so saving never
+blocks the event loop.
+"""
+import hashlib
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+from utils import logger
+
+import dotenv
+import os
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+BM25_STATS_PATH = os.getenv("BM25_STATS_PATH", "ranking_data/bm25_stats.json")
+BM25_SEEN_PATH = os.getenv("BM25_SEEN_PATH", "ranking_data/bm25_seen.sqlite")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+BM25_SAVE_EVERY = int(os.getenv("BM25_SAVE_EVERY", "10"))
+
+
+def _tokens(text: str) -> List[str]:
+    # Texts are already lowercased, lemmatized and joined with spaces
+    return text.split()
+
+
+class BM25Scorer:
+    """
+    Incrementally updated BM25 corpus statistics.
+    """
+
+    def __init__(self, path: str = BM25_STATS_PATH, seen_path: str = BM25_SEEN_PATH, k1: float = BM25_K1, b: float = BM25_B, save_every: int = BM25_SAVE_EVERY):
+        self.path = path
+        self.seen_path = seen_path
+        self.k1 = k1
+        self.b = b
+        self.save_every = save_every
+
+        self.n_docs = 0
+        self.total_length = 0
+        self.doc_freq: Dict[str, int] = {}
+        # Keys counted since the last save, and the batches a save is still writing
+        self.unsaved_seen: Set[str] = set()
+        self.saving_seen: List[Set[str]] = []
+        self.unsaved_updates = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bm25-save") if path else None
+
+        if path:
+            os.makedirs(os.path.dirname(seen_path) or ".", exist_ok=True)
+            with sqlite3.connect(seen_path) as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY)")
+            if os.path.exists(path):
+                self.load()
+
+    @property
+    def avg_length(self) -> float:
+        return self.total_length / self.n_docs if self.n_docs else 0.0
+
+    def _stored_keys(self, keys: List[str]) -> Set[str]:
+        if not self.path or not keys:
+            return set()
+        with sqlite3.connect(self.seen_path) as conn:
+            rows = conn.execute(
+                f"SELECT key FROM seen WHERE key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def update(self, texts: List[str]) -> int:
+        """
+        Add the documents not seen before to the corpus statistics and return
+        how many were added.
+        """
+        keys = [hashlib.sha1(text.encode("utf-8")).hexdigest() for text in texts]
+        stored = self._stored_keys(keys)
+
+        added = 0
+        for key, text in zip(keys, texts):
+            if key in stored or key in self.unsaved_seen or any(key in batch for batch in self.saving_seen):
+                continue
+            self.unsaved_seen.add(key)
+
+            tokens = _tokens(text)
+            self.n_docs += 1
+            self.total_length += len(tokens)
+            for term in set(tokens):
+                self.doc_freq[term] = self.doc_freq.get(term, 0) + 1
+            added += 1
+
+        if added:
+            self.unsaved_updates += 1
+            if self.path and self.unsaved_updates >= self.save_every:
+                self.save_async()
+
+        return added
+
+    def idf(self, terms: List[str]) -> np.ndarray:
+        df = np.array([self.doc_freq.get(term, 0) for term in terms], dtype=np.float64)
+        return np.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def score(self, query: str, texts: List[str]) -> np.ndarray:
+        """
+        BM25 score of every text for the query.
+        """
+        query_counts: Dict[str, int] = {}
+        for term in _tokens(query):
+            query_counts[term] = query_counts.get(term, 0) + 1
+
+        if not texts or not query_counts or not self.n_docs:
+            return np.zeros(len(texts))
+
+        terms = list(query_counts)
+        tf = CountVectorizer(analyzer=_tokens, vocabulary=terms).transform(texts).astype(np.float64).tocsr()
+        doc_lengths = np.array([len(_tokens(text)) for text in texts], dtype=np.float64)
+
+        # Saturate the term frequencies in place on the non-zero entries only
+        norms = self.k1 * (1.0 - self.b + self.b * doc_lengths / (self.avg_length or 1.0))
+        rows = np.repeat(np.arange(tf.shape[0]), np.diff(tf.indptr))
+        tf.data = tf.data * (self.k1 + 1.0) / (tf.data + norms[rows])
+
+        weights = self.idf(terms) * np.array([query_counts[term] for term in terms], dtype=np.float64)
+        return np.asarray(tf @ weights).ravel()
+
+    def cosine(self, query: str, texts: List[str]) -> np.ndarray:
+        """
+        TF-IDF cosine similarity of every text to the query, weighted with the
+        persisted document frequencies (smooth IDF, as TfidfVectorizer) instead
+        of a vectorizer fitted on this batch.
+        """
+        if not texts or not _tokens(query):
+            return np.zeros(len(texts))
+
+        counts = CountVectorizer(analyzer=_tokens).fit(texts + [query])
+        terms = counts.get_feature_names_out()
+        df = np.array([self.doc_freq.get(term, 0) for term in terms], dtype=np.float64)
+        idf = np.log((1.0 + self.n_docs) / (1.0 + df)) + 1.0
+
+        vectors = normalize(counts.transform(texts + [query]).astype(np.float64) @ sp.diags(idf))
+        return np.asarray((vectors[:-1] @ vectors[-1].T).todense()).ravel()
+
+    def _snapshot(self) -> dict:
+        return {
+            "n_docs": self.n_docs,
+            "total_length": self.total_length,
+            "doc_freq": dict(self.doc_freq),
+        }
+
+    def _write(self, stats: dict, keys: Set[str]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(stats, f)
+        os.replace(tmp_path, self.path)
+        with sqlite3.connect(self.seen_path) as conn:
+            conn.executemany("INSERT OR IGNORE INTO seen (key) VALUES (?)", [(key,) for key in keys])
+        logger.info(f"Saved BM25 statistics of {stats['n_docs']} documents to {self.path}")
+
+    def _hand_off(self):
+        keys, self.unsaved_seen = self.unsaved_seen, set()
+        self.unsaved_updates = 0
+        return self._snapshot(), keys
+
+    def save_async(self) -> None:
+        """
+        Write the statistics and the new keys on the background thread.
+        """
+        stats, keys = self._hand_off()
+        self.saving_seen.append(keys)
+        future = self.executor.submit(self._write, stats, keys)
+        future.add_done_callback(lambda _: self.saving_seen.remove(keys))
+
+    def save(self) -> None:
+        self._write(*self._hand_off())
+
+    def close(self) -> None:
+        """
+        Flush the unsaved updates and wait for the pending saves.
+        """
+        if self.executor is None:
+            return
+        self.executor.shutdown(wait=True)
+        if self.unsaved_updates:
+            self.save()
+
+    def load(self) -> None:
+        with open(self.path) as f:
+            stats = json.load(f)
+        self.n_docs = stats["n_docs"]
+        self.total_length = stats["total_length"]
+        self.doc_freq = stats["doc_freq"]
+        if "seen" in stats:
+            # Statistics saved before the keys moved to SQLite
+            with sqlite3.connect(self.seen_path) as conn:
+                conn.executemany("INSERT OR IGNORE INTO seen (key) VALUES (?)", [(key,) for key in stats["seen"]])
+        logger.info(f"Loaded BM25 statistics of {self.n_docs} documents from {self.path}")
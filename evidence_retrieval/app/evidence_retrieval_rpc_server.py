@@ -1,5 +1,6 @@
 import asyncio
 import json
+import signal
 
 from aio_pika import Message
 
@@ -19,7 +20,7 @@ import os
 import dotenv
 
 # Import the DateTimeEncoder
-from web_search_retrieval import DateTimeEncoder
+from web_search_retrieval import DateTimeEncoder, bm25_scorer
 
 dotenv.load_dotenv(dotenv.find_dotenv())
 
@@ -35,6 +36,9 @@ RABBITMQ_URL = (
 async def main():
     logger.info("Starting queue consumer")
 
+    # Stop on docker stop like on Ctrl-C, so the shutdown below still runs
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
     # 1. Initialize Semantic search service
     semantic_search_service = SemanticSearchService()
 
@@ -81,14 +85,16 @@ async def main():
                         logger.info(f"search_input: {search_input}")
 
                         # Process search request
+                        cache_status = {}
                         result = await semantic_search_service.semantic_search(
-                            search_input
+                            search_input, cache_status
                         )
 
                         response = result.model_dump()  # dict
 
                         # Compute metrics, insert metrics to database
                         metrics = compute_metrics(response)
+                        metrics.update(cache_status)
 
                         # Log success to monitoring
                         await publish_monitoring_event.publish_event(
@@ -126,4 +132,9 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    finally:
+        # Flush the BM25 statistics gathered since the last save
+        if bm25_scorer is not None:
+            bm25_scorer.close()
@@ -2,6 +2,8 @@ import statistics
 
 from typing import Dict, Any
 
+from score_sketch import build_sketch
+
 def compute_metrics(result_json: Dict[str, Any]) -> Dict[str, Any]:
     
     claim_text = result_json['claim']
@@ -9,9 +11,9 @@ def compute_metrics(result_json: Dict[str, Any]) -> Dict[str, Any]:
     # Produce the metrics logs      
     vector_db_search_scores_fb = [value["score"] for value in result_json['vector_db_results']["facebook_post"]]
     
-    vector_db_search_scores_news = [value["score"] for value in result_json['vector_db_results']["facebook_post"]]
+    vector_db_search_scores_news = [value["score"] for value in result_json['vector_db_results']["news_archive"]]
     
-    vector_db_search_scores = vector_db_search_scores_fb + vector_db_search_scores_fb
+    vector_db_search_scores = vector_db_search_scores_fb + vector_db_search_scores_news
     
     vector_db_search_size = len(vector_db_search_scores)
                 
@@ -34,6 +36,11 @@ def compute_metrics(result_json: Dict[str, Any]) -> Dict[str, Any]:
     web_search_cosine_similarity_mean = sum(web_search_cosine_similarity) / (web_search_size if web_search_size > 0 else 1)
     
     web_search_cosine_similarity_median = statistics.median(web_search_cosine_similarity) if web_search_size > 0 else 0
+    
+    # Mergeable sketches of the score distributions, for percentiles and drift over time ranges in monitoring
+    vector_db_search_scores_sketch = build_sketch(vector_db_search_scores)
+    
+    web_search_cosine_similarity_sketch = build_sketch(web_search_cosine_similarity)
 
     return {
         "claim_text": claim_text,
@@ -46,5 +53,7 @@ def compute_metrics(result_json: Dict[str, Any]) -> Dict[str, Any]:
         "web_search_cosine_similarity_min": web_search_cosine_similarity_min,
         "web_search_cosine_similarity_max": web_search_cosine_similarity_max,
         "web_search_cosine_similarity_mean": web_search_cosine_similarity_mean,
-        "web_search_cosine_similarity_median": web_search_cosine_similarity_median
+        "web_search_cosine_similarity_median": web_search_cosine_similarity_median,
+        "vector_db_search_scores_sketch": vector_db_search_scores_sketch,
+        "web_search_cosine_similarity_sketch": web_search_cosine_similarity_sketch
     }
\ No newline at end of file
@@ -1,4 +1,5 @@
 from pymilvus import (
+    utility,
     MilvusClient,
     DataType,
     Function,
@@ -7,14 +8,244 @@ from pymilvus import (
     RRFRanker,
 )
 
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+
+import dotenv
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+# Build and search parameters of the dense vector index per index type
+INDEX_PRESETS = {
+    "FLAT": {"params": {}, "search_params": {}},
+    "IVF_FLAT": {"params": {"nlist": 1024}, "search_params": {}},
+    "IVF_SQ8": {"params": {"nlist": 1024}, "search_params": {"nprobe": 16}},
+    "IVF_PQ": {"params": {"nlist": 1024, "m": 64, "nbits": 8}, "search_params": {"nprobe": 16}},
+    "HNSW": {"params": {"M": 16, "efConstruction": 200}, "search_params": {"ef": 64}},
+    "DISKANN": {"params": {}, "search_params": {"search_list": 100}},
+}
+
+MILVUS_INDEX_TYPE = os.getenv("MILVUS_INDEX_TYPE", "IVF_FLAT")
+# JSON objects that override the preset of the index type
+MILVUS_INDEX_PARAMS = os.getenv("MILVUS_INDEX_PARAMS", "")
+MILVUS_SEARCH_PARAMS = os.getenv("MILVUS_SEARCH_PARAMS", "")
+# Range search on the dense vector; empty disables the bound
+MILVUS_SEARCH_RADIUS = os.getenv("MILVUS_SEARCH_RADIUS", "0.5")
+MILVUS_SEARCH_RANGE_FILTER = os.getenv("MILVUS_SEARCH_RANGE_FILTER", "0.8")
+# Partitions the source_type partition key values are hashed to
+MILVUS_NUM_PARTITIONS = int(os.getenv("MILVUS_NUM_PARTITIONS", "16"))
+# "year" or "quarter": partition the collection by created_at instead of by
+# source_type, so searches with a created_at upper bound skip later partitions
+MILVUS_TIME_PARTITIONING = os.getenv("MILVUS_TIME_PARTITIONING", "")
+
+# Storage type of the dense vector
+MILVUS_VECTOR_TYPE = os.getenv("MILVUS_VECTOR_TYPE", "FLOAT_VECTOR")
+# Also store a sign-quantized binary copy of the dense vector, search it first
+# and rerank MILVUS_BINARY_OVERSAMPLE times k candidates with the dense vectors
+MILVUS_BINARY_RERANK = os.getenv("MILVUS_BINARY_RERANK", "false")
+MILVUS_BINARY_OVERSAMPLE = int(os.getenv("MILVUS_BINARY_OVERSAMPLE", "10"))
+# Store documents as passages (see passage_chunking.py); searches fetch
+# MILVUS_PASSAGE_OVERSAMPLE times k passages and collapse them to documents
+MILVUS_PASSAGE_CHUNKING = os.getenv("MILVUS_PASSAGE_CHUNKING", "false")
+MILVUS_PASSAGE_OVERSAMPLE = int(os.getenv("MILVUS_PASSAGE_OVERSAMPLE", "3"))
+
+VECTOR_TYPES = {
+    "FLOAT_VECTOR": DataType.FLOAT_VECTOR,
+    "FLOAT16_VECTOR": DataType.FLOAT16_VECTOR,
+    "BFLOAT16_VECTOR": DataType.BFLOAT16_VECTOR,
+}
+
+BINARY_INDEX = {"index_type": "BIN_IVF_FLAT", "params": {"nlist": 1024}, "search_params": {"nprobe": 16}}
+# With binary reranking the dense vectors are only fetched for the candidates,
+# never searched: a memory-mapped FLAT index instead of a graph in memory
+RERANK_DENSE_INDEX = {"index_type": "FLAT", "params": {"mmap.enabled": "true"}}
+
+# Constant of Milvus' RRFRanker
+RRF_K = 60
+
+_TIME_PARTITION_PATTERN = re.compile(r"^y(\d{4})(?:q([1-4]))?$")
+
+
+def time_partition_name(created_at: datetime, granularity: str) -> str:
+    if granularity == "quarter":
+        return f"y{created_at.year}q{(created_at.month - 1) // 3 + 1}"
+    return f"y{created_at.year}"
+
+
+def time_partition_start(partition_name: str):
+    """
+    First moment of a time partition, or None for other partitions.
+    """
+    match = _TIME_PARTITION_PATTERN.match(partition_name)
+    if not match:
+        return None
+    quarter = int(match.group(2) or 1)
+    return datetime(int(match.group(1)), 3 * (quarter - 1) + 1, 1)
+
+
+def to_vector_type(vector, vector_type: str):
+    """
+    Dense vector as the numpy array pymilvus expects for the storage type.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    if vector_type == "FLOAT16_VECTOR":
+        return vector.astype(np.float16)
+    if vector_type == "BFLOAT16_VECTOR":
+        # Imported here: only needed for bfloat16 storage
+        from ml_dtypes import bfloat16
+        return vector.astype(bfloat16)
+    return vector
+
+
+def from_vector_type(value, vector_type: str) -> np.ndarray:
+    """
+    float32 array of a dense vector returned in output_fields: a list of
+    floats for FLOAT_VECTOR, a list holding the raw bytes otherwise.
+    """
+    if vector_type == "FLOAT_VECTOR":
+        return np.asarray(value, dtype=np.float32)
+    raw = value[0] if isinstance(value, list) else value
+    if vector_type == "FLOAT16_VECTOR":
+        return np.frombuffer(raw, dtype=np.float16).astype(np.float32)
+    # bfloat16 is the upper half of a float32
+    return (np.frombuffer(raw, dtype=np.uint16).astype(np.uint32) << 16).view(np.float32)
+
+
+def binary_quantize(vector) -> bytes:
+    """
+    One bit per dimension: whether the component is positive.
+    """
+    return np.packbits(np.asarray(vector) > 0).tobytes()
+
+
+def rerank(query_vector, candidates, k, radius=None, range_filter=None):
+    """
+    Order (hit, dense vector) candidates by exact cosine similarity with the
+    query and keep the top k within the range search bounds.
+    """
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1.0)
+
+    reranked = []
+    for hit, vector in candidates:
+        score = float(np.dot(query, vector) / (np.linalg.norm(vector) or 1.0))
+        if radius is not None and score <= radius:
+            continue
+        if range_filter is not None and score > range_filter:
+            continue
+        reranked.append({**hit, "distance": score})
+
+    reranked.sort(key=lambda hit: hit["distance"], reverse=True)
+    return reranked[:k]
+
+
+def rrf_fuse(result_lists, k):
+    """
+    Reciprocal rank fusion of several hit lists, as RRFRanker does it.
+    """
+    fused = {}
+    for hits in result_lists:
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.setdefault(hit["id"], {**hit, "distance": 0.0})
+            entry["distance"] += 1.0 / (RRF_K + rank)
+    return sorted(fused.values(), key=lambda hit: hit["distance"], reverse=True)[:k]
+
+
+def collapse_passages(hits, k):
+    """
+    Best scoring passage of each document, for the top k documents. Hits are
+    ordered by score.
+    """
+    collapsed, seen = [], set()
+    for hit in hits:
+        if hit["entity"]["id"] in seen:
+            continue
+        seen.add(hit["entity"]["id"])
+        collapsed.append(hit)
+        if len(collapsed) == k:
+            break
+    return collapsed
+
+
+def document_pk(row):
+    """
+    Primary key derived from the document and its content: the same document
+    gets the same key in every seed run, a changed one a new key. Passages
+    append their index to the key of their document.
+    """
+    content = "\x00".join(
+        str(row.get(field, "")) for field in ("source_type", "source", "id", "url", "label", "created_at", "text")
+    )
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _optional_float(value):
+    return float(value) if value not in (None, "") else None
+
+
 class HybridRetriever:
-    def __init__(self, uri, collection_name="hybrid", dense_embedding_function=None):
+    def __init__(
+        self,
+        uri,
+        collection_name="hybrid",
+        dense_embedding_function=None,
+        index_type=MILVUS_INDEX_TYPE,
+        index_params=None,
+        search_params=None,
+        radius=_optional_float(MILVUS_SEARCH_RADIUS),
+        range_filter=_optional_float(MILVUS_SEARCH_RANGE_FILTER),
+        time_partitioning=MILVUS_TIME_PARTITIONING,
+        vector_type=MILVUS_VECTOR_TYPE,
+        binary_rerank=MILVUS_BINARY_RERANK.lower() == "true",
+        binary_oversample=MILVUS_BINARY_OVERSAMPLE,
+        passage_chunking=MILVUS_PASSAGE_CHUNKING.lower() == "true",
+        passage_oversample=MILVUS_PASSAGE_OVERSAMPLE,
+    ):
+        if index_type not in INDEX_PRESETS:
+            raise ValueError(f"Unsupported index type: {index_type}. Available: {list(INDEX_PRESETS)}")
+        if time_partitioning not in ("", "year", "quarter"):
+            raise ValueError(f"Unsupported time partitioning: {time_partitioning}. Use year or quarter")
+        if vector_type not in VECTOR_TYPES:
+            raise ValueError(f"Unsupported vector type: {vector_type}. Available: {list(VECTOR_TYPES)}")
+
         self.uri = uri
         self.collection_name = collection_name
         self.embedding_function = dense_embedding_function
         self.use_reranker = True
         self.use_sparse = True
         self.client = MilvusClient(uri=uri)
+
+        self.index_type = index_type
+        self.index_params = {
+            **INDEX_PRESETS[index_type]["params"],
+            **(index_params if index_params is not None else json.loads(MILVUS_INDEX_PARAMS or "{}")),
+        }
+        self.search_params = {
+            **INDEX_PRESETS[index_type]["search_params"],
+            **(search_params if search_params is not None else json.loads(MILVUS_SEARCH_PARAMS or "{}")),
+        }
+        self.radius = radius
+        self.range_filter = range_filter
+        self.time_partitioning = time_partitioning
+        self._partitions = set()
+        self.vector_type = vector_type
+        self.binary_rerank = binary_rerank
+        self.binary_oversample = binary_oversample
+        self.passage_chunking = passage_chunking
+        self.passage_oversample = passage_oversample
+
+    def dense_search_params(self):
+        params = dict(self.search_params)
+        if self.radius is not None:
+            params["radius"] = self.radius
+        if self.range_filter is not None:
+            params["range_filter"] = self.range_filter
+        return params
     
     def drop_collection(self):
         if self.client.has_collection(self.collection_name):
@@ -25,11 +256,114 @@ class HybridRetriever:
                 print(f"Error dropping collection {self.collection_name}: {e}")
         else:
             print(f"Collection {self.collection_name} does not exist")
+
+    def flush(self):
+        self.client.flush(self.collection_name)
+
+    def collection_generation(self):
+        """
+        Identify the current build of the collection: the collection id changes
+        when it is dropped and recreated, the row count when data is inserted.
+        """
+        if not self.client.has_collection(self.collection_name):
+            return None
+        collection_id = self.client.describe_collection(self.collection_name).get("collection_id")
+        row_count = self.client.get_collection_stats(self.collection_name).get("row_count")
+        return (collection_id, row_count)
+
+    def time_partitions(self):
+        """
+        Start of every time partition of the collection, by partition name.
+        """
+        if not self.client.has_collection(self.collection_name):
+            return {}
+        starts = {name: time_partition_start(name) for name in self.client.list_partitions(self.collection_name)}
+        return {name: start for name, start in starts.items() if start is not None}
+
+    @staticmethod
+    def partitions_until(time_partitions, created_at):
+        """
+        Time partitions that can hold documents created at or before the hybrid
+        timestamp `created_at`.
+        """
+        until = utility.hybridts_to_datetime(created_at).replace(tzinfo=None)
+        return [name for name, start in time_partitions.items() if start <= until]
+
+    def search_layout(self):
+        """
+        Storage type of the dense vector, whether the collection has a binary
+        copy and whether it stores passages, or None if the collection does
+        not exist.
+        """
+        if not self.client.has_collection(self.collection_name):
+            return None
+        fields = {field["name"]: field["type"] for field in self.client.describe_collection(self.collection_name).get("fields", [])}
+        vector_types = {datatype: name for name, datatype in VECTOR_TYPES.items()}
+        return {
+            "vector_type": vector_types.get(fields.get("dense_vector"), "FLOAT_VECTOR"),
+            "binary_rerank": "binary_vector" in fields,
+            "passage_chunking": "passage_index" in fields,
+        }
+
+    def has_content_pks(self):
+        """
+        Whether the collection is keyed by document_pk rather than auto ids.
+        """
+        if not self.client.has_collection(self.collection_name):
+            return False
+        fields = self.client.describe_collection(self.collection_name).get("fields", [])
+        return any(field["name"] == "pk" and not field.get("auto_id") for field in fields)
+
+    def existing_pks(self, pks):
+        existing = set()
+        pks = list(pks)
+        for i in range(0, len(pks), 1000):
+            rows = self.client.query(
+                self.collection_name,
+                filter="pk in {pks}",
+                filter_params={"pks": pks[i:i + 1000]},
+                output_fields=["pk"],
+            )
+            existing.update(row["pk"] for row in rows)
+        return existing
+
+    def delete_stale(self, batch_data):
+        """
+        Delete the earlier versions of the documents in the batch: rows with
+        the same document id and source whose pk is not in the batch.
+        """
+        documents = {(data["id"], data["source"]) for data in batch_data}
+        current = {data["pk"] for data in batch_data}
+        ids = sorted({document_id for document_id, _ in documents})
+
+        stale = []
+        for i in range(0, len(ids), 1000):
+            rows = self.client.query(
+                self.collection_name,
+                filter="id in {ids}",
+                filter_params={"ids": ids[i:i + 1000]},
+                output_fields=["pk", "id", "source"],
+            )
+            stale.extend(
+                row["pk"] for row in rows
+                if (row["id"], row["source"]) in documents and row["pk"] not in current
+            )
+
+        if stale:
+            self.client.delete(self.collection_name, ids=stale)
+        return len(stale)
+
+    def has_field(self, field_name):
+        if not self.client.has_collection(self.collection_name):
+            return False
+        fields = self.client.describe_collection(self.collection_name).get("fields", [])
+        return any(field["name"] == field_name for field in fields)
         
-    def build_collection(self):
-        if isinstance(self.embedding_function.dim, dict):
+    def build_collection(self, dense_dim=None):
+        # dense_dim is given when the documents are embedded in other processes
+        if dense_dim is None and isinstance(self.embedding_function.dim, dict):
             dense_dim = self.embedding_function.dim["dense"]
-        else:
+        elif dense_dim is None:
             dense_dim = self.embedding_function.dim
         # Common finnish stop words: https://github.com/stopwords-iso/stopwords-fi/blob/master/stopwords-fi.json
         tokenizer_params = {
@@ -57,7 +391,8 @@ class HybridRetriever:
             field_name="pk",
             datatype=DataType.VARCHAR,
             is_primary=True,
-            auto_id=True,
+            # document_pk, so reseeding can skip and replace documents
+            auto_id=False,
             max_length=100,
         )
         schema.add_field(
@@ -66,6 +401,12 @@ class HybridRetriever:
             max_length=100,
             description="Original id of the document",
         )
+        if self.passage_chunking:
+            schema.add_field(
+                field_name="passage_index",
+                datatype=DataType.INT64,
+                description="Position of the passage in the document",
+            )
         schema.add_field(
             field_name="text",
             datatype=DataType.VARCHAR,
@@ -82,10 +423,19 @@ class HybridRetriever:
         )
         schema.add_field(
             field_name="dense_vector",
-            datatype=DataType.FLOAT_VECTOR,
+            datatype=VECTOR_TYPES[self.vector_type],
             dim=dense_dim,
             description="Dense vector of the document",
+            # Only read to rerank the binary search candidates
+            **({"mmap_enabled": True} if self.binary_rerank else {}),
         )
+        if self.binary_rerank:
+            schema.add_field(
+                field_name="binary_vector",
+                datatype=DataType.BINARY_VECTOR,
+                dim=dense_dim,
+                description="Sign-quantized dense vector of the document",
+            )
         schema.add_field(
             field_name="label",
             datatype=DataType.VARCHAR,
@@ -110,6 +460,14 @@ class HybridRetriever:
             description="Timestamp of the document",
             max_length=20,
         )
+        schema.add_field(
+            field_name="source_type",
+            datatype=DataType.VARCHAR,
+            description="facebook_post or news_archive; partition key",
+            max_length=32,
+            # Manual time partitions and a partition key are mutually exclusive
+            is_partition_key=not self.time_partitioning,
+        )
 
         functions = Function(
             name="bm25",
@@ -128,16 +486,57 @@ class HybridRetriever:
         )
         index_params.add_index(
             field_name="dense_vector", 
-            index_type="IVF_FLAT", 
+            index_type=RERANK_DENSE_INDEX["index_type"] if self.binary_rerank else self.index_type, 
             metric_type="COSINE",
-            params={"nlist": 1024},
+            params=RERANK_DENSE_INDEX["params"] if self.binary_rerank else self.index_params,
         )
+        if self.binary_rerank:
+            index_params.add_index(
+                field_name="binary_vector",
+                index_type=BINARY_INDEX["index_type"],
+                metric_type="HAMMING",
+                params=BINARY_INDEX["params"],
+            )
 
+        partition_kwargs = {} if self.time_partitioning else {"num_partitions": MILVUS_NUM_PARTITIONS}
         self.client.create_collection(
             collection_name=self.collection_name,
             schema=schema,
             index_params=index_params,
+            **partition_kwargs,
+        )
+
+    def vector_fields(self, dense_vec):
+        fields = {"dense_vector": to_vector_type(dense_vec, self.vector_type)}
+        if self.binary_rerank:
+            fields["binary_vector"] = binary_quantize(dense_vec)
+        return fields
+
+    def binary_rerank_search(self, dense_vec, k, output_fields, filter="", filter_params=dict(), partition_names=None):
+        """
+        Hamming search of the binary vectors for binary_oversample * k
+        candidates, reranked by cosine similarity with the dense vectors.
+        """
+        results = self.client.search(
+            collection_name=self.collection_name,
+            data=[binary_quantize(dense_vec)],
+            anns_field="binary_vector",
+            search_params={
+                "metric_type": "HAMMING",
+                "params": BINARY_INDEX["search_params"],
+            },
+            limit=k * self.binary_oversample,
+            output_fields=output_fields + ["dense_vector"],
+            filter=filter,
+            filter_params=filter_params,
+            partition_names=partition_names,
         )
+        candidates = []
+        for hit in results[0]:
+            entity = dict(hit["entity"])
+            vector = from_vector_type(entity.pop("dense_vector"), self.vector_type)
+            candidates.append(({"id": hit["id"], "distance": hit["distance"], "entity": entity}, vector))
+        return rerank(dense_vec, candidates, k, self.radius, self.range_filter)
 
     def insert_data(self, text_content, metadata):
         # Create dense imbeddings
@@ -153,7 +552,7 @@ class HybridRetriever:
         print(f"collection_name: {self.collection_name}")
         
         inserted_results = self.client.insert(
-            self.collection_name, {"dense_vector": dense_vec, **metadata}
+            self.collection_name, {"pk": document_pk(metadata), **self.vector_fields(dense_vec), **metadata}
         )
         
         return inserted_results
@@ -171,16 +570,42 @@ class HybridRetriever:
         
         # Update batch_data with dense_vecs:
         for i, data in enumerate(batch_data):
-            data["dense_vector"] = dense_vecs[i]
+            data.update(self.vector_fields(dense_vecs[i]))
         print(f"Keys of batch_data: {batch_data[0].keys()}")
         
-        inserted_results = self.client.insert(
-            self.collection_name, batch_data
-        )
+        return self.insert_batch(batch_data)
+
+    def insert_batch(self, batch_data, upsert=False):
+        """
+        Insert rows that already have their vector fields. With upsert, rows
+        replace those with the same pk, so a batch can be written again.
+        """
+        for data in batch_data:
+            data.setdefault("pk", document_pk(data))
+        write = self.client.upsert if upsert else self.client.insert
+
+        if not self.time_partitioning:
+            return write(self.collection_name, batch_data)
+
+        # Insert every document into the partition of its created_at
+        partitions = {}
+        for data in batch_data:
+            created_at = utility.hybridts_to_datetime(data["created_at"])
+            partitions.setdefault(time_partition_name(created_at, self.time_partitioning), []).append(data)
+
+        inserted_results = []
+        for partition_name, partition_data in partitions.items():
+            if partition_name not in self._partitions:
+                if not self.client.has_partition(self.collection_name, partition_name):
+                    self.client.create_partition(self.collection_name, partition_name)
+                self._partitions.add(partition_name)
+            inserted_results.append(
+                write(self.collection_name, partition_data, partition_name=partition_name)
+            )
         
         return inserted_results
         
-    def search(self, query: str, k: int = 10, mode="hybrid", filter="", filter_params=dict()):
+    def search(self, query: str, k: int = 10, mode="hybrid", filter="", filter_params=dict(), partition_names=None):
 
         output_fields = [
             "id",
@@ -190,6 +615,10 @@ class HybridRetriever:
             "source",
             "created_at",
         ]
+        if self.passage_chunking:
+            output_fields.append("passage_index")
+            # Several passages of a document may match: fetch more and collapse
+            document_k, k = k, k * self.passage_oversample
         
         # Embed query: Get dense vector for dense & hybrid search
         if mode in ["dense", "hybrid"]:
@@ -200,7 +629,25 @@ class HybridRetriever:
                 dense_vec = embedding[0]
 
         # Search
-        if mode == "sparse":
+        if mode in ["dense", "hybrid"] and self.binary_rerank:
+            dense_results = self.binary_rerank_search(
+                dense_vec, k, output_fields, filter=filter, filter_params=filter_params, partition_names=partition_names
+            )
+            if mode == "dense":
+                results = [dense_results]
+            else:
+                sparse_results = self.client.search(
+                    collection_name=self.collection_name,
+                    data=[query],
+                    anns_field="sparse_vector",
+                    limit=k,
+                    output_fields=output_fields,
+                    filter=filter,
+                    filter_params=filter_params,
+                    partition_names=partition_names,
+                )
+                results = [rrf_fuse([sparse_results[0], dense_results], k)]
+        elif mode == "sparse":
             results = self.client.search(
                 collection_name=self.collection_name,
                 data=[query],
@@ -209,23 +656,22 @@ class HybridRetriever:
                 output_fields=output_fields,
                 filter=filter,
                 filter_params=filter_params,
+                partition_names=partition_names,
             )
         elif mode == "dense":
             results = self.client.search(
                 collection_name=self.collection_name,
-                data=[dense_vec],
+                data=[to_vector_type(dense_vec, self.vector_type)],
                 anns_field="dense_vector",
                 search_params={
                     "metric_type": "COSINE",
-                    "params": { 
-                        "radius": 0.5,
-                        "range_filter": 0.8
-                        }
+                    "params": self.dense_search_params(),
                     },
                 limit=k,
                 output_fields=output_fields,
                 filter=filter,
                 filter_params=filter_params,
+                partition_names=partition_names,
             )
         elif mode == "hybrid":
             # NOTE: In Hybrid Search, each AnnSearchRequest supports only one query vector.
@@ -244,14 +690,11 @@ class HybridRetriever:
 
             # Dense search
             dense_search_params = {
-                "data": [dense_vec],
+                "data": [to_vector_type(dense_vec, self.vector_type)],
                 "anns_field": "dense_vector",
                 "param": {
                     "metric_type": "COSINE",
-                    "params": { 
-                        "radius": 0.5,
-                        "range_filter": 0.8
-                    }
+                    "params": self.dense_search_params(),
                 },
                 "limit": k,
                 "expr": filter,
@@ -267,9 +710,15 @@ class HybridRetriever:
                 ranker=RRFRanker(),
                 limit=k,
                 output_fields=output_fields,
+                partition_names=partition_names,
             )
         else:
             raise ValueError("Invalid mode")
+
+        hits = results[0]
+        if self.passage_chunking:
+            hits = collapse_passages(hits, document_k)
+
         return [
             {
                 "id": doc["entity"]["id"],
@@ -279,6 +728,7 @@ class HybridRetriever:
                 "source": doc["entity"]["source"],
                 "created_at": doc["entity"]["created_at"],
                 "score": doc["distance"],
+                **({"passage_index": doc["entity"]["passage_index"]} if self.passage_chunking else {}),
             }
-            for doc in results[0]
+            for doc in hits
         ]
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""
+Result cache for SemanticSearchService.
+
+Results are keyed by the normalized claim text and a timestamp bucket (the
+claim date, which is also the granularity of the created_at filter). The
+vector-DB part and the web part have separate TTLs. Vector-DB entries also
+carry the generation of the milvus_hybrid collection (collection id and row
+count), so they stop matching once hybrid_seed.py drops, rebuilds and flushes
+the collection.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Optional, Tuple
+
+import dotenv
+import os
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true")
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "5000"))
+SEARCH_CACHE_VECTOR_DB_TTL_S = float(os.getenv("SEARCH_CACHE_VECTOR_DB_TTL_S", "86400"))
+SEARCH_CACHE_WEB_TTL_S = float(os.getenv("SEARCH_CACHE_WEB_TTL_S", "3600"))
+SEARCH_CACHE_GENERATION_CHECK_S = float(os.getenv("SEARCH_CACHE_GENERATION_CHECK_S", "30"))
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_claim(claim: str) -> str:
+    return _WHITESPACE_PATTERN.sub(" ", claim).strip().lower()
+
+
+def timestamp_bucket(timestamp: Optional[str]) -> str:
+    """
+    Day of the claim timestamp; missing, invalid and future dates fall in
+    today's bucket like validate_and_mk_hybrid_date does.
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    try:
+        day = datetime.strptime(timestamp, "%Y-%m-%d").strftime("%Y-%m-%d") if timestamp else today
+    except ValueError:
+        return today
+    return min(day, today)
+
+
+class TTLCache:
+    """
+    LRU cache whose entries expire `ttl_s` seconds after they were set.
+    """
+
+    def __init__(self, max_size: int, ttl_s: float):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Any, value: Any) -> None:
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl_s)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+class SearchResultCache:
+    """
+    Vector-DB and web search results per (claim, timestamp bucket).
+
+    `get_generation` returns the current collection generation; it is called
+    at most every `generation_check_s` seconds.
+    """
+
+    def __init__(
+        self,
+        get_generation: Callable[[], Any],
+        max_size: int = SEARCH_CACHE_SIZE,
+        vector_db_ttl_s: float = SEARCH_CACHE_VECTOR_DB_TTL_S,
+        web_ttl_s: float = SEARCH_CACHE_WEB_TTL_S,
+        generation_check_s: float = SEARCH_CACHE_GENERATION_CHECK_S,
+    ):
+        self.get_generation = get_generation
+        self.generation_check_s = generation_check_s
+        self.vector_db = TTLCache(max_size, vector_db_ttl_s)
+        self.web = TTLCache(max_size, web_ttl_s)
+
+        self.generation = None
+        self.generation_checked_at = float("-inf")
+
+    @staticmethod
+    def key(claim: str, timestamp: Optional[str]) -> Tuple[str, str]:
+        return normalize_claim(claim), timestamp_bucket(timestamp)
+
+    def current_generation(self) -> Any:
+        now = time.monotonic()
+        if now - self.generation_checked_at >= self.generation_check_s:
+            generation = self.get_generation()
+            if generation != self.generation:
+                # The collection was rebuilt: drop everything computed on the old one
+                self.vector_db.clear()
+                self.generation = generation
+            self.generation_checked_at = now
+        return self.generation
+
+    def get_vector_db(self, claim: str, timestamp: Optional[str]) -> Optional[Any]:
+        return self.vector_db.get((self.current_generation(), *self.key(claim, timestamp)))
+
+    def set_vector_db(self, claim: str, timestamp: Optional[str], results: Any) -> None:
+        self.vector_db.set((self.current_generation(), *self.key(claim, timestamp)), results)
+
+    def get_web(self, claim: str, timestamp: Optional[str]) -> Optional[Any]:
+        return self.web.get(self.key(claim, timestamp))
+
+    def set_web(self, claim: str, timestamp: Optional[str], results: Any) -> None:
+        self.web.set(self.key(claim, timestamp), results)
+
+    def stats(self) -> dict:
+        return {"generation": str(self.generation), "vector_db": self.vector_db.stats(), "web": self.web.stats()}
@@ -11,11 +11,14 @@ from web_search_retrieval import rank_web_search_results
 
 from translator import translate_claim
 
+from search_cache import SearchResultCache, SEARCH_CACHE_ENABLED
+
 from make_request import make_request
 
 from utils import validate_and_mk_hybrid_date, get_date_from_hybrid_ts, logger
 
 from datetime import datetime
+import time
 import dotenv
 import os
 
@@ -25,24 +28,119 @@ S_TRANSFORMERS_MDL_DIR = os.getenv("S_TRANSFORMERS_MDL_DIR")
 MILVUS_URL = os.environ.get("MILVUS_URL", "http://milvus_standalone")
 MILVUS_PORT = int(os.environ.get("MILVUS_PORT", "19530"))
 WEB_SEARCH_URL = os.getenv("WEB_SEARCH_URL")
+COLLECTION_LAYOUT_CHECK_S = float(os.getenv("COLLECTION_LAYOUT_CHECK_S", "30"))
 
 # Const names
 _COLLECTION_NAME = "text_embeddings"
 _VECTOR_FIELD_NAME = "embedding"
 
+# Filters selecting facebook posts and news archive documents. Collections
+# seeded with the source_type partition key are filtered on it, which lets
+# Milvus search only the matching partition; older ones by url.
+SOURCE_FILTERS = {
+    "partition_key": {
+        "facebook_post": "source_type == 'facebook_post'",
+        "news_archive": "source_type == 'news_archive'",
+    },
+    "url": {
+        "facebook_post": "url LIKE 'https://www.facebook.com/%'",
+        "news_archive": "NOT url LIKE 'https://www.facebook.com/%'",
+    },
+}
+
 
 class SemanticSearchService:
     def __init__(self):
-        pass
+        self.search_cache = (
+            SearchResultCache(self._collection_generation) if SEARCH_CACHE_ENABLED == "true" else None
+        )
+        self._metadata_retriever = None
+        self._collection_layout = None
+        self._collection_layout_generation = None
+        self._collection_layout_checked_at = float("-inf")
+
+    def _collection_metadata(self) -> HybridRetriever:
+        if self._metadata_retriever is None:
+            self._metadata_retriever = HybridRetriever(
+                uri=f"{MILVUS_URL}:{MILVUS_PORT}",
+                collection_name="milvus_hybrid",
+            )
+        return self._metadata_retriever
+
+    def _collection_generation(self):
+        return self._collection_metadata().collection_generation()
+
+    def _layout(self) -> dict:
+        """
+        Source filter mode, time partitions and search layout of the current
+        collection, checked again when the collection is rebuilt.
+        """
+        now = time.monotonic()
+        if self._collection_layout is not None and now - self._collection_layout_checked_at < COLLECTION_LAYOUT_CHECK_S:
+            return self._collection_layout
+        self._collection_layout_checked_at = now
+
+        # Checked on its own timer, so it also works with the result cache disabled
+        generation = self._collection_generation()
+        if self._collection_layout is None or generation != self._collection_layout_generation:
+            metadata = self._collection_metadata()
+            self._collection_layout = {
+                "source_filter_mode": "partition_key" if metadata.has_field("source_type") else "url",
+                "time_partitions": metadata.time_partitions(),
+                # Search the collection the way it was built
+                "search_layout": metadata.search_layout() or {},
+            }
+            self._collection_layout_generation = generation
+            logger.info(
+                f"Vector db source filter mode: {self._collection_layout['source_filter_mode']}, "
+                f"time partitions: {sorted(self._collection_layout['time_partitions'])}, "
+                f"search layout: {self._collection_layout['search_layout']}"
+            )
+        return self._collection_layout
+
+    def _source_filters(self) -> dict:
+        return SOURCE_FILTERS[self._layout()["source_filter_mode"]]
+
+    def _partitions_until(self, created_at) -> Optional[List[str]]:
+        """
+        Time partitions a search bounded by `created_at` has to visit, or None
+        to search the whole collection.
+        """
+        time_partitions = self._layout()["time_partitions"]
+        if not time_partitions:
+            return None
+        return HybridRetriever.partitions_until(time_partitions, created_at) or None
+
+    async def semantic_search(self, search_input: Claim, cache_status: Optional[dict] = None) -> ClaimSearchResult:
+        """
+        Search the vector database and the web. If `cache_status` is given, it
+        is filled with whether each part came from the result cache.
+        """
+        cache_status = {} if cache_status is None else cache_status
 
-    async def semantic_search(self, search_input: Claim) -> ClaimSearchResult:
         # vector db search
-        search_results = self._vector_db_search(search_input)
+        search_results = None
+        if self.search_cache is not None:
+            search_results = self.search_cache.get_vector_db(search_input.claim, search_input.timestamp)
+        cache_status["vector_db_cache_hit"] = search_results is not None
+
+        if search_results is None:
+            search_results = self._vector_db_search(search_input)
+            if self.search_cache is not None:
+                self.search_cache.set_vector_db(search_input.claim, search_input.timestamp, search_results)
 
         logger.info(f"DEBUG search_results: {search_results}")
 
         # web search
-        web_search_results = await self._web_search(search_input)
+        web_search_results = None
+        if self.search_cache is not None:
+            web_search_results = self.search_cache.get_web(search_input.claim, search_input.timestamp)
+        cache_status["web_search_cache_hit"] = web_search_results is not None
+
+        if web_search_results is None:
+            web_search_results = await self._web_search(search_input)
+            if self.search_cache is not None:
+                self.search_cache.set_web(search_input.claim, search_input.timestamp, web_search_results)
 
         logger.info(f"web_search_results: {web_search_results}")
 
@@ -61,7 +159,10 @@ class SemanticSearchService:
             WEB_SEARCH_URL, search_input.model_dump()
         )
 
-        ranked_web_search_results = rank_web_search_results(web_search_results)
+        # web_scrape returns the English claim it searched with
+        translated_claim = web_search_results.get("translated_claim") or await translate_claim(search_input.claim, "en")
+
+        ranked_web_search_results = rank_web_search_results(web_search_results, translated_query_text=translated_claim)
 
         return ranked_web_search_results
       
@@ -70,8 +171,9 @@ class SemanticSearchService:
         This function returns vector database search results using standard filter search (https://milvus.io/docs/filtered-search.md)
         The results include both top 10 most relevant news archive and facebook posts according to query and time filter
         """
-        news_archive_filtered_search_res = self._filtered_vector_db_search(search_input = search_input, source_filter="NOT url LIKE 'https://www.facebook.com/%'")
-        fb_post_filtered_search_res = self._filtered_vector_db_search(search_input = search_input, source_filter="url LIKE 'https://www.facebook.com/%'")
+        source_filters = self._source_filters()
+        news_archive_filtered_search_res = self._filtered_vector_db_search(search_input = search_input, source_filter=source_filters["news_archive"])
+        fb_post_filtered_search_res = self._filtered_vector_db_search(search_input = search_input, source_filter=source_filters["facebook_post"])
         return {
             "facebook_post": fb_post_filtered_search_res,
             "news_archive": news_archive_filtered_search_res
@@ -95,6 +197,7 @@ class SemanticSearchService:
             collection_name="milvus_hybrid",
             dense_embedding_function=dense_ef,
             # dense_embedding_function=sentence_transformer_ef,
+            **self._layout()["search_layout"],
         )
 
         query = search_input.claim
@@ -105,7 +208,10 @@ class SemanticSearchService:
         
         filter_params = {"created_at": validate_and_mk_hybrid_date(search_input.timestamp)}
     
-        results = standard_retriever.search(query, k=10, mode="hybrid", filter=filter, filter_params=filter_params)
+        # Partitions starting after the claim date cannot match the created_at filter
+        partition_names = self._partitions_until(filter_params["created_at"])
+
+        results = standard_retriever.search(query, k=10, mode="hybrid", filter=filter, filter_params=filter_params, partition_names=partition_names)
                 
         logger.info(f"search_results for evidence retrieval module: {results}")
 
@@ -0,0 +1,98 @@
+"""
+English text preprocessing for web search ranking.
+
+Lowercases, strips punctuation and whitespace, removes NLTK stopwords and
+lemmatizes with spaCy. All texts of a claim go through `nlp.pipe` in one call
+with only the components the lemmatizer needs, and processed texts are kept in
+an LRU cache so snippets that come back for repeated searches are not
+processed again.
+"""
+import re
+import string
+from collections import OrderedDict
+from typing import List
+
+import nltk
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize
+nltk.download('stopwords', quiet=True)
+nltk.download('punkt', quiet=True)
+
+import spacy
+
+import dotenv
+import os
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_md")
+PREPROCESSING_CACHE_SIZE = int(os.getenv("PREPROCESSING_CACHE_SIZE", "10000"))
+PREPROCESSING_BATCH_SIZE = int(os.getenv("PREPROCESSING_BATCH_SIZE", "64"))
+
+# The rule-based lemmatizer needs POS tags (tok2vec, tagger, attribute_ruler)
+_LEMMATIZER_COMPONENTS = {"tok2vec", "tagger", "attribute_ruler", "lemmatizer"}
+
+_PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+class TextPreprocessor:
+    """
+    Batched, cached version of the per-text preprocessing pipeline.
+    """
+
+    def __init__(self, model_name: str = SPACY_MODEL, cache_size: int = PREPROCESSING_CACHE_SIZE, batch_size: int = PREPROCESSING_BATCH_SIZE):
+        self.stop_words = frozenset(stopwords.words('english'))
+
+        self.nlp = spacy.load(model_name)
+        self.nlp.select_pipes(enable=[name for name in self.nlp.pipe_names if name in _LEMMATIZER_COMPONENTS])
+
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.cache: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def normalize(self, text: str) -> str:
+        """
+        Lowercase, remove punctuation, extra whitespace and stopwords.
+        """
+        text = text.lower().translate(_PUNCTUATION_TABLE)
+        text = _WHITESPACE_PATTERN.sub(' ', text).strip()
+        return " ".join(word for word in word_tokenize(text) if word not in self.stop_words)
+
+    def process(self, texts: List[str]) -> List[str]:
+        """
+        Preprocess `texts`, running spaCy once over the texts not in the cache.
+        """
+        results = {}
+        missing = []
+        for text in dict.fromkeys(texts):
+            if text in self.cache:
+                self.cache.move_to_end(text)
+                results[text] = self.cache[text]
+            else:
+                missing.append(text)
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            docs = self.nlp.pipe((self.normalize(text) for text in missing), batch_size=self.batch_size)
+            for text, doc in zip(missing, docs):
+                results[text] = " ".join(token.lemma_ for token in doc)
+                self._store(text, results[text])
+
+        return [results[text] for text in texts]
+
+    def _store(self, text: str, processed: str) -> None:
+        self.cache[text] = processed
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "cache_size": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
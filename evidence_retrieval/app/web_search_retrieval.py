@@ -1,22 +1,27 @@
-from deep_translator import GoogleTranslator
-
-import string
-import re
 import json
 from datetime import datetime
+from typing import Optional
 
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-nltk.download('stopwords', quiet=True)
-nltk.download('punkt', quiet=True)
+from text_preprocessing import TextPreprocessor
+from bm25_ranking import BM25Scorer
+from translator import translator
+
+import dotenv
+import os
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+# Ranking of the web search results: "bm25" (corpus statistics kept across claims) or "tfidf"
+# (fit per claim). Results always carry the TF-IDF cosine as "similarity", with bm25 weighted by the
+# persisted document frequencies; with bm25 also "bm25_score"
+WEB_SEARCH_RANKING = os.getenv("WEB_SEARCH_RANKING", "bm25")
 
-import spacy
+text_preprocessor = TextPreprocessor()
 
-nlp = spacy.load("en_core_web_md")
+bm25_scorer = BM25Scorer() if WEB_SEARCH_RANKING == "bm25" else None
 
 # Custom JSON encoder to handle datetime objects
 class DateTimeEncoder(json.JSONEncoder):
@@ -26,28 +31,7 @@ class DateTimeEncoder(json.JSONEncoder):
         return super().default(obj)
 
 def english_text_preprocessing(text: str) -> str:
-    # Convert to lowercase
-    text = text.lower()
-    
-    # Remove punctuation
-    text = text.translate(str.maketrans('', '', string.punctuation))
-    
-    # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    # Remove stopwords
-    stop_words = set(stopwords.words('english'))
-    word_tokens = word_tokenize(text)
-    filtered_text = [word for word in word_tokens if word not in stop_words]
-    
-    # Lemmatize using spaCy
-    doc = nlp(" ".join(filtered_text))
-    lemmatized_text = [token.lemma_ for token in doc]
-    
-    # Join lemmatized words
-    processed_text = " ".join(lemmatized_text)
-    
-    return processed_text
+    return text_preprocessor.process([text])[0]
 
     
 def calculate_tf_idf(preprocessed_texts: list, query_text: str) -> dict:
@@ -94,12 +78,13 @@ def calculate_tf_idf(preprocessed_texts: list, query_text: str) -> dict:
     
     return results
 
-def rank_web_search_results(web_search_results: dict, top_k: int = 10) -> dict:
+def rank_web_search_results(web_search_results: dict, top_k: int = 10, translated_query_text: Optional[str] = None) -> dict:
     
     query_text = web_search_results["claim"]
     
-    # translate the query text to english
-    translated_query_text = GoogleTranslator(source='auto', target='en').translate(query_text)
+    # translate the query text to english, unless the caller already did
+    if translated_query_text is None:
+        translated_query_text = translator.translate_sync(query_text, "en")
     
     text_keys = {
         "politifact": "statement",
@@ -108,25 +93,35 @@ def rank_web_search_results(web_search_results: dict, top_k: int = 10) -> dict:
         "snopes": ["snippet", "title"]
     }
     
-    # preprocess the text
-    processed_text_list = []
+    # preprocess the text of all results in one batch
+    raw_text_list = []
     result_mapping = []  # Store mapping between processed text index and original result
     
     for key, result_list in web_search_results["response"].items():
         for result in result_list:
             result["source"] = key
             if key == "politifact":
-                result["processed_text"] = english_text_preprocessing(result["statement"])
+                raw_text_list.append(result["statement"])
             else:
-                title_snippet_combined = result["title"] + " " + result["snippet"]
-                result["processed_text"] = english_text_preprocessing(title_snippet_combined)
-                
-            processed_text_list.append(result["processed_text"])
+                raw_text_list.append(result["title"] + " " + result["snippet"])
             result_mapping.append(result)
+    
+    if not raw_text_list:
+        return []
+    
+    processed_text_list = text_preprocessor.process(raw_text_list)
+    for result, processed_text in zip(result_mapping, processed_text_list):
+        result["processed_text"] = processed_text
             
-    # Calculate Tf-Idf and similarities
-    tf_idf_results = calculate_tf_idf(processed_text_list, translated_query_text)
-    similarities = tf_idf_results["similarities"]
+    # "similarity" stays a TF-IDF cosine in [0, 1], as monitoring reads it
+    if bm25_scorer is not None:
+        # Add unseen snippets to the corpus statistics and reuse them for the IDF
+        processed_query = english_text_preprocessing(translated_query_text)
+        bm25_scorer.update(processed_text_list)
+        similarities = bm25_scorer.cosine(processed_query, processed_text_list)
+    else:
+        tf_idf_results = calculate_tf_idf(processed_text_list, translated_query_text)
+        similarities = tf_idf_results["similarities"]
     
     # Create ranked results with similarity scores
     ranked_results = []
@@ -136,8 +131,15 @@ def rank_web_search_results(web_search_results: dict, top_k: int = 10) -> dict:
             "similarity": float(similarity)  # Convert to Python float for JSON serialization
         })
     
-    # Sort the results based on the similarity
-    ranked_results.sort(key=lambda x: x["similarity"], reverse=True)
+    if bm25_scorer is not None:
+        # Rank by the (unbounded) BM25 score
+        bm25_scores = bm25_scorer.score(processed_query, processed_text_list)
+        for ranked_result, bm25_score in zip(ranked_results, bm25_scores):
+            ranked_result["bm25_score"] = float(bm25_score)
+        ranked_results.sort(key=lambda x: x["bm25_score"], reverse=True)
+    else:
+        # Sort the results based on the similarity
+        ranked_results.sort(key=lambda x: x["similarity"], reverse=True)
     
     # Return the top k results with all metadata
     top_k_results = ranked_results[:top_k]
@@ -0,0 +1,257 @@
+"""
+Recall/latency/memory benchmark of the dense vector index types supported by
+HybridRetriever.
+
+Builds each index over a sample of the seed corpus and searches it with
+held-out documents as queries. Recall@k is measured against the results of a
+FLAT index on the same data, QPS and latency percentiles from single-query
+searches (one per claim, as evidence retrieval does).
+
+Memory is reported as an estimate of the index size from its parameters and,
+for Milvus Lite, as the resident memory growth of the process running it after
+loading the collection. Milvus Lite supports only some index types; the others
+are reported with their build error, and the index Milvus actually built as
+`built_index_type`. Run against the standalone node (--uri) for numbers that
+carry over to production.
+
+Texts already embedded by a seed are read from the embedding store
+(EMBEDDING_STORE_DIR) instead of being embedded again.
+
+Usage:
+    python benchmark_index.py --sample 20000 --queries 200 --k 10
+    python benchmark_index.py --uri http://milvus_standalone:19530 --index-types FLAT HNSW IVF_SQ8
+    python benchmark_index.py --random-dim 1024 --sample 5000   # no model, random vectors
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from pymilvus import MilvusClient, DataType
+
+from hybrid_retrieval import INDEX_PRESETS
+from embedding_store import default_embedding_store
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+S_TRANSFORMERS_MDL_DIR = os.getenv("S_TRANSFORMERS_MDL_DIR")
+
+
+def embed_corpus_texts(texts, dense_ef):
+    """
+    BGE-M3 vectors of the texts, reusing and filling the seed's embedding
+    store when it is enabled.
+    """
+    store = default_embedding_store("BAAI/bge-m3")
+    if store is not None:
+        vectors = store.embed(texts, lambda batch: dense_ef(batch)["dense"])
+        store.close()
+        return vectors
+
+    vectors = []
+    for i in range(0, len(texts), 256):
+        vectors.extend(dense_ef(texts[i:i + 256])["dense"])
+        logger.info(f"Embedded {min(i + 256, len(texts))}/{len(texts)} texts")
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def load_vectors(args):
+    """
+    Return (corpus vectors, query vectors), embedding a sample of the seed
+    corpus with BGE-M3 or reading them from --embeddings.
+    """
+    if args.random_dim:
+        rng = np.random.default_rng(args.seed)
+        vectors = rng.standard_normal((args.sample + args.queries, args.random_dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors[:args.sample], vectors[args.sample:]
+
+    if args.embeddings and os.path.exists(args.embeddings):
+        data = np.load(args.embeddings)
+        return data["corpus"], data["queries"]
+
+    from pymilvus.model.hybrid import BGEM3EmbeddingFunction
+    from seed_data_processing import merge_all_data
+
+    df = merge_all_data().sample(n=args.sample + args.queries, random_state=args.seed)
+    texts = [text[:60000] for text in df.text.values]
+
+    dense_ef = BGEM3EmbeddingFunction(
+        model_name="BAAI/bge-m3",
+        device="cpu",
+        normalize_embeddings=True,
+        cache_dir=S_TRANSFORMERS_MDL_DIR,
+    )
+
+    vectors = embed_corpus_texts(texts, dense_ef)
+
+    corpus, queries = vectors[:args.sample], vectors[args.sample:]
+    if args.embeddings:
+        np.savez(args.embeddings, corpus=corpus, queries=queries)
+    return corpus, queries
+
+
+def estimate_index_bytes(index_type, params, n, dim):
+    """
+    Approximate in-memory size of the dense vector index.
+    """
+    if index_type in ("FLAT", "IVF_FLAT"):
+        return n * dim * 4
+    if index_type == "IVF_SQ8":
+        return n * dim + 2 * dim * 4
+    if index_type == "IVF_PQ":
+        return n * params.get("m", 64) * params.get("nbits", 8) // 8 + 2 ** params.get("nbits", 8) * dim * 4
+    if index_type == "HNSW":
+        return n * (dim * 4 + params.get("M", 16) * 2 * 4)
+    if index_type == "DISKANN":
+        # Graph and full vectors stay on disk, PQ codes in memory
+        return n * dim // 8
+    return None
+
+
+def milvus_lite_rss(uri):
+    """
+    Resident memory in bytes of Milvus Lite: its server child processes, or
+    this process if it runs in-process. None for a remote Milvus.
+    """
+    if uri.startswith(("http://", "https://", "tcp://")):
+        return None
+
+    total = None
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            if ppid != os.getpid():
+                continue
+            with open(f"/proc/{pid}/statm") as f:
+                total = (total or 0) + int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            continue
+
+    if total is None:
+        with open("/proc/self/statm") as f:
+            total = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    return total
+
+
+def build_collection(client, name, index_type, index_params, vectors):
+    if client.has_collection(name):
+        client.drop_collection(name)
+
+    schema = MilvusClient.create_schema()
+    schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True)
+    schema.add_field(field_name="dense_vector", datatype=DataType.FLOAT_VECTOR, dim=vectors.shape[1])
+    client.create_collection(collection_name=name, schema=schema)
+
+    start = time.perf_counter()
+    for i in range(0, len(vectors), 1000):
+        client.insert(name, [{"id": i + j, "dense_vector": v} for j, v in enumerate(vectors[i:i + 1000])])
+    client.flush(name)
+
+    params = MilvusClient.prepare_index_params()
+    params.add_index(field_name="dense_vector", index_type=index_type, metric_type="COSINE", params=index_params)
+    client.create_index(name, params)
+    client.load_collection(name)
+    build_s = time.perf_counter() - start
+
+    built = client.describe_index(name, "dense_vector") or {}
+    return build_s, built.get("index_type", index_type)
+
+
+def run_queries(client, name, queries, k, search_params):
+    ids, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = client.search(
+            collection_name=name,
+            data=[query],
+            anns_field="dense_vector",
+            search_params={"metric_type": "COSINE", "params": search_params},
+            limit=k,
+        )
+        latencies.append(time.perf_counter() - start)
+        ids.append([hit["id"] for hit in result[0]])
+    return ids, latencies
+
+
+def recall_at_k(ids, ground_truth, k):
+    return float(np.mean([len(set(found[:k]) & set(truth[:k])) / k for found, truth in zip(ids, ground_truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Milvus dense index benchmark")
+    parser.add_argument("--uri", default="./index_benchmark.db", help="Milvus URI; a file path uses Milvus Lite")
+    parser.add_argument("--index-types", nargs="+", default=list(INDEX_PRESETS), choices=list(INDEX_PRESETS))
+    parser.add_argument("--index-params", type=json.loads, default={}, help="JSON object per index type overriding the presets")
+    parser.add_argument("--search-params", type=json.loads, default={}, help="JSON object per index type overriding the presets")
+    parser.add_argument("--sample", type=int, default=20000, help="Corpus documents to index")
+    parser.add_argument("--queries", type=int, default=200, help="Held-out documents used as queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embeddings", type=str, help="npz file caching the sampled embeddings")
+    parser.add_argument("--random-dim", type=int, help="Use random unit vectors of this dimension instead of the corpus")
+    parser.add_argument("--output", type=str, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    corpus, queries = load_vectors(args)
+    n, dim = corpus.shape
+    logger.info(f"Corpus: {n} vectors of dimension {dim}, {len(queries)} queries")
+
+    client = MilvusClient(uri=args.uri)
+
+    # Exact ground truth
+    build_collection(client, "index_benchmark_ground_truth", "FLAT", {}, corpus)
+    ground_truth, _ = run_queries(client, "index_benchmark_ground_truth", queries, args.k, {})
+    client.drop_collection("index_benchmark_ground_truth")
+
+    results = []
+    for index_type in args.index_types:
+        index_params = {**INDEX_PRESETS[index_type]["params"], **args.index_params.get(index_type, {})}
+        search_params = {**INDEX_PRESETS[index_type]["search_params"], **args.search_params.get(index_type, {})}
+        name = f"index_benchmark_{index_type.lower()}"
+
+        rss_before = milvus_lite_rss(args.uri)
+        try:
+            build_s, built_index_type = build_collection(client, name, index_type, index_params, corpus)
+        except Exception as e:
+            logger.error(f"{index_type}: failed to build index: {e}")
+            results.append({"index_type": index_type, "error": str(e)})
+            continue
+        rss_after = milvus_lite_rss(args.uri)
+
+        ids, latencies = run_queries(client, name, queries, args.k, search_params)
+        client.drop_collection(name)
+
+        latencies.sort()
+        result = {
+            "index_type": index_type,
+            "built_index_type": built_index_type,
+            "index_params": index_params,
+            "search_params": search_params,
+            f"recall@{args.k}": recall_at_k(ids, ground_truth, args.k),
+            "qps": len(latencies) / sum(latencies),
+            "latency_ms_p50": 1000 * latencies[len(latencies) // 2],
+            "latency_ms_p95": 1000 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+            "build_s": build_s,
+            "estimated_index_mb": (estimate_index_bytes(index_type, index_params, n, dim) or 0) / 2**20,
+            "measured_rss_growth_mb": (rss_after - rss_before) / 2**20 if rss_before is not None and rss_after is not None else None,
+        }
+        logger.info(json.dumps(result))
+        results.append(result)
+
+    report = {"uri": args.uri, "vectors": n, "dim": dim, "queries": len(queries), "k": args.k, "results": results}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
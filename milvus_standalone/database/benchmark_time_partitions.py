@@ -0,0 +1,208 @@
+"""
+Latency benchmark of time-bucketed partitions (MILVUS_TIME_PARTITIONING).
+
+Builds the same documents twice: once in a single partition and once split
+into year or quarter partitions by created_at. Every query vector is searched
+with the created_at upper bound evidence retrieval uses, at a
+recent and at a historical claim date; the partitioned layout also restricts
+the search to the partitions returned by HybridRetriever.partitions_until.
+
+Reports latency percentiles per layout and claim date, the share of partitions
+searched, and whether both layouts return the same ids. Only the dense vector
+is searched, so the benchmark also runs on Milvus Lite; run it against the
+standalone node (--uri) for numbers that carry over to production.
+
+Usage:
+    python benchmark_time_partitions.py --random-dim 1024 --sample 20000
+    python benchmark_time_partitions.py --uri http://milvus_standalone:19530 --granularity quarter
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from pymilvus import MilvusClient, DataType, utility
+
+from hybrid_retrieval import HybridRetriever, INDEX_PRESETS, time_partition_name, time_partition_start
+from benchmark_index import embed_corpus_texts
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+S_TRANSFORMERS_MDL_DIR = os.getenv("S_TRANSFORMERS_MDL_DIR")
+
+
+def load_documents(args):
+    """
+    Return (corpus vectors, created_at datetimes, query vectors) from a sample
+    of the seed corpus embedded with BGE-M3, or random vectors with dates
+    spread over --years years.
+    """
+    rng = np.random.default_rng(args.seed)
+
+    if args.random_dim:
+        vectors = rng.standard_normal((args.sample + args.queries, args.random_dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        now = datetime.now().timestamp()
+        offsets = rng.uniform(0, args.years * 365 * 86400, args.sample)
+        created_at = [datetime.fromtimestamp(now - offset) for offset in offsets]
+        return vectors[:args.sample], created_at, vectors[args.sample:]
+
+    from pymilvus.model.hybrid import BGEM3EmbeddingFunction
+    from seed_data_processing import merge_all_data
+
+    df = merge_all_data().sample(n=args.sample + args.queries, random_state=args.seed)
+    dense_ef = BGEM3EmbeddingFunction(
+        model_name="BAAI/bge-m3",
+        device="cpu",
+        normalize_embeddings=True,
+        cache_dir=S_TRANSFORMERS_MDL_DIR,
+    )
+
+    texts = [text[:60000] for text in df.text.values]
+    vectors = embed_corpus_texts(texts, dense_ef)
+
+    created_at = [timestamp.to_pydatetime().replace(tzinfo=None) for timestamp in df.created_at.iloc[:args.sample]]
+    return vectors[:args.sample], created_at, vectors[args.sample:]
+
+
+def build_collection(client, name, vectors, created_at, index_type, granularity=None):
+    if client.has_collection(name):
+        client.drop_collection(name)
+
+    schema = MilvusClient.create_schema()
+    schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True)
+    schema.add_field(field_name="created_at", datatype=DataType.INT64)
+    schema.add_field(field_name="dense_vector", datatype=DataType.FLOAT_VECTOR, dim=vectors.shape[1])
+
+    index_params = MilvusClient.prepare_index_params()
+    index_params.add_index(
+        field_name="dense_vector",
+        index_type=index_type,
+        metric_type="COSINE",
+        params=INDEX_PRESETS[index_type]["params"],
+    )
+    client.create_collection(collection_name=name, schema=schema, index_params=index_params)
+
+    partitions = {}
+    for i, (vector, date) in enumerate(zip(vectors, created_at)):
+        partition_name = time_partition_name(date, granularity) if granularity else "_default"
+        partitions.setdefault(partition_name, []).append(
+            {"id": i, "created_at": utility.mkts_from_datetime(date), "dense_vector": vector}
+        )
+
+    for partition_name, rows in partitions.items():
+        if not client.has_partition(name, partition_name):
+            client.create_partition(name, partition_name)
+        for i in range(0, len(rows), 1000):
+            client.insert(name, rows[i:i + 1000], partition_name=partition_name)
+
+    client.flush(name)
+    client.load_collection(name)
+    return sorted(partitions)
+
+
+def run_queries(client, name, queries, k, index_type, created_at, partition_names=None):
+    ids, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = client.search(
+            collection_name=name,
+            data=[query],
+            anns_field="dense_vector",
+            search_params={"metric_type": "COSINE", "params": INDEX_PRESETS[index_type]["search_params"]},
+            limit=k,
+            # Literal filter: Milvus Lite does not support filter templates
+            filter=f"created_at <= {created_at}",
+            partition_names=partition_names,
+        )
+        latencies.append(time.perf_counter() - start)
+        ids.append([hit["id"] for hit in result[0]])
+    return ids, latencies
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        "latency_ms_p50": 1000 * latencies[len(latencies) // 2],
+        "latency_ms_p95": 1000 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        "qps": len(latencies) / sum(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Milvus time partition benchmark")
+    parser.add_argument("--uri", default="./time_partition_benchmark.db", help="Milvus URI; a file path uses Milvus Lite")
+    parser.add_argument("--granularity", default="year", choices=["year", "quarter"])
+    parser.add_argument("--index-type", default="FLAT", choices=list(INDEX_PRESETS))
+    parser.add_argument("--sample", type=int, default=20000, help="Corpus documents to index")
+    parser.add_argument("--queries", type=int, default=200, help="Held-out documents used as queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--random-dim", type=int, help="Use random unit vectors of this dimension instead of the corpus")
+    parser.add_argument("--years", type=float, default=8, help="Span of the random created_at dates")
+    parser.add_argument("--historical", type=str, help="Historical claim date (YYYY-MM-DD); default: the corpus median")
+    parser.add_argument("--output", type=str, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    corpus, created_at, queries = load_documents(args)
+    logger.info(f"Corpus: {len(corpus)} vectors from {min(created_at)} to {max(created_at)}, {len(queries)} queries")
+
+    historical = datetime.strptime(args.historical, "%Y-%m-%d") if args.historical else sorted(created_at)[len(created_at) // 2]
+    claim_dates = {"recent": datetime.now(), "historical": historical}
+
+    client = MilvusClient(uri=args.uri)
+    build_collection(client, "time_partition_benchmark_flat", corpus, created_at, args.index_type)
+    partition_list = build_collection(client, "time_partition_benchmark_partitioned", corpus, created_at, args.index_type, args.granularity)
+    time_partitions = {name: time_partition_start(name) for name in partition_list}
+
+    results = []
+    for label, claim_date in claim_dates.items():
+        created_at_ts = utility.mkts_from_datetime(claim_date)
+        partition_names = HybridRetriever.partitions_until(time_partitions, created_at_ts)
+
+        flat_ids, flat_latencies = run_queries(
+            client, "time_partition_benchmark_flat", queries, args.k, args.index_type, created_at_ts
+        )
+        partitioned_ids, partitioned_latencies = run_queries(
+            client, "time_partition_benchmark_partitioned", queries, args.k, args.index_type, created_at_ts, partition_names
+        )
+
+        result = {
+            "claim_date": claim_date.strftime("%Y-%m-%d"),
+            "matching_documents": sum(date <= claim_date for date in created_at),
+            "partitions_searched": f"{len(partition_names)}/{len(time_partitions)}",
+            "flat": summarize(flat_latencies),
+            "partitioned": summarize(partitioned_latencies),
+            "identical_results": sum(a == b for a, b in zip(flat_ids, partitioned_ids)) / len(queries),
+        }
+        logger.info(f"{label}: {json.dumps(result)}")
+        results.append({"claim": label, **result})
+
+    client.drop_collection("time_partition_benchmark_flat")
+    client.drop_collection("time_partition_benchmark_partitioned")
+
+    report = {
+        "uri": args.uri,
+        "granularity": args.granularity,
+        "index_type": args.index_type,
+        "vectors": len(corpus),
+        "partitions": partition_list,
+        "queries": len(queries),
+        "k": args.k,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Memory/recall comparison of the dense vector storage types supported by
+HybridRetriever (MILVUS_VECTOR_TYPE, MILVUS_BINARY_RERANK).
+
+Every configuration is compared with exact fp32 search over the same sample:
+recall@k of FLOAT16/BFLOAT16 storage, and of a binary first stage (Hamming
+distance of the sign-quantized vectors, MILVUS_BINARY_OVERSAMPLE * k
+candidates) reranked with the stored dense vectors. Memory is the size of the
+vectors that have to stay in memory; with binary reranking the dense vectors
+get a memory-mapped FLAT index (RERANK_DENSE_INDEX) and are only read for the
+candidates. Every result reports the dense index it was built with.
+
+--offline computes the searches with numpy using the same quantization and
+rerank code as HybridRetriever, so it also runs where Milvus is not available
+(Milvus Lite does not support FLOAT16, BFLOAT16 or BINARY vectors). Without it
+the collections are built on --uri with FLAT indexes and latency is reported
+as well.
+
+Usage:
+    python benchmark_vector_types.py --offline --random-dim 1024 --sample 20000
+    python benchmark_vector_types.py --uri http://milvus_standalone:19530 --embeddings vectors.npz
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from pymilvus import MilvusClient, DataType
+
+from benchmark_index import load_vectors, recall_at_k
+from hybrid_retrieval import (
+    HybridRetriever,
+    VECTOR_TYPES,
+    BINARY_INDEX,
+    RERANK_DENSE_INDEX,
+    to_vector_type,
+    binary_quantize,
+    rerank,
+)
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# name: (vector type, binary first stage)
+CONFIGS = {
+    "fp32": ("FLOAT_VECTOR", False),
+    "fp16": ("FLOAT16_VECTOR", False),
+    "bf16": ("BFLOAT16_VECTOR", False),
+    "binary+fp32": ("FLOAT_VECTOR", True),
+    "binary+fp16": ("FLOAT16_VECTOR", True),
+    "binary+bf16": ("BFLOAT16_VECTOR", True),
+}
+
+BYTES_PER_DIMENSION = {"FLOAT_VECTOR": 4, "FLOAT16_VECTOR": 2, "BFLOAT16_VECTOR": 2}
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def memory_report(vector_type, binary, n, dim):
+    dense_mb = n * dim * BYTES_PER_DIMENSION[vector_type] / 2**20
+    if binary:
+        return {"memory_mb": n * dim / 8 / 2**20, "mmap_mb": dense_mb}
+    return {"memory_mb": dense_mb, "mmap_mb": 0.0}
+
+
+def dense_index(binary):
+    """
+    Index of the dense vectors: as HybridRetriever builds it with binary
+    reranking, and an in-memory FLAT index for the exact baselines.
+    """
+    return RERANK_DENSE_INDEX if binary else {"index_type": "FLAT", "params": {}}
+
+
+def stored(vectors, vector_type):
+    """
+    float32 values of the vectors after a round trip through the storage type.
+    """
+    return np.asarray(to_vector_type(vectors, vector_type), dtype=np.float32)
+
+
+def exact_top_k(corpus, queries, k):
+    corpus = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    scores = queries @ corpus.T
+    return [list(np.argsort(-row, kind="stable")[:k]) for row in scores]
+
+
+def offline_search(corpus, queries, vector_type, binary, k, oversample):
+    stored_corpus = stored(corpus, vector_type)
+    stored_queries = stored(queries, vector_type)
+    if not binary:
+        return exact_top_k(stored_corpus, stored_queries, k)
+
+    corpus_bits = np.frombuffer(b"".join(binary_quantize(v) for v in corpus), dtype=np.uint8).reshape(len(corpus), -1)
+    ids = []
+    for query in queries:
+        query_bits = np.frombuffer(binary_quantize(query), dtype=np.uint8)
+        hamming = _POPCOUNT[np.bitwise_xor(corpus_bits, query_bits)].sum(axis=1)
+        candidates = np.argsort(hamming, kind="stable")[:k * oversample]
+        reranked = rerank(query, [({"id": int(i)}, stored_corpus[i]) for i in candidates], k)
+        ids.append([hit["id"] for hit in reranked])
+    return ids
+
+
+def build_collection(client, name, vectors, vector_type, binary):
+    if client.has_collection(name):
+        client.drop_collection(name)
+
+    schema = MilvusClient.create_schema()
+    schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True)
+    schema.add_field(field_name="dense_vector", datatype=VECTOR_TYPES[vector_type], dim=vectors.shape[1])
+    index_params = MilvusClient.prepare_index_params()
+    index_params.add_index(field_name="dense_vector", metric_type="COSINE", **dense_index(binary))
+    if binary:
+        schema.add_field(field_name="binary_vector", datatype=DataType.BINARY_VECTOR, dim=vectors.shape[1])
+        index_params.add_index(
+            field_name="binary_vector",
+            index_type=BINARY_INDEX["index_type"],
+            metric_type="HAMMING",
+            params=BINARY_INDEX["params"],
+        )
+    client.create_collection(collection_name=name, schema=schema, index_params=index_params)
+
+    for i in range(0, len(vectors), 1000):
+        rows = []
+        for j, vector in enumerate(vectors[i:i + 1000]):
+            row = {"id": i + j, "dense_vector": to_vector_type(vector, vector_type)}
+            if binary:
+                row["binary_vector"] = binary_quantize(vector)
+            rows.append(row)
+        client.insert(name, rows)
+    client.flush(name)
+    client.load_collection(name)
+
+
+def milvus_search(uri, name, corpus, queries, vector_type, binary, k, oversample):
+    retriever = HybridRetriever(
+        uri=uri,
+        collection_name=name,
+        index_type="FLAT",
+        radius=None,
+        range_filter=None,
+        vector_type=vector_type,
+        binary_rerank=binary,
+        binary_oversample=oversample,
+    )
+    build_collection(retriever.client, name, corpus, vector_type, binary)
+
+    ids, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        if binary:
+            hits = retriever.binary_rerank_search(query, k, output_fields=[])
+        else:
+            hits = retriever.client.search(
+                collection_name=name,
+                data=[to_vector_type(query, vector_type)],
+                anns_field="dense_vector",
+                search_params={"metric_type": "COSINE", "params": {}},
+                limit=k,
+            )[0]
+        latencies.append(time.perf_counter() - start)
+        ids.append([hit["id"] for hit in hits])
+
+    retriever.drop_collection()
+    latencies.sort()
+    return ids, {
+        "latency_ms_p50": 1000 * latencies[len(latencies) // 2],
+        "latency_ms_p95": 1000 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dense vector storage type benchmark")
+    parser.add_argument("--uri", default="http://milvus_standalone:19530", help="Milvus URI")
+    parser.add_argument("--offline", action="store_true", help="Search with numpy instead of Milvus")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--oversample", type=int, default=10, help="Binary candidates per result")
+    parser.add_argument("--sample", type=int, default=20000, help="Corpus documents to index")
+    parser.add_argument("--queries", type=int, default=200, help="Held-out documents used as queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embeddings", type=str, help="npz file caching the sampled embeddings")
+    parser.add_argument("--random-dim", type=int, help="Use random unit vectors of this dimension instead of the corpus")
+    parser.add_argument("--output", type=str, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    corpus, queries = load_vectors(args)
+    n, dim = corpus.shape
+    logger.info(f"Corpus: {n} vectors of dimension {dim}, {len(queries)} queries")
+
+    ground_truth = exact_top_k(corpus, queries, args.k)
+
+    results = []
+    for config in args.configs:
+        vector_type, binary = CONFIGS[config]
+        result = {"config": config, "vector_type": vector_type, "binary_rerank": binary, "dense_index": dense_index(binary)}
+        try:
+            if args.offline:
+                ids = offline_search(corpus, queries, vector_type, binary, args.k, args.oversample)
+            else:
+                ids, latency = milvus_search(
+                    args.uri, f"vector_type_benchmark_{config.replace('+', '_')}", corpus, queries, vector_type, binary, args.k, args.oversample
+                )
+                result.update(latency)
+        except Exception as e:
+            logger.error(f"{config}: {e}")
+            results.append({**result, "error": str(e)})
+            continue
+
+        result[f"recall@{args.k}"] = recall_at_k(ids, ground_truth, args.k)
+        result.update(memory_report(vector_type, binary, n, dim))
+        logger.info(json.dumps(result))
+        results.append(result)
+
+    report = {
+        "uri": "offline" if args.offline else args.uri,
+        "vectors": n,
+        "dim": dim,
+        "queries": len(queries),
+        "k": args.k,
+        "oversample": args.oversample,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
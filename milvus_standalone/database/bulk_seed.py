@@ -0,0 +1,185 @@
+"""
+Bulk import of the seed corpus (hybrid_seed.py --bulk).
+
+Embedded batches are written to Parquet (or NumPy) files in Milvus's bulk
+insert layout and uploaded to the MinIO bucket Milvus reads from, instead of
+being inserted row by row through the proxy. Once the corpus is written, an
+import job is created per partition and IMPORT_FILES_PER_JOB files; the jobs
+are polled until they finish and the collection's row count is checked
+against the rows written.
+
+Bulk import only appends rows, so it is meant for loading a new collection.
+Incremental seeds keep using the row inserts of HybridRetriever.
+"""
+import contextlib
+import time
+from typing import Dict, List
+
+from minio import Minio
+from minio.deleteobjects import DeleteObject
+from pymilvus import CollectionSchema, utility
+from pymilvus.bulk_writer import RemoteBulkWriter, BulkFileType, bulk_import, get_import_progress
+
+from hybrid_retrieval import document_pk, time_partition_name
+
+import dotenv
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+# Object storage of the Milvus node, which reads the imported files from it
+MINIO_ADDRESS = os.getenv("MINIO_ADDRESS", "minio:9000")
+MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
+MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minioadmin")
+MINIO_BUCKET_NAME = os.getenv("MINIO_BUCKET_NAME", "a-bucket")
+
+# PARQUET or NUMPY
+SEED_BULK_FILE_TYPE = os.getenv("SEED_BULK_FILE_TYPE", "PARQUET")
+SEED_BULK_REMOTE_PATH = os.getenv("SEED_BULK_REMOTE_PATH", "bulk_seed")
+SEED_BULK_CHUNK_MB = int(os.getenv("SEED_BULK_CHUNK_MB", "512"))
+SEED_BULK_POLL_S = float(os.getenv("SEED_BULK_POLL_S", "5"))
+SEED_BULK_TIMEOUT_S = float(os.getenv("SEED_BULK_TIMEOUT_S", "7200"))
+
+# Milvus accepts at most 1024 files (or sets of NumPy files) per import request
+IMPORT_FILES_PER_JOB = 1024
+
+
+class BulkImportError(Exception):
+    pass
+
+
+class BulkImportWriter:
+    """
+    Stands in for HybridRetriever in run_seed_pipeline: insert_batch writes
+    the rows to bulk insert files, import_files loads them into the
+    retriever's collection.
+    """
+
+    def __init__(self, retriever, file_type: str = SEED_BULK_FILE_TYPE, remote_path: str = SEED_BULK_REMOTE_PATH):
+        self.retriever = retriever
+        self.schema = CollectionSchema.construct_from_dict(
+            retriever.client.describe_collection(retriever.collection_name)
+        )
+        self.file_type = BulkFileType[file_type.upper()]
+        self.remote_path = remote_path
+        self.connect_param = RemoteBulkWriter.S3ConnectParam(
+            bucket_name=MINIO_BUCKET_NAME,
+            endpoint=MINIO_ADDRESS,
+            access_key=MINIO_ACCESS_KEY,
+            secret_key=MINIO_SECRET_KEY,
+            secure=False,
+        )
+        # One writer per partition: an import job loads a single partition
+        self.writers: Dict[str, RemoteBulkWriter] = {}
+        self.rows: Dict[str, int] = {}
+        self._exit_stack = contextlib.ExitStack()
+
+    def vector_fields(self, vector):
+        return self.retriever.vector_fields(vector)
+
+    def _writer(self, partition_name: str) -> RemoteBulkWriter:
+        if partition_name not in self.writers:
+            self.writers[partition_name] = self._exit_stack.enter_context(
+                RemoteBulkWriter(
+                    schema=self.schema,
+                    remote_path=os.path.join(self.remote_path, self.retriever.collection_name),
+                    connect_param=self.connect_param,
+                    chunk_size=SEED_BULK_CHUNK_MB * 2**20,
+                    file_type=self.file_type,
+                )
+            )
+            self.rows[partition_name] = 0
+        return self.writers[partition_name]
+
+    def insert_batch(self, batch_data, upsert=False):
+        if upsert:
+            raise BulkImportError("Bulk import only appends rows: seed incrementally without --bulk")
+        for data in batch_data:
+            data.setdefault("pk", document_pk(data))
+            partition_name = ""
+            if self.retriever.time_partitioning:
+                created_at = utility.hybridts_to_datetime(data["created_at"])
+                partition_name = time_partition_name(created_at, self.retriever.time_partitioning)
+            self._writer(partition_name).append_row(data)
+            self.rows[partition_name] += 1
+
+    def _create_jobs(self) -> List[str]:
+        client = self.retriever.client
+        collection_name = self.retriever.collection_name
+        job_ids = []
+        for partition_name, writer in self.writers.items():
+            writer.commit()
+            if partition_name and not client.has_partition(collection_name, partition_name):
+                client.create_partition(collection_name, partition_name)
+
+            files = writer.batch_files
+            for i in range(0, len(files), IMPORT_FILES_PER_JOB):
+                response = bulk_import(
+                    url=self.retriever.uri,
+                    collection_name=collection_name,
+                    files=files[i:i + IMPORT_FILES_PER_JOB],
+                    partition_name=partition_name,
+                )
+                job_id = response.json()["data"]["jobId"]
+                logger.info(f"Import job {job_id}: {len(files[i:i + IMPORT_FILES_PER_JOB])} files into partition '{partition_name or '_default'}'")
+                job_ids.append(job_id)
+        return job_ids
+
+    def _wait(self, job_ids: List[str], poll_s: float, timeout_s: float) -> int:
+        deadline = time.monotonic() + timeout_s
+        pending = set(job_ids)
+        imported_rows = {}
+        while pending:
+            for job_id in sorted(pending):
+                job = get_import_progress(url=self.retriever.uri, job_id=job_id).json()["data"]
+                imported_rows[job_id] = int(job.get("importedRows", 0))
+                if job["state"] == "Failed":
+                    raise BulkImportError(f"Import job {job_id} failed: {job.get('reason')}")
+                if job["state"] == "Completed":
+                    pending.discard(job_id)
+            logger.info(
+                f"Bulk import: {len(job_ids) - len(pending)}/{len(job_ids)} jobs completed, "
+                f"{sum(imported_rows.values())}/{sum(self.rows.values())} rows imported"
+            )
+            if pending and time.monotonic() > deadline:
+                raise BulkImportError(f"Import jobs {sorted(pending)} did not finish in {timeout_s}s")
+            if pending:
+                time.sleep(poll_s)
+        return sum(imported_rows.values())
+
+    def _remove_files(self) -> None:
+        client = Minio(MINIO_ADDRESS, access_key=MINIO_ACCESS_KEY, secret_key=MINIO_SECRET_KEY, secure=False)
+        objects = [DeleteObject(path) for writer in self.writers.values() for files in writer.batch_files for path in files]
+        for error in client.remove_objects(MINIO_BUCKET_NAME, objects):
+            logger.warning(f"Could not remove {error.object_name} from {MINIO_BUCKET_NAME}: {error}")
+
+    def import_files(self, poll_s: float = SEED_BULK_POLL_S, timeout_s: float = SEED_BULK_TIMEOUT_S) -> int:
+        """
+        Import everything written so far and wait for the jobs. Raises
+        BulkImportError if a job fails or the collection does not have the
+        written rows afterwards. Returns the number of imported rows.
+        """
+        client = self.retriever.client
+        collection_name = self.retriever.collection_name
+        rows_before = int(client.get_collection_stats(collection_name)["row_count"])
+        written = sum(self.rows.values())
+
+        imported = self._wait(self._create_jobs(), poll_s, timeout_s)
+        row_count = int(client.get_collection_stats(collection_name)["row_count"])
+        if imported != written or row_count != rows_before + written:
+            raise BulkImportError(
+                f"Wrote {written} rows, import jobs imported {imported}, "
+                f"collection has {row_count} rows (expected {rows_before + written})"
+            )
+
+        self._remove_files()
+        logger.info(f"Bulk imported {imported} rows into {collection_name}")
+        return imported
+
+    def close(self) -> None:
+        # Waits for uploads in progress and removes the local staging directories
+        self._exit_stack.close()
@@ -0,0 +1,106 @@
+"""
+Check the source_type partition key against the url filters it replaces.
+
+Offline, every seed document is classified with the old rule (url starts with
+https://www.facebook.com/) and compared with its source_type. Documents where
+they differ are counted per source with examples: e.g. Facebook posts
+collected without a url, which the old filter counted as news archive.
+
+Online (--queries), each query is searched in milvus_hybrid with both filters
+and the returned ids are compared per source type.
+
+Usage:
+    python check_source_type.py
+    python check_source_type.py --queries "Russia attacked Ukraine in 2022" "Sanna Marin"
+"""
+import argparse
+import json
+import os
+
+from seed_data_processing import merge_all_data, SOURCE_TYPE_FACEBOOK_POST, SOURCE_TYPE_NEWS_ARCHIVE
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+S_TRANSFORMERS_MDL_DIR = os.getenv("S_TRANSFORMERS_MDL_DIR")
+
+FACEBOOK_URL_PREFIX = "https://www.facebook.com/"
+
+URL_FILTERS = {
+    SOURCE_TYPE_FACEBOOK_POST: f"url LIKE '{FACEBOOK_URL_PREFIX}%'",
+    SOURCE_TYPE_NEWS_ARCHIVE: f"NOT url LIKE '{FACEBOOK_URL_PREFIX}%'",
+}
+
+PARTITION_KEY_FILTERS = {
+    SOURCE_TYPE_FACEBOOK_POST: f"source_type == '{SOURCE_TYPE_FACEBOOK_POST}'",
+    SOURCE_TYPE_NEWS_ARCHIVE: f"source_type == '{SOURCE_TYPE_NEWS_ARCHIVE}'",
+}
+
+
+def url_source_type(url) -> str:
+    return SOURCE_TYPE_FACEBOOK_POST if isinstance(url, str) and url.startswith(FACEBOOK_URL_PREFIX) else SOURCE_TYPE_NEWS_ARCHIVE
+
+
+def check_seed_data(df) -> dict:
+    old = df.url.apply(url_source_type)
+    mismatches = df[old != df.source_type]
+
+    return {
+        "documents": len(df),
+        "source_type_counts": df.source_type.value_counts().to_dict(),
+        "url_filter_counts": old.value_counts().to_dict(),
+        "mismatches": len(mismatches),
+        "mismatches_by_source": mismatches.groupby(["source", "source_type"]).size().rename("count").reset_index().to_dict("records"),
+        "mismatch_examples": mismatches[["id", "source", "url", "source_type"]].head(5).to_dict("records"),
+    }
+
+
+def check_queries(queries, k) -> list:
+    from pymilvus.model.hybrid import BGEM3EmbeddingFunction
+    from hybrid_retrieval import HybridRetriever
+
+    dense_ef = BGEM3EmbeddingFunction(
+        model_name="BAAI/bge-m3",
+        device="cpu",
+        normalize_embeddings=True,
+        cache_dir=S_TRANSFORMERS_MDL_DIR,
+    )
+    retriever = HybridRetriever(
+        uri=f"{os.environ.get('MILVUS_SERVICE','http://milvus_standalone')}:{os.environ.get('MILVUS_PORT',19530)}",
+        collection_name="milvus_hybrid",
+        dense_embedding_function=dense_ef,
+    )
+
+    reports = []
+    for query in queries:
+        for source_type in (SOURCE_TYPE_FACEBOOK_POST, SOURCE_TYPE_NEWS_ARCHIVE):
+            old_ids = [r["id"] for r in retriever.search(query, k=k, mode="hybrid", filter=URL_FILTERS[source_type])]
+            new_ids = [r["id"] for r in retriever.search(query, k=k, mode="hybrid", filter=PARTITION_KEY_FILTERS[source_type])]
+            reports.append({
+                "query": query,
+                "source_type": source_type,
+                "identical": old_ids == new_ids,
+                "overlap": len(set(old_ids) & set(new_ids)),
+                "only_url_filter": [i for i in old_ids if i not in new_ids],
+                "only_partition_key": [i for i in new_ids if i not in old_ids],
+            })
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare source_type with the url filters")
+    parser.add_argument("--queries", nargs="*", default=[], help="Also compare live search results for these queries")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    report = {"seed_data": check_seed_data(merge_all_data())}
+    if args.queries:
+        report["queries"] = check_queries(args.queries, args.k)
+
+    print(json.dumps(report, indent=2, default=str, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+On-disk store of dense embeddings, reused across seeds and benchmarks.
+
+Vectors are keyed by a hash of the embedded text and stored per model under
+EMBEDDING_STORE_DIR/<model>: a float32 matrix appended to a file that is read
+through a memory map, and a SQLite index from content key to matrix row.
+Rebuilding milvus_hybrid with another index or schema, or benchmarking index
+types on the corpus, then only embeds texts the model has not seen before.
+
+Entries of texts that are no longer seeded stay in the store until it is
+compacted against the collections that are still in use:
+
+    python embedding_store.py stats
+    python embedding_store.py compact --collections milvus_hybrid
+
+Do not compact while a seed is writing to the store.
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+import dotenv
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+# Empty disables the store
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "seed_state/embeddings")
+
+
+def content_key(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, directory: str, model_name: str):
+        self.model_name = model_name
+        self.path = os.path.join(directory, model_name.replace("/", "__"))
+        os.makedirs(self.path, exist_ok=True)
+
+        # Used from the seed pipeline's store thread
+        self.db = sqlite3.connect(os.path.join(self.path, "index.sqlite"), check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.db.commit()
+
+        meta = dict(self.db.execute("SELECT name, value FROM meta"))
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self.vectors_file = meta.get("vectors_file", "vectors-0.f32")
+        self._mmap = None
+        self.rows = 0
+        if self.dim:
+            self.rows = self._truncate_partial_row()
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.path, self.vectors_file)
+
+    def _truncate_partial_row(self) -> int:
+        # A crash while appending can leave a partial row at the end of the file
+        if not os.path.exists(self.vectors_path):
+            return 0
+        row_bytes = 4 * self.dim
+        size = os.path.getsize(self.vectors_path)
+        if size % row_bytes:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(size - size % row_bytes)
+        return size // row_bytes
+
+    def _vectors(self) -> np.ndarray:
+        if self._mmap is None or len(self._mmap) < self.rows:
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+        return self._mmap
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _rows_of(self, keys: List[str]) -> Dict[str, int]:
+        rows = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows.update(self.db.execute(
+                f"SELECT key, row FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        return rows
+
+    def lookup(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Stored vectors of the keys that are in the store.
+        """
+        rows = self._rows_of(list(set(keys)))
+        if not rows:
+            return {}
+        keys, row_numbers = zip(*rows.items())
+        vectors = np.array(self._vectors()[list(row_numbers)])
+        return dict(zip(keys, vectors))
+
+    def put_many(self, keys: List[str], vectors) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.db.execute("INSERT INTO meta VALUES ('dim', ?), ('vectors_file', ?)", (str(self.dim), self.vectors_file))
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"{self.model_name} vectors in {self.path} have dimension {self.dim}, not {vectors.shape[1]}")
+
+        existing = self._rows_of(list(keys))
+        new = {}
+        for key, vector in zip(keys, vectors):
+            if key not in existing and key not in new:
+                new[key] = vector
+        if not new:
+            return
+
+        # Vectors reach the disk before the index refers to them
+        with open(self.vectors_path, "ab") as f:
+            f.write(np.stack(list(new.values())).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self.db.executemany(
+            "INSERT INTO embeddings VALUES (?, ?)",
+            [(key, self.rows + i) for i, key in enumerate(new)],
+        )
+        self.db.commit()
+        self.rows += len(new)
+
+    def embed(self, texts: List[str], embed_function: Callable[[List[str]], np.ndarray], batch_size: int = 256) -> np.ndarray:
+        """
+        Vectors of the texts, embedding only the texts that are not stored.
+        """
+        keys = [content_key(text) for text in texts]
+        vectors = self.lookup(keys)
+        first = {}
+        for i, key in enumerate(keys):
+            if key not in vectors:
+                first.setdefault(key, i)
+        missing = list(first.values())
+        logger.info(f"{len(keys) - len(missing)}/{len(keys)} embeddings found in {self.path}")
+
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            embedded = np.asarray(embed_function([texts[i] for i in batch]), dtype=np.float32)
+            self.put_many([keys[i] for i in batch], embedded)
+            vectors.update(zip((keys[i] for i in batch), embedded))
+            logger.info(f"Embedded {start + len(batch)}/{len(missing)} texts")
+
+        return np.stack([vectors[key] for key in keys])
+
+    def compact(self, live_keys: set) -> dict:
+        """
+        Drop the entries whose key is not in live_keys and rewrite the vectors
+        that are kept into a new file.
+        """
+        entries = self.db.execute("SELECT key, row FROM embeddings ORDER BY row").fetchall()
+        kept = [(key, row) for key, row in entries if key in live_keys]
+        stats = {"entries": len(entries), "kept": len(kept), "rows_before": self.rows}
+        if not self.rows:
+            return stats
+
+        generation = int(self.vectors_file.split("-")[1].split(".")[0]) + 1
+        vectors_file = f"vectors-{generation}.f32"
+        source = self._vectors()
+        with open(os.path.join(self.path, vectors_file), "wb") as f:
+            for i in range(0, len(kept), 10000):
+                f.write(np.ascontiguousarray(source[[row for _, row in kept[i:i + 10000]]]).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        # The index switches to the new file in one transaction
+        with self.db:
+            self.db.execute("DELETE FROM embeddings")
+            self.db.executemany("INSERT INTO embeddings VALUES (?, ?)", [(key, i) for i, (key, _) in enumerate(kept)])
+            self.db.execute("UPDATE meta SET value = ? WHERE name = 'vectors_file'", (vectors_file,))
+
+        old_path = self.vectors_path
+        self._mmap = None
+        self.vectors_file = vectors_file
+        self.rows = len(kept)
+        os.remove(old_path)
+        self.db.execute("VACUUM")
+        return stats
+
+    def stats(self) -> dict:
+        entries = len(self)
+        return {
+            "model": self.model_name,
+            "path": self.path,
+            "dim": self.dim,
+            "entries": entries,
+            "stale_rows": self.rows - entries,
+            "size_mb": round(os.path.getsize(self.vectors_path) / 2**20, 1) if self.rows else 0.0,
+        }
+
+    def close(self) -> None:
+        self._mmap = None
+        self.db.close()
+
+
+def default_embedding_store(model_name: str = "BAAI/bge-m3") -> Optional[EmbeddingStore]:
+    if not EMBEDDING_STORE_DIR:
+        return None
+    return EmbeddingStore(EMBEDDING_STORE_DIR, model_name)
+
+
+def collection_keys(client, collection_name: str) -> set:
+    """
+    Content keys of the texts stored in a collection.
+    """
+    keys = set()
+    iterator = client.query_iterator(collection_name, batch_size=1000, filter="", output_fields=["text"])
+    while True:
+        rows = iterator.next()
+        if not rows:
+            iterator.close()
+            return keys
+        keys.update(content_key(row["text"]) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding store maintenance")
+    parser.add_argument("command", choices=["stats", "compact"])
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    parser.add_argument("--dir", default=EMBEDDING_STORE_DIR, help="Store directory")
+    parser.add_argument(
+        "--uri",
+        default=f"{os.environ.get('MILVUS_SERVICE','http://milvus_standalone')}:{os.environ.get('MILVUS_PORT',19530)}",
+        help="Milvus URI",
+    )
+    parser.add_argument(
+        "--collections", nargs="+", default=["milvus_hybrid"], help="Collections whose texts are kept when compacting"
+    )
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.dir, args.model)
+    if args.command == "compact":
+        from pymilvus import MilvusClient
+
+        client = MilvusClient(uri=args.uri)
+        live_keys = set()
+        for collection_name in args.collections:
+            live_keys |= collection_keys(client, collection_name)
+            logger.info(f"{collection_name}: {len(live_keys)} texts to keep")
+        logger.info(f"Compacted: {store.compact(live_keys)}")
+
+    print(json.dumps(store.stats(), indent=2))
+    store.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -4,10 +4,34 @@ from pymilvus.model.hybrid import BGEM3EmbeddingFunction
 
 from hybrid_retrieval import HybridRetriever
 
-from seed_data_processing import merge_all_data
+from seed_data_processing import iter_all_data, seed_data_paths
+
+from seed_pipeline import (
+    iter_rows,
+    shuffled,
+    batched,
+    run_seed_pipeline,
+    skip_existing,
+    seed_fingerprint,
+    SeedProgress,
+    SeedCheckpoint,
+    BGE_M3_DENSE_DIM,
+    SEED_BATCH_SIZE,
+    SEED_SHUFFLE_BUFFER,
+)
+
+from passage_chunking import PassageSplitter
+
+from embedding_store import default_embedding_store
+
+from near_duplicates import NearDuplicateFilter, SEED_NEAR_DUPLICATE_THRESHOLD, SEED_NEAR_DUPLICATE_PERMUTATIONS
 
 import time
 
+import asyncio
+
+import itertools
+
 from datetime import datetime
 
 import argparse
@@ -22,20 +46,26 @@ logger.info(f"Logger: {logger}")
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--test", type=str)
+parser.add_argument(
+    "--incremental",
+    action="store_true",
+    help="Keep the collection: skip unchanged documents, upsert new and changed ones and resume from the checkpoint",
+)
+parser.add_argument(
+    "--bulk",
+    action="store_true",
+    help="Load a new collection with Milvus bulk import jobs instead of row inserts",
+)
 args = parser.parse_args()
 
+if args.bulk and args.incremental:
+    parser.error("--bulk loads a new collection and cannot be combined with --incremental")
+
 S_TRANSFORMERS_MDL_DIR = os.getenv("S_TRANSFORMERS_MDL_DIR")
 
 
 def main():
 
-    dense_ef = BGEM3EmbeddingFunction(
-        model_name="BAAI/bge-m3",
-        device="cpu",
-        normalize_embeddings=True,
-        cache_dir=S_TRANSFORMERS_MDL_DIR,
-    )
-
     # MODEL = 'msmarco-MiniLM-L6-cos-v5' # normalize_embedding
 
     # sentence_transformer_ef = model.dense.SentenceTransformerEmbeddingFunction(
@@ -54,88 +84,142 @@ def main():
     standard_retriever = HybridRetriever(
         uri=f"{os.environ.get('MILVUS_SERVICE','http://milvus_standalone')}:{os.environ.get('MILVUS_PORT',19530)}",
         collection_name="milvus_hybrid",
-        dense_embedding_function=dense_ef,
+        # Documents are embedded by the seed pipeline's worker processes
+        dense_embedding_function=None,
         # dense_embedding_function=sentence_transformer_ef,
     )
 
-    # Merge all data
-    df = merge_all_data()
-
-    # Shuffle data
-    df = df.sample(frac=1, random_state=42).reset_index(drop=True)
-
-    if args.test == "1":
-        df = df.head(3000)
-
-    logger.info(f"IN SEEDING df.shape: {df.shape}")
-
-    # Process data
-    ids = df.id.values
+    # Stream the seed data: CSV chunks -> rows -> bounded shuffle -> batches
+    if args.incremental and standard_retriever.client.has_collection(standard_retriever.collection_name):
+        if not standard_retriever.has_content_pks():
+            raise SystemExit("milvus_hybrid uses auto ids: run one full seed before seeding incrementally")
+        # Write documents the way the existing collection stores them
+        for name, value in standard_retriever.search_layout().items():
+            setattr(standard_retriever, name, value)
+        logger.info(f"Incremental seed into the existing collection: {standard_retriever.search_layout()}")
 
-    docs = df.text.values
+    if standard_retriever.passage_chunking:
+        # Passages are short enough for the text field and keep the whole document
+        passage_splitter = PassageSplitter.from_pretrained()
+        max_text_length = None
+    else:
+        passage_splitter = None
+        max_text_length = 60000  # max length of varchar in milvus for text field
 
-    truncate_docs = [
-        doc[:60000] for doc in docs
-    ]  # max length of varchar in milvus for text field
+    # Syndicated copies and lightly edited re-posts are seeded once
+    near_duplicates = NearDuplicateFilter() if SEED_NEAR_DUPLICATE_THRESHOLD > 0 else None
 
-    labels = df.label.values
+    rows = shuffled(iter_rows(iter_all_data(near_duplicates=near_duplicates), max_text_length=max_text_length))
 
-    sources = df.source.values
-
-    urls = df.url.values
-
-    created_ats = [
-        utility.mkts_from_datetime(created_at) for created_at in df.created_at.values
-    ]
-
-    data = [
-        {
-            "id": str(ids[i]),
-            "text": truncate_docs[i],
-            "label": labels[i],
-            "source": sources[i],
-            "url": urls[i],
-            "created_at": created_ats[i],
-        }
-        for i in range(len(truncate_docs))
-    ]
-
-    logger.info(f"Length of data to be inserted: {len(data)}")
+    if args.test == "1":
+        rows = itertools.islice(rows, 3000)
 
     # Insert data into Milvus
 
-    standard_retriever.drop_collection()
-
-    standard_retriever.build_collection()
+    if not args.incremental:
+        standard_retriever.drop_collection()
+
+    if not standard_retriever.client.has_collection(standard_retriever.collection_name):
+        standard_retriever.build_collection(dense_dim=BGE_M3_DENSE_DIM)
+
+    # The checkpoint only applies to the same input batched the same way
+    # into the same collection
+    checkpoint = SeedCheckpoint(
+        fingerprint=seed_fingerprint(
+            seed_data_paths(),
+            {
+                "batch_size": SEED_BATCH_SIZE,
+                "shuffle_buffer": SEED_SHUFFLE_BUFFER,
+                "max_text_length": max_text_length,
+                "near_duplicate_threshold": SEED_NEAR_DUPLICATE_THRESHOLD,
+                "near_duplicate_permutations": SEED_NEAR_DUPLICATE_PERMUTATIONS,
+                "test": args.test,
+                "collection_id": standard_retriever.client.describe_collection(standard_retriever.collection_name).get("collection_id"),
+            },
+        )
+    )
 
     # for meta_data in data:
     #     standard_retriever.insert_data(meta_data["text"], meta_data)
 
-    for i in range(0, len(data), 1000):
-        batch = data[i : i + 1000]
-        batch_end = min(i + 1000, len(data))
+    progress = SeedProgress()
+    n_tokens = 0
+
+    # Vectors of texts embedded by earlier seeds are reused
+    embedding_store = default_embedding_store("BAAI/bge-m3")
+    if embedding_store is not None:
+        logger.info(f"Embedding store: {embedding_store.stats()}")
+
+    def prepare(batch):
+        nonlocal n_tokens
+        if args.incremental:
+            batch = skip_existing(batch, standard_retriever, progress)
+        if passage_splitter is None:
+            return batch
+        passages, batch_tokens = passage_splitter.split_rows(batch)
+        n_tokens += batch_tokens
+        logger.info(f"Split {len(batch)} documents into {len(passages)} passages, {batch_tokens} tokens")
+        return passages
+
+    # Bulk mode writes the batches to import files instead of inserting them;
+    # nothing is in the collection until the import, so there is no checkpoint
+    writer = standard_retriever
+    if args.bulk:
+        from bulk_seed import BulkImportWriter
+
+        writer = BulkImportWriter(standard_retriever)
+        checkpoint = None
+
+    # Embedding workers and inserts overlap; failed batches are retried and
+    # a batch that keeps failing stops the seed
+    asyncio.run(
+        run_seed_pipeline(
+            batched(rows),
+            writer,
+            progress,
+            prepare=prepare,
+            upsert=args.incremental,
+            # Import files only take appends
+            retry_upsert=not args.bulk,
+            checkpoint=checkpoint,
+            embedding_store=embedding_store,
+        )
+    )
+    if embedding_store is not None:
+        logger.info(f"Embedding store: {embedding_store.stats()}")
+        embedding_store.close()
+
+    if near_duplicates is not None:
+        near_duplicates.save_report()
+
+    if args.bulk:
         try:
-            logger.info(f"Inserting batch {i//1000 + 1}: records {i} to {batch_end}")
-            inserted_results = standard_retriever.batch_insert_data(batch)
-            logger.info(
-                f"Successfully inserted {len(batch)} records. Result: {inserted_results}"
-            )
-        except Exception as e:
-            logger.error(
-                f"Error inserting batch {i//1000 + 1} (records {i} to {batch_end})"
-            )
-            logger.error(f"Exception details: {str(e)}")
-            logger.error(f"Batch size: {len(batch)} records")
-            # Continue with the next batch - no need to increment i as the loop will do that
-            continue
+            writer.import_files()
+        finally:
+            writer.close()
+
+    # Flush so the final row count is visible: evidence retrieval uses the
+    # collection id and row count to invalidate its cached search results
+    standard_retriever.flush()
+    logger.info(f"Collection generation: {standard_retriever.collection_generation()}")
 
     end_time = time.time()
     logger.info(f"End time: {end_time}")
     logger.info(f"Time taken to insert data: {end_time - start_time} seconds")
+    progress.log()
+    if passage_splitter is not None:
+        logger.info(f"Inserted {progress.rows} passages of {progress.documents} documents, {n_tokens} tokens embedded")
 
     # Search
     logger.info("Testing search...")
 
+    standard_retriever.embedding_function = BGEM3EmbeddingFunction(
+        model_name="BAAI/bge-m3",
+        device="cpu",
+        normalize_embeddings=True,
+        cache_dir=S_TRANSFORMERS_MDL_DIR,
+    )
+
     query = "Russia attacked Ukraine in 2022"
 
     logger.info(f"Query: {query}")
@@ -0,0 +1,184 @@
+"""
+Near-duplicate removal of seed documents with MinHash and LSH.
+
+Every document is reduced to the set of its lowercased word 3-grams and a
+MinHash signature of SEED_NEAR_DUPLICATE_PERMUTATIONS values. The signatures
+are split into bands; documents sharing a band are candidates, and a candidate
+whose estimated Jaccard similarity with a kept document reaches
+SEED_NEAR_DUPLICATE_THRESHOLD is dropped. Syndicated copies of a news article
+and re-shared posts with small edits end up in the cluster of the first copy
+seen, which is the one seeded.
+
+Documents are checked one chunk at a time against all earlier chunks, so the
+filter works on the streamed corpus; memory grows with the number of kept
+documents (their signatures and one LSH entry per band).
+"""
+import json
+import re
+import zlib
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import dotenv
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+# Estimated Jaccard similarity from which a document is a near-duplicate; 0 disables the filter
+SEED_NEAR_DUPLICATE_THRESHOLD = float(os.getenv("SEED_NEAR_DUPLICATE_THRESHOLD", "0.8"))
+SEED_NEAR_DUPLICATE_PERMUTATIONS = int(os.getenv("SEED_NEAR_DUPLICATE_PERMUTATIONS", "64"))
+SEED_NEAR_DUPLICATE_REPORT = os.getenv("SEED_NEAR_DUPLICATE_REPORT", "seed_state/near_duplicates.json")
+
+SHINGLE_WORDS = 3
+LSH_RECALL = 0.9
+# Prime above 2^32: (a * x + b) of 32-bit values does not overflow uint64
+_PRIME = np.uint64((1 << 32) + 15)
+# Clusters listed in the report, largest first, and removed ids listed per cluster
+REPORT_CLUSTERS = 100
+REPORT_REMOVED_IDS = 10
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def lsh_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    (bands, rows per band) with the fewest bands that make a document at the
+    threshold similarity a candidate with probability LSH_RECALL. Candidates
+    are verified, so a low band threshold only costs comparisons.
+    """
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        if 1 - (1 - threshold ** rows) ** bands >= LSH_RECALL:
+            return bands, rows
+    return num_perm, 1
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    words = _WORD.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+
+
+class NearDuplicateFilter:
+    def __init__(
+        self,
+        threshold: float = SEED_NEAR_DUPLICATE_THRESHOLD,
+        num_perm: int = SEED_NEAR_DUPLICATE_PERMUTATIONS,
+        seed: int = 42,
+    ):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows_per_band = lsh_bands(threshold, num_perm)
+
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)[:, None]
+
+        self.buckets = [dict() for _ in range(self.bands)]
+        self.signatures = np.empty((1024, num_perm), dtype=np.uint32)
+        self.kept = []  # (id, source) of the kept documents
+        # kept document number -> [removed count, removed ids, text of the first removed]
+        self.removed = {}
+        self.n_removed = 0
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text)
+        if not len(hashes):
+            return np.zeros(self.num_perm, dtype=np.uint32)
+        return ((self.a * hashes[None, :] + self.b) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [
+            signature[band * self.rows_per_band:(band + 1) * self.rows_per_band].tobytes()
+            for band in range(self.bands)
+        ]
+
+    def _match(self, signature: np.ndarray, band_keys: List[bytes]):
+        candidates = {self.buckets[band][key] for band, key in enumerate(band_keys) if key in self.buckets[band]}
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            similarity = float(np.mean(self.signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def _keep(self, signature: np.ndarray, band_keys: List[bytes], document: tuple) -> None:
+        number = len(self.kept)
+        if number == len(self.signatures):
+            self.signatures = np.concatenate([self.signatures, np.empty_like(self.signatures)])
+        self.signatures[number] = signature
+        for band, key in enumerate(band_keys):
+            self.buckets[band].setdefault(key, number)
+        self.kept.append(document)
+
+    def is_duplicate(self, document_id, source: str, text: str) -> bool:
+        """
+        Whether the text is a near-duplicate of a document kept earlier;
+        otherwise the document is kept and later texts are compared with it.
+        """
+        signature = self.signature(text)
+        band_keys = self._band_keys(signature)
+        match = self._match(signature, band_keys)
+        if match is None:
+            self._keep(signature, band_keys, (str(document_id), source))
+            return False
+
+        removed = self.removed.setdefault(match, [0, [], text[:200]])
+        removed[0] += 1
+        if len(removed[1]) < REPORT_REMOVED_IDS:
+            removed[1].append(str(document_id))
+        self.n_removed += 1
+        return True
+
+    def filter_chunk(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        The rows of a seed chunk that are not near-duplicates of earlier rows.
+        """
+        mask = [
+            not self.is_duplicate(document_id, source, text)
+            for document_id, source, text in zip(df["id"], df["source"], df["text"])
+        ]
+        return df[mask]
+
+    def report(self) -> dict:
+        clusters = sorted(self.removed.items(), key=lambda item: -item[1][0])
+        return {
+            "threshold": self.threshold,
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+            "rows_per_band": self.rows_per_band,
+            "documents": len(self.kept) + self.n_removed,
+            "kept": len(self.kept),
+            "removed": self.n_removed,
+            "clusters": len(self.removed),
+            "largest_clusters": [
+                {
+                    "kept_id": self.kept[number][0],
+                    "source": self.kept[number][1],
+                    "removed": count,
+                    "removed_ids": removed_ids,
+                    "removed_text": removed_text,
+                }
+                for number, (count, removed_ids, removed_text) in clusters[:REPORT_CLUSTERS]
+            ],
+        }
+
+    def save_report(self, path: str = SEED_NEAR_DUPLICATE_REPORT) -> dict:
+        report = self.report()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        logger.info(
+            f"Near-duplicates: removed {report['removed']} of {report['documents']} documents "
+            f"in {report['clusters']} clusters, report in {path}"
+        )
+        return report
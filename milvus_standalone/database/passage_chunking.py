@@ -0,0 +1,82 @@
+"""
+Split seed documents into overlapping, token-bounded passages.
+
+Passages are cut on the BGE-M3 tokenizer so each one fits in PASSAGE_MAX_TOKENS
+tokens and starts PASSAGE_MAX_TOKENS - PASSAGE_OVERLAP_TOKENS tokens after the
+previous one. Passage texts are sliced from the original document with the
+tokenizer's character offsets, so nothing is re-joined or normalized.
+"""
+from typing import List, Tuple
+
+import dotenv
+import os
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+PASSAGE_MAX_TOKENS = int(os.getenv("PASSAGE_MAX_TOKENS", "512"))
+PASSAGE_OVERLAP_TOKENS = int(os.getenv("PASSAGE_OVERLAP_TOKENS", "64"))
+# Documents are tokenized in slices of this many characters, then the offsets are merged
+PASSAGE_TOKENIZE_CHARS = 100000
+
+S_TRANSFORMERS_MDL_DIR = os.getenv("S_TRANSFORMERS_MDL_DIR")
+
+
+class PassageSplitter:
+    def __init__(self, tokenizer, max_tokens: int = PASSAGE_MAX_TOKENS, overlap_tokens: int = PASSAGE_OVERLAP_TOKENS):
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError(f"Passage overlap ({overlap_tokens}) must be smaller than the passage length ({max_tokens})")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    @classmethod
+    def from_pretrained(cls, model_name: str = "BAAI/bge-m3", **kwargs) -> "PassageSplitter":
+        # Imported here: only needed when seeding with passage chunking
+        from transformers import AutoTokenizer
+
+        return cls(AutoTokenizer.from_pretrained(model_name, cache_dir=S_TRANSFORMERS_MDL_DIR), **kwargs)
+
+    def token_offsets(self, text: str) -> List[Tuple[int, int]]:
+        offsets = []
+        for start in range(0, len(text), PASSAGE_TOKENIZE_CHARS):
+            encoding = self.tokenizer(
+                text[start:start + PASSAGE_TOKENIZE_CHARS],
+                add_special_tokens=False,
+                return_offsets_mapping=True,
+            )
+            offsets.extend((start + begin, start + end) for begin, end in encoding["offset_mapping"] if end > begin)
+        return offsets
+
+    def split(self, text: str) -> List[Tuple[str, int]]:
+        """
+        Passages of the text with their token counts; a text within the token
+        budget is one passage.
+        """
+        offsets = self.token_offsets(text)
+        if len(offsets) <= self.max_tokens:
+            return [(text.strip(), len(offsets))] if text.strip() else []
+
+        passages = []
+        stride = self.max_tokens - self.overlap_tokens
+        for first in range(0, len(offsets), stride):
+            last = min(first + self.max_tokens, len(offsets)) - 1
+            passages.append((text[offsets[first][0]:offsets[last][1]].strip(), last - first + 1))
+            if last == len(offsets) - 1:
+                break
+        return passages
+
+    def split_rows(self, rows: List[dict]) -> Tuple[List[dict], int]:
+        """
+        One row per passage, with the document's metadata and id and the
+        passage_index. Rows with a pk get the pk of the document suffixed
+        with the passage_index. Also returns the number of tokens to embed.
+        """
+        passage_rows, n_tokens = [], 0
+        for row in rows:
+            for passage_index, (passage, passage_tokens) in enumerate(self.split(row["text"])):
+                passage_row = {**row, "text": passage, "passage_index": passage_index}
+                if "pk" in row:
+                    passage_row["pk"] = f"{row['pk']}-{passage_index}"
+                passage_rows.append(passage_row)
+                n_tokens += passage_tokens
+        return passage_rows, n_tokens
@@ -2,6 +2,7 @@ import pandas as pd
 import os
 import dotenv
 import re
+import hashlib
 
 dotenv.load_dotenv(dotenv.find_dotenv())
 
@@ -17,6 +18,15 @@ print(f"FINNISH_DATA: {FINNISH_DATA}")
 print(f"INTERNATIONAL_DATA: {INTERNATIONAL_DATA}")
 print(f"DATA_DIR: {DATA_DIR}")
 
+# Rows read from a CSV file at a time when streaming
+SEED_CHUNK_SIZE = int(os.getenv("SEED_CHUNK_SIZE", "10000"))
+
+SEED_COLUMNS = ['id', 'text', 'label', 'source', 'url', 'created_at', 'source_type']
+
+# Values of the source_type partition key field
+SOURCE_TYPE_FACEBOOK_POST = "facebook_post"
+SOURCE_TYPE_NEWS_ARCHIVE = "news_archive"
+
 def remove_emojis(text):
     """
     Remove emojis from text
@@ -42,14 +52,37 @@ def remove_emojis(text):
                       "]+", re.UNICODE)
     return re.sub(emoj, '', text) 
 
+def _unseen(texts, seen):
+    """
+    Mask of the texts whose digest is not in `seen` yet, adding them. Keeps
+    duplicates out across the chunks of a file with 8 bytes per text.
+    """
+    digests = [hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest() for text in texts]
+    mask = [digest not in seen for digest in digests]
+    seen.update(digests)
+    return mask
+
 def process_facepager_data(data_path):
     src_df = pd.read_csv(data_path, delimiter=";")
     
+    df = normalize_facepager_chunk(src_df)
+    
+    print(f"process_facepager_data df.shape: {df.shape}")
+    
+    return df
+
+def normalize_facepager_chunk(src_df, seen=None):
+    """
+    Facepager rows in the seed format. `seen` holds the digests of the texts
+    of earlier chunks of the same file.
+    """
     # Drop rows where 'text' is empty
     src_df = src_df[src_df['message'].notna()]
     
     # Drop rows where 'text' is duplicated
     src_df = src_df[~src_df.duplicated(subset=['message'])]
+    if seen is not None:
+        src_df = src_df[_unseen(src_df['message'], seen)]
     print(f"AFTER DROP DUPLICATES src_df.shape: {src_df.shape}")
     
     # Remove emojis from text
@@ -58,6 +91,9 @@ def process_facepager_data(data_path):
     # Remove text with length less than 10
     src_df = src_df[src_df["message"].str.len() > 10]
     
+    if src_df.empty:
+        return pd.DataFrame(columns=SEED_COLUMNS)
+    
     # Covert created_time to created_at
     src_df.loc[:, "created_time"] = pd.to_datetime(src_df["created_time"], utc=True)
     
@@ -74,14 +110,14 @@ def process_facepager_data(data_path):
     
     df.loc[:, "label"] = ["Nan" for _ in range(df.shape[0])]
     
+    df.loc[:, "source_type"] = SOURCE_TYPE_FACEBOOK_POST
+    
     df.rename(columns={
         "message": "text",
         "created_time": "created_at",
         }, inplace=True)
     
-    df = df[['id', 'text', 'label', 'source', 'url', 'created_at']]
-    
-    print(f"process_facepager_data df.shape: {df.shape}")
+    df = df[['id', 'text', 'label', 'source', 'url', 'created_at', 'source_type']]
     
     return df
 
@@ -94,6 +130,13 @@ def process_news_data(file_name):
 
     src_df = get_news_data(file_name)
     
+    return normalize_news_chunk(src_df)
+
+def normalize_news_chunk(src_df, seen=None):
+    """
+    News archive rows in the seed format. `seen` holds the digests of the
+    texts of earlier chunks of the same file.
+    """
     #src_df.columns: Index(['id', 'author', 'text', 'source', 'url', 'apiURL', 'headline'], dtype='object')
     # print(f"src_df.shape: {src_df.shape}")
     
@@ -102,6 +145,11 @@ def process_news_data(file_name):
     
     # Remove rows where 'text' is duplicated
     src_df = src_df[~src_df.duplicated(subset=['text'])]
+    if seen is not None:
+        src_df = src_df[_unseen(src_df['text'], seen)]
+    
+    if src_df.empty:
+        return pd.DataFrame(columns=SEED_COLUMNS)
     
     # Create label column
     src_df.loc[:, "label"] = ["None" for _ in range(src_df.shape[0])]
@@ -109,10 +157,23 @@ def process_news_data(file_name):
     # Create created_at column
     src_df.loc[:, "created_at"] = pd.to_datetime(src_df["createdAt"], utc=True)
     
-    df = src_df[['id', 'text', 'label', 'source', 'url', 'created_at']]
+    # Create source_type column: the partition key of the collection
+    src_df.loc[:, "source_type"] = SOURCE_TYPE_NEWS_ARCHIVE
+    
+    df = src_df[['id', 'text', 'label', 'source', 'url', 'created_at', 'source_type']]
     
     return df
 
+def news_file_names():
+    # Sorted: the checkpoint of an incremental seed counts batches in this order
+    file_names = sorted(os.listdir(DATA_DIR))
+    print("file_names: ", file_names)
+    
+    return [fn for fn in file_names if (fn.endswith(".csv") and fn != "test.csv")]
+
+def seed_data_paths():
+    return [FINNISH_DATA, INTERNATIONAL_DATA] + [os.path.join(DATA_DIR, fn) for fn in news_file_names()]
+
 def merge_all_data():
     dfs = []
     
@@ -122,10 +183,7 @@ def merge_all_data():
     international_df = process_facepager_data(INTERNATIONAL_DATA)
     dfs.append(international_df)
     
-    file_names = os.listdir(DATA_DIR)
-    print("file_names: ", file_names)
-    
-    filtered_file_names = [fn for fn in file_names if (fn.endswith(".csv") and fn != "test.csv")]
+    filtered_file_names = news_file_names()
         
     for file_name in filtered_file_names:
         
@@ -140,4 +198,25 @@ def merge_all_data():
     
     return df
 
+def iter_all_data(chunksize=SEED_CHUNK_SIZE, near_duplicates=None):
+    """
+    The rows of merge_all_data as DataFrames of at most `chunksize` rows,
+    reading one chunk of one file at a time. With a NearDuplicateFilter,
+    near-duplicates of rows of any earlier chunk or file are dropped too.
+    """
+    def chunks():
+        for data_path in (FINNISH_DATA, INTERNATIONAL_DATA):
+            seen = set()
+            for src_df in pd.read_csv(data_path, delimiter=";", chunksize=chunksize):
+                yield normalize_facepager_chunk(src_df, seen)
+        
+        for file_name in news_file_names():
+            seen = set()
+            for src_df in pd.read_csv(os.path.join(DATA_DIR, file_name), chunksize=chunksize):
+                yield normalize_news_chunk(src_df, seen)
 
+    for df in chunks():
+        if near_duplicates is not None:
+            df = near_duplicates.filter_chunk(df)
+        if len(df):
+            yield df
@@ -0,0 +1,447 @@
+"""
+Streaming stages of hybrid_seed.py.
+
+Seed rows are produced lazily from the CSV chunks of seed_data_processing,
+shuffled within a bounded buffer and grouped into fixed-size batches, so the
+memory used while seeding does not depend on the size of the corpus.
+
+run_seed_pipeline embeds the batches in SEED_EMBED_WORKERS processes while an
+async stage inserts finished batches into Milvus. Both stages retry failed
+batches with exponential backoff; a batch that still fails stops the run.
+
+Incremental seeds skip documents whose content-derived pk is already in the
+collection, upsert the rest and record the completed batches in a checkpoint,
+so an interrupted seed resumes after the last contiguous completed batch.
+
+With an EmbeddingStore, texts embedded by earlier seeds are read from the
+store and only the others are sent to the embedding workers.
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import multiprocessing
+import random
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from pymilvus import utility
+
+from hybrid_retrieval import document_pk
+from embedding_store import EmbeddingStore, content_key
+
+import dotenv
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+SEED_BATCH_SIZE = int(os.getenv("SEED_BATCH_SIZE", "1000"))
+# Rows held back to mix sources and files within batches
+SEED_SHUFFLE_BUFFER = int(os.getenv("SEED_SHUFFLE_BUFFER", "20000"))
+# Embedding processes; 0 embeds in a thread of the seeding process
+SEED_EMBED_WORKERS = int(os.getenv("SEED_EMBED_WORKERS", "2"))
+# Torch threads per embedding process; 0 keeps the torch default
+SEED_TORCH_THREADS = int(os.getenv("SEED_TORCH_THREADS", "0"))
+# Embedded batches waiting to be inserted
+SEED_QUEUE_SIZE = int(os.getenv("SEED_QUEUE_SIZE", "4"))
+SEED_RETRIES = int(os.getenv("SEED_RETRIES", "3"))
+SEED_RETRY_BACKOFF_S = float(os.getenv("SEED_RETRY_BACKOFF_S", "2"))
+SEED_CHECKPOINT_PATH = os.getenv("SEED_CHECKPOINT_PATH", "seed_state/checkpoint.json")
+
+S_TRANSFORMERS_MDL_DIR = os.getenv("S_TRANSFORMERS_MDL_DIR")
+
+# Dense dimension of BGE-M3, to build the collection without loading the model
+BGE_M3_DENSE_DIM = 1024
+
+
+def hybrid_ts(created_at) -> int:
+    timestamp = pd.Timestamp(created_at)
+    if timestamp.tz is None:
+        # numpy datetimes of tz-aware columns are in UTC
+        timestamp = timestamp.tz_localize("UTC")
+    return utility.mkts_from_datetime(timestamp.to_pydatetime())
+
+
+def iter_rows(chunks: Iterable[pd.DataFrame], max_text_length: Optional[int] = None) -> Iterator[dict]:
+    """
+    Insert rows of the documents in the chunks.
+    """
+    for df in chunks:
+        for row in df.itertuples(index=False):
+            data = {
+                "id": str(row.id),
+                "text": row.text if max_text_length is None else row.text[:max_text_length],
+                "label": row.label,
+                "source": row.source,
+                "url": row.url,
+                "created_at": hybrid_ts(row.created_at),
+                "source_type": row.source_type,
+            }
+            data["pk"] = document_pk(data)
+            yield data
+
+
+def shuffled(rows: Iterable[dict], buffer_size: int = SEED_SHUFFLE_BUFFER, seed: int = 42) -> Iterator[dict]:
+    """
+    Rows in random order within a window of `buffer_size` rows.
+    """
+    rng = random.Random(seed)
+    buffer = []
+    for row in rows:
+        if len(buffer) < buffer_size:
+            buffer.append(row)
+            continue
+        i = rng.randrange(buffer_size)
+        yield buffer[i]
+        buffer[i] = row
+
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+def batched(rows: Iterable[dict], batch_size: int = SEED_BATCH_SIZE) -> Iterator[List[dict]]:
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class SeedProgress:
+    """
+    Documents and batches seeded so far, throughput and peak memory.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.documents = 0
+        self.rows = 0
+        self.batches = 0
+        self.retries = 0
+        self.skipped = 0
+        self.embedded = 0
+        self.stored = 0
+
+    def update(self, documents: int, rows: int) -> None:
+        self.documents += documents
+        self.rows += rows
+        self.batches += 1
+
+    def retry(self) -> None:
+        self.retries += 1
+
+    def skip(self, documents: int) -> None:
+        self.skipped += documents
+
+    def embeddings(self, embedded: int, stored: int) -> None:
+        self.embedded += embedded
+        self.stored += stored
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.start
+        return {
+            "documents": self.documents,
+            "rows": self.rows,
+            "batches": self.batches,
+            "skipped": self.skipped,
+            "embedded": self.embedded,
+            "stored_embeddings": self.stored,
+            "retries": self.retries,
+            "elapsed_s": round(elapsed, 1),
+            "documents_per_s": round(self.documents / elapsed, 1) if elapsed else 0.0,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+    def log(self) -> None:
+        logger.info(f"Seed progress: {self.stats()}")
+
+
+def seed_fingerprint(paths: Iterable[str], settings: dict) -> str:
+    """
+    Identity of a seed input: the files with their sizes and modification
+    times, and the settings that decide how they are batched.
+    """
+    files = []
+    for path in sorted(paths):
+        stat = os.stat(path)
+        files.append([path, stat.st_size, int(stat.st_mtime)])
+    return hashlib.sha1(json.dumps([files, settings], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class SeedCheckpoint:
+    """
+    Number of leading batches of a seed input that are in the collection.
+    Batches finish out of order, so only the contiguous prefix is recorded.
+    """
+
+    def __init__(self, path: str = SEED_CHECKPOINT_PATH, fingerprint: str = ""):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.completed_batches = 0
+        self.done = set()
+
+        if os.path.exists(path):
+            with open(path) as f:
+                checkpoint = json.load(f)
+            if checkpoint.get("fingerprint") == fingerprint:
+                self.completed_batches = checkpoint["completed_batches"]
+            else:
+                logger.info(f"Checkpoint {path} is for another seed input, starting from the first batch")
+
+    def mark_done(self, batch_number: int) -> None:
+        self.done.add(batch_number)
+        advanced = False
+        while self.completed_batches + 1 in self.done:
+            self.completed_batches += 1
+            self.done.discard(self.completed_batches)
+            advanced = True
+        if advanced:
+            self.save()
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fingerprint": self.fingerprint, "completed_batches": self.completed_batches}, f)
+        os.replace(tmp_path, self.path)
+
+
+def skip_existing(batch: List[dict], retriever, progress: SeedProgress) -> List[dict]:
+    """
+    Documents of the batch that are not in the collection with the same
+    content. Passage collections are checked by the first passage's pk.
+    """
+    suffix = "-0" if retriever.passage_chunking else ""
+    existing = retriever.existing_pks(row["pk"] + suffix for row in batch)
+    new_rows = [row for row in batch if row["pk"] + suffix not in existing]
+    progress.skip(len(batch) - len(new_rows))
+    return new_rows
+
+
+class SeedBatchError(Exception):
+    pass
+
+
+# Embedding function of an embedding worker, set by its initializer
+_embedding_function = None
+
+
+def init_bge_m3_worker(torch_threads: int = SEED_TORCH_THREADS) -> None:
+    global _embedding_function
+
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+    from pymilvus.model.hybrid import BGEM3EmbeddingFunction
+
+    _embedding_function = BGEM3EmbeddingFunction(
+        model_name="BAAI/bge-m3",
+        device="cpu",
+        normalize_embeddings=True,
+        cache_dir=S_TRANSFORMERS_MDL_DIR,
+    )
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    embeddings = _embedding_function(texts)
+    if isinstance(embeddings, dict) and "dense" in embeddings:
+        embeddings = embeddings["dense"]
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+async def _with_retries(label: str, attempt: Callable, retries: int, backoff_s: float, progress: SeedProgress):
+    for attempt_number in range(1, retries + 2):
+        try:
+            return await attempt()
+        except Exception as e:
+            if attempt_number > retries:
+                raise SeedBatchError(f"{label} failed after {attempt_number} attempts: {e}") from e
+            delay = backoff_s * 2 ** (attempt_number - 1)
+            logger.warning(f"{label} failed (attempt {attempt_number}): {e}. Retrying in {delay}s")
+            progress.retry()
+            await asyncio.sleep(delay)
+
+
+async def run_seed_pipeline(
+    batches: Iterable[List[dict]],
+    retriever,
+    progress: SeedProgress,
+    prepare: Optional[Callable[[List[dict]], List[dict]]] = None,
+    workers: int = SEED_EMBED_WORKERS,
+    queue_size: int = SEED_QUEUE_SIZE,
+    retries: int = SEED_RETRIES,
+    backoff_s: float = SEED_RETRY_BACKOFF_S,
+    initializer: Callable = init_bge_m3_worker,
+    initargs: tuple = (SEED_TORCH_THREADS,),
+    upsert: bool = False,
+    retry_upsert: bool = True,
+    checkpoint: Optional[SeedCheckpoint] = None,
+    embedding_store: Optional[EmbeddingStore] = None,
+) -> None:
+    """
+    Embed the batches in worker processes and insert them with
+    `retriever.insert_batch`. `prepare` turns a batch of documents into the
+    rows to embed, e.g. passages.
+
+    With upsert, rows replace those with the same pk and earlier versions of
+    the documents are deleted. With retry_upsert, a batch whose insert failed
+    is upserted when retried: the failed attempt may have written some of
+    its rows, and inserting them again would duplicate their pks. With a
+    checkpoint, its completed batches are skipped and every batch is marked
+    done once it is written. With an embedding store, stored vectors are
+    reused and new ones are added to it.
+
+    At most two batches per worker are being embedded and `queue_size`
+    embedded batches wait for insertion, which bounds memory and applies
+    backpressure to reading the corpus.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    embed_slots = asyncio.Semaphore(2 * max(workers, 1))
+
+    def make_embed_executor():
+        if not workers:
+            return ThreadPoolExecutor(max_workers=1, initializer=initializer, initargs=initargs)
+        # spawn: torch does not survive forking a process that uses threads
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initializer,
+            initargs=initargs,
+        )
+
+    embed_executor = make_embed_executor()
+    insert_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="milvus-insert")
+    store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-store")
+
+    async def embed_attempt(texts: List[str]) -> np.ndarray:
+        nonlocal embed_executor
+        executor = embed_executor
+        try:
+            return await loop.run_in_executor(executor, embed_texts, texts)
+        except BrokenProcessPool:
+            # A worker died, e.g. killed for memory: retry on a new pool
+            if embed_executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                embed_executor = make_embed_executor()
+            raise
+
+    async def embed(batch_number: int, rows: List[dict], n_documents: int) -> None:
+        try:
+            texts = [row["text"] for row in rows]
+            keys = [content_key(text) for text in texts]
+            stored = {}
+            if embedding_store is not None:
+                stored = await loop.run_in_executor(store_executor, embedding_store.lookup, keys)
+            missing = [i for i, key in enumerate(keys) if key not in stored]
+            if missing:
+                embedded = await _with_retries(
+                    f"Embedding batch {batch_number}",
+                    lambda: embed_attempt([texts[i] for i in missing]),
+                    retries,
+                    backoff_s,
+                    progress,
+                )
+                if embedding_store is not None:
+                    await loop.run_in_executor(
+                        store_executor, embedding_store.put_many, [keys[i] for i in missing], embedded
+                    )
+                stored.update(zip((keys[i] for i in missing), embedded))
+            progress.embeddings(len(missing), len(texts) - len(missing))
+            vectors = [stored[key] for key in keys]
+            await queue.put((batch_number, rows, n_documents, vectors))
+        finally:
+            embed_slots.release()
+
+    def write(rows: List[dict], retry: bool) -> None:
+        retriever.insert_batch(rows, upsert=upsert or (retry and retry_upsert))
+        if upsert:
+            retriever.delete_stale(rows)
+
+    def batch_done(batch_number: int) -> None:
+        if checkpoint is not None:
+            checkpoint.mark_done(batch_number)
+
+    async def produce() -> None:
+        batch_iterator = iter(batches)
+        tasks = set()
+        batch_number = 0
+        if checkpoint is not None and checkpoint.completed_batches:
+            logger.info(f"Resuming after batch {checkpoint.completed_batches}")
+            for _ in itertools.islice(batch_iterator, checkpoint.completed_batches):
+                batch_number += 1
+        try:
+            while True:
+                await embed_slots.acquire()
+                # Reading and preparing the corpus blocks: keep it off the event loop
+                batch = await loop.run_in_executor(None, next, batch_iterator, None)
+                if batch is None:
+                    embed_slots.release()
+                    break
+                batch_number += 1
+                n_documents = len(batch)
+                if prepare is not None:
+                    batch = await loop.run_in_executor(None, prepare, batch)
+                if not batch:
+                    embed_slots.release()
+                    progress.update(n_documents, 0)
+                    batch_done(batch_number)
+                    continue
+                tasks.add(asyncio.create_task(embed(batch_number, batch, n_documents)))
+                # Surface embedding errors without waiting for the end of the corpus
+                for task in [task for task in tasks if task.done()]:
+                    tasks.discard(task)
+                    task.result()
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        await queue.put(None)
+
+    async def consume() -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            batch_number, rows, n_documents, vectors = item
+            for row, vector in zip(rows, vectors):
+                row.update(retriever.vector_fields(vector))
+            attempts = itertools.count()
+            await _with_retries(
+                f"Inserting batch {batch_number}",
+                lambda: loop.run_in_executor(insert_executor, write, rows, next(attempts) > 0),
+                retries,
+                backoff_s,
+                progress,
+            )
+            progress.update(n_documents, len(rows))
+            batch_done(batch_number)
+            progress.log()
+
+    stages = [asyncio.create_task(produce()), asyncio.create_task(consume())]
+    try:
+        done, pending = await asyncio.wait(stages, return_when=asyncio.FIRST_EXCEPTION)
+        for stage in pending:
+            stage.cancel()
+        for stage in done:
+            stage.result()
+    finally:
+        embed_executor.shutdown(wait=False, cancel_futures=True)
+        insert_executor.shutdown(wait=True)
+        store_executor.shutdown(wait=True)
@@ -0,0 +1,303 @@
+"""
+Cheap pre-filter cascade in front of the SetFit model.
+
+The cascade labels high-confidence negatives (sentences that are never
+check-worthy: questions, greetings, bylines, URLs, very short fragments) before
+the transformer runs. It consists of configurable rules and an optional tiny
+logistic regression over hashed word features. Sentences the cascade cannot
+decide are passed on to the full model.
+
+Train the linear filter on sentences labelled by the full model and measure
+agreement on held-out data with:
+    python cascade.py train --data sentences.csv --output cascade.npz
+    python cascade.py evaluate --data held_out.csv --linear-model cascade.npz
+"""
+import argparse
+import csv
+import json
+import re
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from utils import logger
+
+import dotenv
+import os
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+# Cascade environment variables
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "false")
+CASCADE_RULES = os.getenv("CASCADE_RULES", "min_words,question,url,greeting,byline")
+CASCADE_MIN_WORDS = int(os.getenv("CASCADE_MIN_WORDS", "4"))
+CASCADE_LINEAR_MODEL = os.getenv("CASCADE_LINEAR_MODEL")
+CASCADE_THRESHOLD = float(os.getenv("CASCADE_THRESHOLD", "0.05"))
+
+_URL_PATTERN = re.compile(r"(https?://|www\.)\S+", re.IGNORECASE)
+
+_GREETING_PATTERN = re.compile(
+    r"^\W*(hei|moi|terve|huomenta|kiitos|tervetuloa|hyvää (huomenta|päivää|iltaa)|"
+    r"hi|hello|hey|thanks|thank you|welcome|good (morning|afternoon|evening))\b",
+    re.IGNORECASE,
+)
+
+_BYLINE_PATTERN = re.compile(
+    r"^\W*(kuva|kuvat|teksti|toimittaja|lähde|photo|image|by|source|credit)\s*[:|]"
+    r"|^\W*(stt|afp|ap|reuters)\W*$",
+    re.IGNORECASE,
+)
+
+# Credits also appear inside quoted claims ("Orpo (STT) sanoi, että ..."), so they
+# only mark a byline on a short line
+_CREDIT_PATTERN = re.compile(r"©|\((stt|afp|ap|reuters|lehtikuva)\)", re.IGNORECASE)
+
+
+def _rule_min_words(sentence: str) -> bool:
+    return len(sentence.split()) < CASCADE_MIN_WORDS
+
+
+def _rule_question(sentence: str) -> bool:
+    return sentence.rstrip().rstrip('"”»').endswith("?")
+
+
+def _rule_url(sentence: str) -> bool:
+    # Sentence is mostly a link
+    without_urls = _URL_PATTERN.sub("", sentence)
+    return len(without_urls.strip()) < len(sentence.strip()) / 2
+
+
+def _rule_greeting(sentence: str) -> bool:
+    return bool(_GREETING_PATTERN.match(sentence)) and len(sentence.split()) < 8
+
+
+def _rule_byline(sentence: str) -> bool:
+    if _BYLINE_PATTERN.search(sentence):
+        return True
+    return bool(_CREDIT_PATTERN.search(sentence)) and len(sentence.split()) < 6
+
+
+RULES = {
+    "min_words": _rule_min_words,
+    "question": _rule_question,
+    "url": _rule_url,
+    "greeting": _rule_greeting,
+    "byline": _rule_byline,
+}
+
+
+class HashedLinearFilter:
+    """
+    Logistic regression over hashed word unigrams/bigrams and shape features.
+    `predict_proba` returns the probability that a sentence is a claim.
+    """
+
+    def __init__(self, n_features: int = 2**18, weights: Optional[np.ndarray] = None, bias: float = 0.0):
+        self.n_features = n_features
+        self.weights = weights if weights is not None else np.zeros(n_features, dtype=np.float32)
+        self.bias = bias
+
+    def features(self, sentence: str) -> np.ndarray:
+        words = re.findall(r"\w+", sentence.lower())
+        tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        tokens.append(f"__len_{min(len(words) // 5, 10)}")
+        if any(c.isdigit() for c in sentence):
+            tokens.append("__digit")
+        if sentence.rstrip().endswith("?"):
+            tokens.append("__question")
+        return np.unique(
+            np.fromiter(
+                (zlib.crc32(t.encode("utf-8")) % self.n_features for t in tokens),
+                dtype=np.int64,
+                count=len(tokens),
+            )
+        )
+
+    def predict_proba(self, sentences: List[str]) -> np.ndarray:
+        scores = np.array(
+            [self.weights[self.features(s)].sum() + self.bias for s in sentences],
+            dtype=np.float64,
+        )
+        return 1.0 / (1.0 + np.exp(-scores))
+
+    def fit(self, sentences: List[str], labels: List[int], epochs: int = 5, learning_rate: float = 0.1, l2: float = 1e-6, seed: int = 42) -> "HashedLinearFilter":
+        """
+        Train with plain SGD on the log loss.
+        """
+        rng = np.random.default_rng(seed)
+        features = [self.features(s) for s in sentences]
+        targets = np.asarray(labels, dtype=np.float64)
+
+        for _ in range(epochs):
+            for i in rng.permutation(len(features)):
+                idx = features[i]
+                p = 1.0 / (1.0 + np.exp(-(self.weights[idx].sum() + self.bias)))
+                gradient = p - targets[i]
+                self.weights[idx] -= learning_rate * (gradient + l2 * self.weights[idx])
+                self.bias -= learning_rate * gradient
+
+        return self
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, weights=self.weights, bias=np.float64(self.bias))
+
+    @classmethod
+    def load(cls, path: str) -> "HashedLinearFilter":
+        data = np.load(path)
+        weights = data["weights"].astype(np.float32)
+        return cls(n_features=weights.shape[0], weights=weights, bias=float(data["bias"]))
+
+
+class Cascade:
+    """
+    Labels high-confidence negatives before the transformer runs.
+    """
+
+    def __init__(self, rules: List[str], linear_filter: Optional[HashedLinearFilter] = None, threshold: float = CASCADE_THRESHOLD):
+        unknown = [rule for rule in rules if rule not in RULES]
+        if unknown:
+            raise ValueError(f"Unknown cascade rules: {unknown}")
+
+        self.rules = rules
+        self.linear_filter = linear_filter
+        self.threshold = threshold
+        self.counts: Dict[str, int] = {"sentences": 0, "linear": 0, **{rule: 0 for rule in rules}}
+
+    @classmethod
+    def from_env(cls) -> Optional["Cascade"]:
+        """
+        Build the cascade from CASCADE_* environment variables, or return None
+        if it is disabled.
+        """
+        if CASCADE_ENABLED != "true":
+            return None
+
+        rules = [rule.strip() for rule in CASCADE_RULES.split(",") if rule.strip()]
+        linear_filter = HashedLinearFilter.load(CASCADE_LINEAR_MODEL) if CASCADE_LINEAR_MODEL else None
+
+        logger.info(f"Cascade enabled: rules={rules}, linear_model={CASCADE_LINEAR_MODEL}, threshold={CASCADE_THRESHOLD}")
+
+        return cls(rules, linear_filter)
+
+    def filter(self, sentences: List[str]) -> List[Optional[int]]:
+        """
+        Return 0 for every sentence the cascade labels as non-checkable and
+        None for sentences that must go to the full model.
+        """
+        decisions: List[Optional[int]] = [None] * len(sentences)
+        undecided = []
+
+        for i, sentence in enumerate(sentences):
+            rule = next((rule for rule in self.rules if RULES[rule](sentence)), None)
+            if rule:
+                self.counts[rule] += 1
+                decisions[i] = 0
+            else:
+                undecided.append(i)
+
+        if self.linear_filter is not None and undecided:
+            probabilities = self.linear_filter.predict_proba([sentences[i] for i in undecided])
+            for i, p in zip(undecided, probabilities):
+                if p < self.threshold:
+                    self.counts["linear"] += 1
+                    decisions[i] = 0
+
+        self.counts["sentences"] += len(sentences)
+
+        return decisions
+
+    def stats(self) -> dict:
+        short_circuited = sum(v for k, v in self.counts.items() if k != "sentences")
+        return {
+            **self.counts,
+            "short_circuited": short_circuited,
+            "short_circuit_rate": short_circuited / self.counts["sentences"] if self.counts["sentences"] else 0.0,
+        }
+
+
+def evaluate_agreement(cascade: Cascade, sentences: List[str], model_labels: List[int], true_labels: Optional[List[int]] = None) -> dict:
+    """
+    Compare cascade decisions with the full model on held-out sentences.
+
+    `agreement` is the fraction of short-circuited sentences that the full
+    model also labels as non-claims.
+    """
+    decisions = cascade.filter(sentences)
+    short_circuited = [i for i, d in enumerate(decisions) if d is not None]
+    disagreements = [i for i in short_circuited if model_labels[i] == 1]
+
+    report = {
+        "sentences": len(sentences),
+        "short_circuited": len(short_circuited),
+        "short_circuit_rate": len(short_circuited) / len(sentences) if sentences else 0.0,
+        "agreement": 1 - len(disagreements) / len(short_circuited) if short_circuited else 1.0,
+        "model_claims_short_circuited": len(disagreements),
+        "examples_disagreement": [sentences[i] for i in disagreements[:10]],
+        "counts": cascade.stats(),
+    }
+
+    if true_labels is not None:
+        missed = [i for i in short_circuited if true_labels[i] == 1]
+        report["annotated_claims_short_circuited"] = len(missed)
+        report["annotation_agreement"] = 1 - len(missed) / len(short_circuited) if short_circuited else 1.0
+
+    return report
+
+
+def read_sentences(path: str, text_column: str, label_column: Optional[str] = None, sep: str = ","):
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = [row for row in csv.DictReader(f, delimiter=sep) if row.get(text_column)]
+    sentences = [row[text_column] for row in rows]
+    labels = [int(row[label_column]) for row in rows] if label_column else None
+    return sentences, labels
+
+
+def _predict_with_full_model(sentences: List[str]) -> List[int]:
+    # Imported here: the inference engine itself depends on this module
+    import asyncio
+    from inference_engine import InferenceEngine
+
+    async def run():
+        engine = InferenceEngine()
+        await engine.start()
+        try:
+            return await engine.predict(sentences)
+        finally:
+            await engine.stop()
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-filter cascade tools")
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--data", required=True, help="CSV file with sentences")
+    parser.add_argument("--sep", default=",")
+    parser.add_argument("--text-column", default="text")
+    parser.add_argument("--label-column", help="Annotated labels (0/1), reported next to the full model agreement")
+    parser.add_argument("--rules", default=CASCADE_RULES)
+    parser.add_argument("--linear-model", default=CASCADE_LINEAR_MODEL)
+    parser.add_argument("--threshold", type=float, default=CASCADE_THRESHOLD)
+    parser.add_argument("--output", default="cascade.npz")
+    args = parser.parse_args()
+
+    sentences, labels = read_sentences(args.data, args.text_column, args.label_column, args.sep)
+    model_labels = _predict_with_full_model(sentences)
+
+    if args.command == "train":
+        # Distill the full model; annotated labels are not used for training
+        linear_filter = HashedLinearFilter().fit(sentences, model_labels)
+        linear_filter.save(args.output)
+        logger.info(f"Saved linear cascade filter to {args.output}")
+        return
+
+    rules = [rule.strip() for rule in args.rules.split(",") if rule.strip()]
+    linear_filter = HashedLinearFilter.load(args.linear_model) if args.linear_model else None
+    cascade = Cascade(rules, linear_filter, args.threshold)
+
+    print(json.dumps(evaluate_agreement(cascade, sentences, model_labels, labels), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,42 +10,17 @@ from aio_pika.abc import AbstractRobustConnection, AbstractIncomingMessage
 
 from aio_pika.pool import Pool
 
-import mlflow
+from inference_engine import InferenceEngine, inference_engine
 
-from model import InferenceResult, ModelMetadata
+from utils import logger, UUIDEncoder
 
-from utils import load_yaml_file, parse_datetime, logger, UUIDEncoder
-
-# Read model environment variables
+# Read environment variables
 import dotenv
 
 import os
 
 dotenv.load_dotenv(dotenv.find_dotenv())
 
-# Load SetFit model environment variables
-MODEL_URI = os.getenv("MODEL_URI")
-
-MODEL_METADATA = os.getenv("MODEL_METADATA")
-
-logger.info(f"MODEL_URI: {MODEL_URI}")
-
-logger.info(f"MODEL_METADATA: {MODEL_METADATA}")
-
-# Load SetFit model
-model = mlflow.pyfunc.load_model(MODEL_URI)
-
-model_metadata = load_yaml_file(MODEL_METADATA)
-
-model_metadata = ModelMetadata(
-    model_name=model_metadata["name"],
-    model_version=str(model_metadata["version"]),
-    model_path=model_metadata["source"],
-    created_at=parse_datetime(model_metadata["creation_timestamp"]),
-)
-
-logger.info(f"Model metadata: {model_metadata}")
-
 # Load RabbitMQ environment variables
 RABBITMQ_PASSWORD = os.getenv("RABBITMQ_PASSWORD")
 RABBITMQ_USER = os.getenv("RABBITMQ_USER")
@@ -58,7 +33,14 @@ RABBITMQ_URL = (
 logger.info(f"RABBITMQ_URL: {RABBITMQ_URL}")
 
 
-async def main() -> None:
+async def consume(engine: InferenceEngine) -> None:
+    """
+    AMQP frontend: serve rpc_claim_prediction_queue with the shared inference engine.
+
+    Message body: {"claim": [...], "model_version": optional version to route to,
+    "compare_versions": optional versions to also run on the same embeddings}.
+    Results of compare_versions are returned under "comparisons".
+    """
 
     # 1. Create connection pool: 1 connection
     async def get_connection() -> AbstractRobustConnection:
@@ -104,19 +86,32 @@ async def main() -> None:
 
                         logger.info(f" [.] claim_list: {claim_list}")
 
-                        predictions = await asyncio.to_thread(model.predict, claim_list)
+                        model_version = engine.resolve_version(
+                            message_body_dict.get("model_version")
+                        )
+
+                        compare_versions = [
+                            engine.resolve_version(v)
+                            for v in message_body_dict.get("compare_versions", [])
+                        ]
 
-                        predictions = predictions.cpu().numpy().tolist()
+                        predictions = await engine.predict_versions(
+                            claim_list, [model_version, *compare_versions]
+                        )
 
                         logger.info(f" [.] predictions: {predictions}")
 
-                        response_body = {
-                            "model_metadata": model_metadata.model_dump(),
-                            "inference_results": [
-                                InferenceResult(label=p).model_dump()
-                                for p in predictions
-                            ],
-                        }
+                        response_body = engine.build_response(
+                            predictions[model_version], model_version
+                        )
+
+                        if compare_versions:
+
+                            response_body["comparisons"] = [
+                                engine.build_response(predictions[v], v)
+                                for v in compare_versions
+                                if v != model_version
+                            ]
 
                         logger.info(f" [.] response_body: {response_body}")
 
@@ -137,6 +132,19 @@ async def main() -> None:
                     logger.exception("Processing error for message %r", message)
 
 
+async def main() -> None:
+
+    await inference_engine.start()
+
+    try:
+
+        await consume(inference_engine)
+
+    finally:
+
+        await inference_engine.stop()
+
+
 if __name__ == "__main__":
 
     asyncio.run(main())
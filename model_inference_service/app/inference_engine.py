@@ -0,0 +1,370 @@
+"""
+Shared inference engine for the claim prediction model.
+
+The engine owns the single model copy of the process, a dedicated executor for
+running the model, a micro-batching queue that merges concurrent requests into
+one forward pass, and the inference metrics. The HTTP (/predict) and AMQP
+frontends are thin adapters that call `InferenceEngine.predict`.
+
+With MODEL_VERSIONS_CONFIG the engine serves several model versions through a
+ModelRegistry; requests select a version and batches are encoded once per
+shared body.
+
+An optional pre-filter cascade (see cascade.py) labels obviously non-checkable
+sentences before they reach the batching queue.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import mlflow
+import torch
+
+from cascade import Cascade
+from model import InferenceResult, ModelMetadata
+from model_registry import ModelRegistry
+from utils import load_model_metadata, to_label_list, logger
+
+import dotenv
+import os
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+# Load SetFit model environment variables
+MODEL_URI = os.getenv("MODEL_URI")
+MODEL_METADATA = os.getenv("MODEL_METADATA")
+
+# Serve several model versions (see model_registry.py) instead of MODEL_URI
+MODEL_VERSIONS_CONFIG = os.getenv("MODEL_VERSIONS_CONFIG")
+
+# Engine tuning environment variables
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "64"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+INFERENCE_TORCH_THREADS = int(os.getenv("INFERENCE_TORCH_THREADS", "0"))
+
+
+class EngineMetrics:
+    """
+    Running counters of the inference engine.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.sentences = 0
+        self.batches = 0
+        self.errors = 0
+        self.short_circuited = 0
+        self.max_batch_size = 0
+        self.total_queue_wait_s = 0.0
+        self.total_inference_s = 0.0
+
+    def record_batch(self, n_requests: int, n_sentences: int, queue_wait_s: float, inference_s: float):
+        self.requests += n_requests
+        self.sentences += n_sentences
+        self.batches += 1
+        self.max_batch_size = max(self.max_batch_size, n_sentences)
+        self.total_queue_wait_s += queue_wait_s
+        self.total_inference_s += inference_s
+
+    def snapshot(self) -> dict:
+        batches = self.batches or 1
+        requests = self.requests or 1
+        return {
+            "requests": self.requests,
+            "sentences": self.sentences,
+            "batches": self.batches,
+            "errors": self.errors,
+            "short_circuited": self.short_circuited,
+            "max_batch_size": self.max_batch_size,
+            "mean_batch_size": self.sentences / batches,
+            "mean_requests_per_batch": self.requests / batches,
+            "mean_queue_wait_ms": 1000 * self.total_queue_wait_s / requests,
+            "mean_batch_inference_ms": 1000 * self.total_inference_s / batches,
+        }
+
+
+class PendingRequest(NamedTuple):
+    sentences: List[str]
+    versions: List[str]
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class InferenceEngine:
+    """
+    Owns the model and serves predictions to any number of frontends.
+
+    Concurrent `predict` calls are queued and merged into batches of at most
+    `max_batch_size` sentences, waiting at most `max_wait_ms` for a batch to
+    fill. Batches run on a dedicated executor with `num_workers` threads, so
+    CPU usage of the model is bounded no matter how many frontends are active.
+    """
+
+    def __init__(
+        self,
+        model: Any = None,
+        model_metadata: Optional[ModelMetadata] = None,
+        registry: Optional[ModelRegistry] = None,
+        max_batch_size: int = INFERENCE_MAX_BATCH_SIZE,
+        max_wait_ms: float = INFERENCE_MAX_WAIT_MS,
+        num_workers: int = INFERENCE_WORKERS,
+        cascade: Optional[Cascade] = None,
+    ):
+        self.model = model
+        self.model_metadata = model_metadata
+        self.registry = registry
+        self.cascade = cascade
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000
+        self.num_workers = num_workers
+        self.metrics = EngineMetrics()
+
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self._worker_slots: Optional[asyncio.Semaphore] = None
+        self._batcher_task: Optional[asyncio.Task] = None
+        self._batch_tasks: set = set()
+
+    @property
+    def is_running(self) -> bool:
+        return self._batcher_task is not None and not self._batcher_task.done()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.registry is not None or (self.model is not None and self.model_metadata is not None)
+
+    @property
+    def default_version(self) -> str:
+        if self.registry is not None:
+            return self.registry.default_version
+        return self.model_metadata.model_version
+
+    def load(self) -> None:
+        """
+        Load the model versions listed in MODEL_VERSIONS_CONFIG, or the single
+        model from MODEL_URI / MODEL_METADATA, unless they were injected in the
+        constructor.
+        """
+        if INFERENCE_TORCH_THREADS > 0:
+            torch.set_num_threads(INFERENCE_TORCH_THREADS)
+
+        if self.registry is None and self.model is None and MODEL_VERSIONS_CONFIG:
+            logger.info(f"MODEL_VERSIONS_CONFIG: {MODEL_VERSIONS_CONFIG}")
+            self.registry = ModelRegistry.from_config(MODEL_VERSIONS_CONFIG)
+
+        if self.registry is not None:
+            self.model_metadata = self.registry.metadata()
+            logger.info(f"Serving model versions {list(self.registry.versions)}, default {self.default_version}")
+            return
+
+        if self.model is None:
+            logger.info(f"MODEL_URI: {MODEL_URI}")
+            self.model = mlflow.pyfunc.load_model(MODEL_URI)
+
+        if self.model_metadata is None:
+            logger.info(f"MODEL_METADATA: {MODEL_METADATA}")
+            self.model_metadata = load_model_metadata(MODEL_METADATA)
+
+        logger.info(f"Model metadata: {self.model_metadata}")
+
+    async def start(self) -> None:
+        """
+        Load the model (once) and start the batching loop. Safe to call from
+        several frontends in the same process.
+        """
+        if self.is_running:
+            return
+
+        if not self.is_loaded:
+            await asyncio.to_thread(self.load)
+        elif self.registry is not None:
+            self.model_metadata = self.registry.metadata()
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.num_workers, thread_name_prefix="inference"
+        )
+        self.queue = asyncio.Queue()
+        self._worker_slots = asyncio.Semaphore(self.num_workers)
+        self._batcher_task = asyncio.create_task(self._run_batcher())
+
+        logger.info(
+            f"Inference engine started: max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait_s * 1000}, workers={self.num_workers}"
+        )
+
+    async def stop(self) -> None:
+        """
+        Stop the batching loop, finish running batches and fail queued requests.
+        """
+        if self._batcher_task is None:
+            return
+
+        self._batcher_task.cancel()
+        try:
+            await self._batcher_task
+        except asyncio.CancelledError:
+            pass
+        self._batcher_task = None
+
+        if self._batch_tasks:
+            await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+
+        while not self.queue.empty():
+            future = self.queue.get_nowait().future
+            if not future.done():
+                future.set_exception(RuntimeError("Inference engine stopped"))
+
+        self.executor.shutdown(wait=True)
+        self.executor = None
+
+        logger.info(f"Inference engine stopped: {self.metrics.snapshot()}")
+
+    def resolve_version(self, version: Optional[str] = None) -> str:
+        """
+        Map a requested model version (None for the default) to a served version.
+        """
+        if self.registry is not None:
+            return self.registry.resolve(version)
+        if version is not None and str(version) != self.default_version:
+            raise ValueError(f"Unknown model version: {version}. Available: {[self.default_version]}")
+        return self.default_version
+
+    def metadata(self, version: Optional[str] = None) -> ModelMetadata:
+        if self.registry is not None:
+            return self.registry.metadata(version)
+        return self.model_metadata
+
+    async def predict(self, sentences: List[str], version: Optional[str] = None) -> List[int]:
+        """
+        Predict claim labels for a list of sentences with one model version.
+        """
+        version = self.resolve_version(version)
+        predictions = await self.predict_versions(sentences, [version])
+        return predictions[version]
+
+    async def predict_versions(self, sentences: List[str], versions: List[Optional[str]]) -> Dict[str, List[int]]:
+        """
+        Predict claim labels with several model versions at once. Versions that
+        share a body are computed from the same embeddings.
+        """
+        if not self.is_running:
+            raise RuntimeError("Inference engine is not running")
+
+        versions = list(dict.fromkeys(self.resolve_version(v) for v in versions))
+
+        if len(sentences) == 0:
+            return {version: [] for version in versions}
+
+        if self.cascade is None:
+            return await self._enqueue(list(sentences), versions)
+
+        decisions = self.cascade.filter(sentences)
+        undecided = [s for s, d in zip(sentences, decisions) if d is None]
+        self.metrics.short_circuited += len(sentences) - len(undecided)
+
+        model_labels = await self._enqueue(undecided, versions) if undecided else {v: [] for v in versions}
+
+        predictions = {}
+        for version in versions:
+            labels = iter(model_labels[version])
+            predictions[version] = [next(labels) if d is None else d for d in decisions]
+        return predictions
+
+    async def _enqueue(self, sentences: List[str], versions: List[str]) -> Dict[str, List[int]]:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(PendingRequest(sentences, versions, future, time.perf_counter()))
+        return await future
+
+    def build_response(self, predictions: List[int], version: Optional[str] = None) -> dict:
+        """
+        Build the response body shared by all frontends.
+        """
+        return {
+            "model_metadata": self.metadata(version).model_dump(),
+            "inference_results": [
+                InferenceResult(label=p).model_dump() for p in predictions
+            ],
+        }
+
+    async def _run_batcher(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            # Wait for a free worker first: while all workers are busy, requests
+            # keep accumulating in the queue and form a bigger next batch.
+            await self._worker_slots.acquire()
+
+            batch: List[PendingRequest] = []
+            try:
+                batch.append(await self.queue.get())
+                n_sentences = len(batch[0].sentences)
+                deadline = loop.time() + self.max_wait_s
+
+                while n_sentences < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        request = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    batch.append(request)
+                    n_sentences += len(request.sentences)
+
+            except BaseException:
+                self._worker_slots.release()
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(RuntimeError("Inference engine stopped"))
+                raise
+
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch: List[PendingRequest]) -> None:
+        try:
+            sentences = [sentence for request in batch for sentence in request.sentences]
+            versions = list(dict.fromkeys(v for request in batch for v in request.versions))
+            started = time.perf_counter()
+            queue_wait_s = sum(started - request.enqueued_at for request in batch)
+
+            try:
+                predictions = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self._predict_sync, sentences, versions
+                )
+            except Exception as e:
+                self.metrics.errors += 1
+                logger.exception(f"Inference failed for batch of {len(sentences)} sentences")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                return
+
+            self.metrics.record_batch(
+                len(batch), len(sentences), queue_wait_s, time.perf_counter() - started
+            )
+
+            # Split batch predictions back to the requests
+            offset = 0
+            for request in batch:
+                n = len(request.sentences)
+                if not request.future.done():
+                    request.future.set_result(
+                        {v: predictions[v][offset : offset + n] for v in request.versions}
+                    )
+                offset += n
+
+        finally:
+            self._worker_slots.release()
+
+    def _predict_sync(self, sentences: List[str], versions: List[str]) -> Dict[str, List[int]]:
+        if self.registry is not None:
+            return self.registry.predict(sentences, versions)
+        return {self.default_version: to_label_list(self.model.predict(sentences))}
+
+
+# Create a singleton instance shared by the HTTP and AMQP frontends
+inference_engine = InferenceEngine(cascade=Cascade.from_env())
@@ -1,34 +1,33 @@
-from typing import List, Tuple
+from typing import List, Optional
+from contextlib import asynccontextmanager, suppress
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from model import InferenceResult, ModelMetadata
-from utils import load_yaml_file, parse_datetime
 
-import mlflow
+from inference_engine import inference_engine
+from claim_prediction_rcp_server import consume
+
 import asyncio
 import dotenv
 import os
 dotenv.load_dotenv(dotenv.find_dotenv())
 
-# Load model
-MODEL_URI = os.getenv("MODEL_URI")
-MODEL_METADATA = os.getenv("MODEL_METADATA")    
-print(f"MODEL_URI: {MODEL_URI}")
-print(f"MODEL_METADATA: {MODEL_METADATA}")
-
-model = mlflow.pyfunc.load_model(MODEL_URI)
-model_metadata = load_yaml_file(MODEL_METADATA)
+# Also serve the AMQP queue from this process, sharing the same model copy
+SERVE_AMQP = os.getenv("SERVE_AMQP", "false")
 
-model_metadata = ModelMetadata(
-    model_name=model_metadata["name"],
-    model_version=str(model_metadata["version"]),
-    model_path=model_metadata["source"],
-    created_at=parse_datetime(model_metadata["creation_timestamp"])
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await inference_engine.start()
+    amqp_task = asyncio.create_task(consume(inference_engine)) if SERVE_AMQP == "true" else None
+    yield
+    if amqp_task:
+        amqp_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await amqp_task
+    await inference_engine.stop()
 
 # Setup FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 origins = ["*"]
 
 app.add_middleware(
@@ -40,15 +39,30 @@ app.add_middleware(
 )
 
 @app.post("/predict")
-async def predict(request: List[str]) -> dict:
-    predictions = await asyncio.to_thread(model.predict, request)
-    
-    # Convert torch tensor to Python list/dict
-    predictions = predictions.cpu().numpy().tolist()
-    
+async def predict(request: List[str], model_version: Optional[str] = None) -> dict:
+    try:
+        model_version = inference_engine.resolve_version(model_version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    predictions = await inference_engine.predict(request, model_version)
+    return inference_engine.build_response(predictions, model_version)
+
+@app.get("/models")
+async def models() -> dict:
+    registry = inference_engine.registry
+    versions = registry.versions if registry else {inference_engine.default_version: None}
+    return {
+        "default_version": inference_engine.default_version,
+        "versions": [inference_engine.metadata(v).model_dump() for v in versions],
+        "bodies": len(registry.bodies) if registry else 1,
+    }
+
+@app.get("/metrics")
+async def metrics() -> dict:
+    cascade = inference_engine.cascade
     return {
-        "model_metadata": model_metadata,
-        "inference_results": [InferenceResult(label=p) for p in predictions]
+        **inference_engine.metrics.snapshot(),
+        "cascade": cascade.stats() if cascade else None,
     }
 
 @app.get("/health")
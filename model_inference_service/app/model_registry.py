@@ -0,0 +1,162 @@
+"""
+Several SetFit model versions served from one process.
+
+A SetFit model is a sentence-transformer body (the encoder, where almost all
+compute and memory goes) plus a small classification head. Versions whose
+bodies have identical weights share one body instance: a batch is encoded once
+per body and every requested head is applied to the same embeddings.
+
+Versions are listed in a YAML file pointed to by MODEL_VERSIONS_CONFIG:
+
+    default_version: "3"
+    versions:
+      - model_uri: ./mlruns/<experiment>/<run>/artifacts/setfit_model
+        model_metadata: ./mlruns/models/claim-detection-setfit-TurkuNLP/version-3/meta.yaml
+      - model_uri: ./mlruns/<experiment>/<run>/artifacts/setfit_model
+        model_metadata: ./mlruns/models/claim-detection-setfit-TurkuNLP/version-4/meta.yaml
+      - model_uri: ./mlruns/<experiment>/<run>/artifacts/setfit_head
+        model_metadata: ./mlruns/models/claim-detection-setfit-TurkuNLP/version-5/meta.yaml
+        body_model_uri: ./mlruns/<experiment>/<run>/artifacts/setfit_model
+
+Head-only versions (model_training_service/model/head_training.py) store only a
+classification head and the URI of the model that provides their body.
+`body_model_uri` overrides that URI, e.g. to point at the locally mounted mlruns.
+A body that is already loaded for another version is reused without loading it.
+"""
+import hashlib
+from typing import Any, Dict, List, Optional
+
+import mlflow
+
+from model import ModelMetadata
+from utils import load_model_metadata, load_yaml_file, to_label_list, logger
+
+
+def body_fingerprint(body: Any) -> str:
+    """
+    Hash the weights of a sentence-transformer body.
+    """
+    digest = hashlib.sha256()
+    for name, tensor in body.state_dict().items():
+        digest.update(name.encode("utf-8"))
+        digest.update(tensor.detach().cpu().numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ModelVersion:
+    """
+    One served version: its metadata, SetFit model and the key of its body.
+    """
+
+    def __init__(self, metadata: ModelMetadata, setfit_model: Any, body_key: str):
+        self.metadata = metadata
+        self.setfit_model = setfit_model
+        self.body_key = body_key
+
+    def encode(self, sentences: List[str]) -> Any:
+        return self.setfit_model.encode(sentences, show_progress_bar=False)
+
+    def predict_from_embeddings(self, embeddings: Any) -> List[int]:
+        return to_label_list(self.setfit_model.model_head.predict(embeddings))
+
+
+class ModelRegistry:
+    """
+    Holds the served versions and one body per distinct set of body weights.
+    """
+
+    def __init__(self):
+        self.bodies: Dict[str, Any] = {}
+        self.models_by_uri: Dict[str, Any] = {}
+        self.versions: Dict[str, ModelVersion] = {}
+        self.default_version: Optional[str] = None
+
+    @classmethod
+    def from_config(cls, config_path: str) -> "ModelRegistry":
+        config = load_yaml_file(config_path)
+        registry = cls()
+
+        for entry in config["versions"]:
+            registry.load_version(
+                entry["model_uri"], entry["model_metadata"], entry.get("body_model_uri")
+            )
+
+        default_version = config.get("default_version")
+        registry.default_version = str(default_version) if default_version is not None else registry.default_version
+
+        if registry.default_version not in registry.versions:
+            raise ValueError(f"Default model version {registry.default_version} is not loaded")
+
+        return registry
+
+    def load_version(self, model_uri: str, metadata_path: str, body_model_uri: Optional[str] = None) -> ModelVersion:
+        """
+        Load a version logged by model_training.py (mlflow pyfunc wrapping a
+        SetFitModel) or a head-only version logged by head_training.py.
+        """
+        setfit_model = self._load_setfit_model(model_uri, body_model_uri)
+        return self.add_version(load_model_metadata(metadata_path), setfit_model)
+
+    def _load_setfit_model(self, model_uri: str, body_model_uri: Optional[str] = None) -> Any:
+        if model_uri in self.models_by_uri:
+            return self.models_by_uri[model_uri]
+
+        logger.info(f"Loading model from {model_uri}")
+        python_model = mlflow.pyfunc.load_model(model_uri).unwrap_python_model()
+
+        if getattr(python_model, "head_only", False):
+            body_model_uri = body_model_uri or python_model.body_model_uri
+            logger.info(f"Head-only model, attaching body of {body_model_uri}")
+            python_model.attach_body(self._load_setfit_model(body_model_uri))
+
+        self.models_by_uri[model_uri] = python_model.model
+        return python_model.model
+
+    def add_version(self, metadata: ModelMetadata, setfit_model: Any) -> ModelVersion:
+        version = metadata.model_version
+        if version in self.versions:
+            raise ValueError(f"Model version {version} is already loaded")
+
+        body_key = f"{body_fingerprint(setfit_model.model_body)}:{setfit_model.normalize_embeddings}"
+
+        if body_key in self.bodies:
+            # Drop this version's copy of the encoder and use the shared one
+            setfit_model.model_body = self.bodies[body_key]
+            logger.info(f"Model version {version} shares its body with an already loaded version")
+        else:
+            self.bodies[body_key] = setfit_model.model_body
+
+        self.versions[version] = ModelVersion(metadata, setfit_model, body_key)
+
+        if self.default_version is None:
+            self.default_version = version
+
+        logger.info(f"Loaded model version {version}: {len(self.versions)} versions, {len(self.bodies)} bodies")
+
+        return self.versions[version]
+
+    def resolve(self, version: Optional[str]) -> str:
+        version = self.default_version if version is None else str(version)
+        if version not in self.versions:
+            raise ValueError(f"Unknown model version: {version}. Available: {list(self.versions)}")
+        return version
+
+    def metadata(self, version: Optional[str] = None) -> ModelMetadata:
+        return self.versions[self.resolve(version)].metadata
+
+    def predict(self, sentences: List[str], versions: List[str]) -> Dict[str, List[int]]:
+        """
+        Predict with every requested version, encoding the sentences once per body.
+        """
+        by_body: Dict[str, List[ModelVersion]] = {}
+        for version in versions:
+            model_version = self.versions[self.resolve(version)]
+            by_body.setdefault(model_version.body_key, []).append(model_version)
+
+        predictions = {}
+        for model_versions in by_body.values():
+            embeddings = model_versions[0].encode(sentences)
+            for model_version in model_versions:
+                predictions[model_version.metadata.model_version] = model_version.predict_from_embeddings(embeddings)
+
+        return predictions
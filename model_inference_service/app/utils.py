@@ -1,8 +1,11 @@
 import yaml
 import json
+from typing import Any, List
 from uuid import UUID
 from datetime import datetime
 
+from model import ModelMetadata
+
 import logging
 import sys
 
@@ -37,6 +40,28 @@ def parse_datetime(date_str: str) -> datetime:
     creation_ts = datetime.fromtimestamp(int(date_str) / 1000)
     return creation_ts.strftime("%Y-%m-%d %H:%M:%S")
 
+def load_model_metadata(metadata_path: str) -> ModelMetadata:
+    """
+    Parse the MLflow registered model meta.yaml into ModelMetadata.
+    """
+    metadata = load_yaml_file(metadata_path)
+    return ModelMetadata(
+        model_name=metadata["name"],
+        model_version=str(metadata["version"]),
+        model_path=metadata["source"],
+        created_at=parse_datetime(metadata["creation_timestamp"]),
+    )
+
+def to_label_list(predictions: Any) -> List[int]:
+    """
+    Convert model output (torch tensor, numpy array or list) to a list of labels.
+    """
+    if hasattr(predictions, "cpu"):
+        predictions = predictions.cpu().numpy()
+    if hasattr(predictions, "tolist"):
+        predictions = predictions.tolist()
+    return list(predictions)
+
 class UUIDEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, UUID):
@@ -0,0 +1,250 @@
+"""
+In-process benchmark for the inference engine.
+
+Sweeps concurrency, sentences per request and sentence length against an
+InferenceEngine backed by either a stub model or the real MLflow model, and
+reports throughput and p50/p95/p99 latency as JSON. A stored result can be
+passed as baseline to fail the run on regressions.
+
+Usage (with the app directory on PYTHONPATH, as in Dockerfile.test):
+    python test/benchmark.py --model stub --concurrency 1 8 32 --sentences 1 10 \
+        --text-length 80 300 --output benchmark.json
+    python test/benchmark.py --model real --baseline benchmark.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import sys
+import time
+from typing import Dict, List, Optional
+
+from inference_engine import EngineMetrics, InferenceEngine, INFERENCE_MAX_BATCH_SIZE, INFERENCE_MAX_WAIT_MS, INFERENCE_WORKERS
+from model import ModelMetadata
+
+SAMPLE_SENTENCES = [
+    "Toimeentulotukea on maksettu yli 100 000 nuorelle.",
+    "Kelan tutkijan Tuija Korpelan mukaan koulutuspolitiikan ja työvoimapolitiikan tavoitteet ovat osin ristiriidassa.",
+    "Ilman ammatillista koulutusta oleva nuori saa työttömyystukea, jos hakee opiskelupaikkoja ja ottaa paikan vastaan.",
+    "Miksi 18–24-vuotiaat nuoret aikuiset ovat yliedustettuina toimeentulotuen saajissa?",
+    "Siitä selvisi, että vuonna 2023 perustoimeentulotukea oli maksettu 106 000 nuorelle aikuiselle.",
+    "Donald Trump is the new US president",
+]
+
+
+class StubModel:
+    """
+    Model stand-in with a cost of `base_ms` per call plus `per_char_us` per
+    input character. Sleeping releases the GIL like a torch forward pass does.
+    """
+
+    def __init__(self, base_ms: float = 5.0, per_char_us: float = 2.0):
+        self.base_ms = base_ms
+        self.per_char_us = per_char_us
+
+    def predict(self, sentences: List[str]) -> List[int]:
+        n_chars = sum(len(s) for s in sentences)
+        time.sleep(self.base_ms / 1000 + n_chars * self.per_char_us / 1_000_000)
+        return [int(any(c.isdigit() for c in s)) for s in sentences]
+
+
+def make_sentence(length: int, seed: int) -> str:
+    """
+    Build a sentence of exactly `length` characters from the sample sentences.
+    """
+    text = " ".join(SAMPLE_SENTENCES[seed % len(SAMPLE_SENTENCES):] + SAMPLE_SENTENCES)
+    while len(text) < length:
+        text = text + " " + text
+    return text[:length]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+async def run_case(engine: InferenceEngine, concurrency: int, sentences: int, text_length: int, requests: int) -> Dict:
+    """
+    Fire `requests` requests of `sentences` sentences each, keeping
+    `concurrency` requests in flight.
+    """
+    payloads = [
+        [make_sentence(text_length, i * sentences + j) for j in range(sentences)]
+        for i in range(requests)
+    ]
+    latencies: List[float] = []
+    next_payload = iter(payloads)
+
+    async def client():
+        for payload in next_payload:
+            start = time.perf_counter()
+            await engine.predict(payload)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "sentences": sentences,
+        "text_length": text_length,
+        "requests": requests,
+        "elapsed_s": elapsed,
+        "requests_per_s": requests / elapsed,
+        "sentences_per_s": requests * sentences / elapsed,
+        "latency_ms": {
+            "mean": 1000 * sum(latencies) / len(latencies),
+            "p50": 1000 * percentile(latencies, 50),
+            "p95": 1000 * percentile(latencies, 95),
+            "p99": 1000 * percentile(latencies, 99),
+        },
+    }
+
+
+async def run_sweep(engine: InferenceEngine, concurrency: List[int], sentences: List[int], text_length: List[int], requests: int, warmup: int = 0) -> Dict:
+    await engine.start()
+    try:
+        if warmup > 0:
+            await run_case(engine, 1, 1, min(text_length), warmup)
+
+        results = []
+        for c, s, t in itertools.product(concurrency, sentences, text_length):
+            # Fresh counters per case: the engine's own are cumulative
+            engine.metrics = EngineMetrics()
+            result = await run_case(engine, c, s, t, requests)
+            result["engine"] = engine.metrics.snapshot()
+            print(
+                f"concurrency={c} sentences={s} text_length={t}: "
+                f"{result['sentences_per_s']:.1f} sentences/s, "
+                f"p50={result['latency_ms']['p50']:.1f}ms p95={result['latency_ms']['p95']:.1f}ms "
+                f"p99={result['latency_ms']['p99']:.1f}ms",
+                file=sys.stderr,
+            )
+            results.append(result)
+    finally:
+        await engine.stop()
+
+    return {
+        "engine": {
+            "max_batch_size": engine.max_batch_size,
+            "max_wait_ms": engine.max_wait_s * 1000,
+            "workers": engine.num_workers,
+        },
+        "results": results,
+    }
+
+
+def case_key(result: Dict) -> tuple:
+    return (result["concurrency"], result["sentences"], result["text_length"])
+
+
+def compare_to_baseline(report: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    Return a description of every case whose throughput dropped, or whose p95
+    latency grew, by more than `threshold` (fraction) relative to the baseline.
+    """
+    baseline_cases = {case_key(r): r for r in baseline["results"]}
+    regressions = []
+
+    for result in report["results"]:
+        base = baseline_cases.get(case_key(result))
+        if base is None:
+            continue
+
+        if result["sentences_per_s"] < base["sentences_per_s"] * (1 - threshold):
+            regressions.append(
+                f"{case_key(result)}: throughput {result['sentences_per_s']:.1f} < "
+                f"baseline {base['sentences_per_s']:.1f} sentences/s"
+            )
+        if result["latency_ms"]["p95"] > base["latency_ms"]["p95"] * (1 + threshold):
+            regressions.append(
+                f"{case_key(result)}: p95 {result['latency_ms']['p95']:.1f} > "
+                f"baseline {base['latency_ms']['p95']:.1f} ms"
+            )
+
+    return regressions
+
+
+def build_engine(args) -> InferenceEngine:
+    kwargs = dict(
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        num_workers=args.workers,
+    )
+    if args.model == "real":
+        # Model and metadata are loaded from MODEL_URI / MODEL_METADATA
+        return InferenceEngine(**kwargs)
+
+    return InferenceEngine(
+        model=StubModel(args.stub_base_ms, args.stub_per_char_us),
+        model_metadata=ModelMetadata(
+            model_name="stub",
+            model_version="0",
+            model_path="stub",
+            created_at=time.strftime("%Y-%m-%d %H:%M:%S"),
+        ),
+        **kwargs,
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Inference engine benchmark")
+    parser.add_argument("--model", choices=["stub", "real"], default="stub")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--sentences", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--text-length", type=int, nargs="+", default=[100])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per case")
+    parser.add_argument("--warmup", type=int, default=5, help="Warm-up requests before the sweep")
+    parser.add_argument("--max-batch-size", type=int, default=INFERENCE_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=INFERENCE_MAX_WAIT_MS)
+    parser.add_argument("--workers", type=int, default=INFERENCE_WORKERS)
+    parser.add_argument("--stub-base-ms", type=float, default=5.0)
+    parser.add_argument("--stub-per-char-us", type=float, default=2.0)
+    parser.add_argument("--output", type=str, help="Write the JSON report to this file")
+    parser.add_argument("--baseline", type=str, help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Allowed regression as a fraction")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    report = asyncio.run(
+        run_sweep(
+            build_engine(args),
+            args.concurrency,
+            args.sentences,
+            args.text_length,
+            args.requests,
+            args.warmup,
+        )
+    )
+    report["model"] = args.model
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["regressions"] = compare_to_baseline(report, baseline, args.threshold)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+    if report.get("regressions"):
+        print(f"{len(report['regressions'])} regression(s) against {args.baseline}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
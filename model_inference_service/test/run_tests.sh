@@ -11,7 +11,7 @@ echo "Using model dir: $MODEL_DIR"
 echo "Using other env var: $MODEL_URI"
 
 # Run unit tests first
-python -m pytest test/test_main.py -v
+python -m pytest test/test_main.py test/test_inference_engine.py test/test_cascade.py test/test_benchmark.py test/test_model_registry.py -v
 
 echo "If Unit tests passed, running load tests..."
 
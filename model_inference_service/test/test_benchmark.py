@@ -0,0 +1,35 @@
+import asyncio
+
+from test.benchmark import StubModel, build_engine, compare_to_baseline, parse_args, percentile, run_sweep
+
+
+def test_percentile():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) == 0.0
+
+
+def test_stub_sweep_and_baseline_comparison():
+    args = parse_args(["--model", "stub", "--stub-base-ms", "0", "--stub-per-char-us", "0"])
+    engine = build_engine(args)
+    assert isinstance(engine.model, StubModel)
+
+    report = asyncio.run(run_sweep(engine, [1, 4], [2], [40], requests=8))
+
+    assert len(report["results"]) == 2
+    for result in report["results"]:
+        assert result["requests"] == 8
+        assert result["engine"]["requests"] == 8
+        assert result["engine"]["sentences"] == 16
+        assert set(result["latency_ms"]) == {"mean", "p50", "p95", "p99"}
+
+    assert compare_to_baseline(report, report, threshold=0.1) == []
+
+    faster_baseline = {
+        "results": [
+            {**r, "sentences_per_s": r["sentences_per_s"] * 2} for r in report["results"]
+        ]
+    }
+    assert len(compare_to_baseline(report, faster_baseline, threshold=0.1)) == 2
@@ -0,0 +1,57 @@
+import asyncio
+
+from cascade import Cascade, HashedLinearFilter, RULES, evaluate_agreement
+from test.test_inference_engine import StubModel, make_engine
+
+
+def test_rules_short_circuit_non_checkable_sentences():
+    cascade = Cascade(list(RULES))
+    sentences = [
+        "Miksi nuoret ovat yliedustettuina toimeentulotuen saajissa?",
+        "Kiitos kaikille!",
+        "Kuva: Lehtikuva / Antti Aimo-Koivisto",
+        "© Lehtikuva 2024",
+        "https://yle.fi/a/74-20012345",
+        "Lue lisää.",
+        "Vuonna 2023 perustoimeentulotukea maksettiin 106 000 nuorelle aikuiselle.",
+        "Pääministeri Orpo (STT) sanoi, että työttömyys on laskenut kahtena vuonna peräkkäin.",
+    ]
+
+    decisions = cascade.filter(sentences)
+
+    assert decisions == [0, 0, 0, 0, 0, 0, None, None]
+    assert cascade.stats()["short_circuited"] == 6
+
+
+def test_linear_filter_learns_and_round_trips(tmp_path):
+    sentences = ["Työttömyys nousi 8 prosenttiin vuonna 2024."] * 20 + ["Hyvää viikonloppua kaikille lukijoille."] * 20
+    labels = [1] * 20 + [0] * 20
+    linear_filter = HashedLinearFilter(n_features=2**12).fit(sentences, labels)
+
+    path = tmp_path / "cascade.npz"
+    linear_filter.save(str(path))
+    loaded = HashedLinearFilter.load(str(path))
+
+    probabilities = loaded.predict_proba([sentences[0], sentences[-1]])
+    assert probabilities[0] > 0.5 > probabilities[1]
+
+    cascade = Cascade([], loaded, threshold=0.2)
+    report = evaluate_agreement(cascade, [sentences[0], sentences[-1]], model_labels=[1, 0])
+    assert report["short_circuited"] == 1
+    assert report["agreement"] == 1.0
+
+
+def test_engine_skips_model_for_short_circuited_sentences():
+    model = StubModel()
+    engine = make_engine(model, cascade=Cascade(["question"]))
+
+    async def run():
+        await engine.start()
+        try:
+            return await engine.predict(["Onko 5 enemmän kuin 4?", "Inflaatio oli 3 prosenttia.", "Sataa."])
+        finally:
+            await engine.stop()
+
+    assert asyncio.run(run()) == [0, 1, 0]
+    assert model.batch_sizes == [2]
+    assert engine.metrics.short_circuited == 1
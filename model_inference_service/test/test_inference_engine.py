@@ -0,0 +1,53 @@
+import asyncio
+
+from inference_engine import InferenceEngine
+from model import ModelMetadata
+
+
+class StubModel:
+    """Labels a sentence as a claim if it contains a digit."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, sentences):
+        self.batch_sizes.append(len(sentences))
+        return [int(any(c.isdigit() for c in s)) for s in sentences]
+
+
+def make_engine(model, **kwargs) -> InferenceEngine:
+    metadata = ModelMetadata(
+        model_name="stub",
+        model_version="1",
+        model_path="stub",
+        created_at="2025-01-01 00:00:00",
+    )
+    return InferenceEngine(model=model, model_metadata=metadata, **kwargs)
+
+
+def test_concurrent_requests_are_batched():
+    model = StubModel()
+    engine = make_engine(model, max_batch_size=64, max_wait_ms=50)
+
+    async def run():
+        await engine.start()
+        try:
+            return await asyncio.gather(
+                *[engine.predict([f"Sentence {i}", "No digits here"]) for i in range(10)]
+            )
+        finally:
+            await engine.stop()
+
+    results = asyncio.run(run())
+
+    assert results == [[1, 0]] * 10
+    assert sum(model.batch_sizes) == 20
+    assert len(model.batch_sizes) < 10
+    assert engine.metrics.snapshot()["requests"] == 10
+
+
+def test_build_response():
+    engine = make_engine(StubModel())
+    response = engine.build_response([1, 0])
+    assert response["model_metadata"]["model_name"] == "stub"
+    assert [r["label"] for r in response["inference_results"]] == [True, False]
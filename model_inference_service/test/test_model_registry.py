@@ -0,0 +1,152 @@
+import asyncio
+
+import numpy as np
+
+from model import ModelMetadata
+from model_registry import ModelRegistry
+from inference_engine import InferenceEngine
+
+
+class FakeTensor:
+    def __init__(self, array):
+        self.array = array
+
+    def detach(self):
+        return self
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class FakeBody:
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.encode_calls = 0
+
+    def state_dict(self):
+        return {"weight": FakeTensor(np.array([self.weight], dtype=np.float32))}
+
+
+class FakeHead:
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+
+    def predict(self, embeddings):
+        return (embeddings[:, 0] > self.threshold).astype(int)
+
+
+class FakeSetFitModel:
+    normalize_embeddings = False
+
+    def __init__(self, weight: float, threshold: float):
+        self.model_body = FakeBody(weight)
+        self.model_head = FakeHead(threshold)
+
+    def encode(self, sentences, show_progress_bar=False):
+        self.model_body.encode_calls += 1
+        return np.array([[len(s) * self.model_body.weight] for s in sentences])
+
+
+def metadata(version: str) -> ModelMetadata:
+    return ModelMetadata(
+        model_name="claim-detection",
+        model_version=version,
+        model_path="fake",
+        created_at="2025-01-01 00:00:00",
+    )
+
+
+def test_versions_with_same_body_share_one_encoder_pass():
+    registry = ModelRegistry()
+    registry.add_version(metadata("3"), FakeSetFitModel(weight=1.0, threshold=10))
+    registry.add_version(metadata("4"), FakeSetFitModel(weight=1.0, threshold=20))
+    registry.add_version(metadata("5"), FakeSetFitModel(weight=2.0, threshold=20))
+
+    assert len(registry.bodies) == 2
+    assert registry.versions["3"].setfit_model.model_body is registry.versions["4"].setfit_model.model_body
+    assert registry.default_version == "3"
+
+    sentences = ["short", "a sentence of medium len", "a considerably longer sentence than the others"]
+    predictions = registry.predict(sentences, ["3", "4", "5"])
+
+    assert predictions == {"3": [0, 1, 1], "4": [0, 1, 1], "5": [0, 1, 1]}
+    assert registry.bodies[registry.versions["3"].body_key].encode_calls == 1
+    assert registry.bodies[registry.versions["5"].body_key].encode_calls == 1
+
+
+def test_engine_routes_requests_by_version():
+    registry = ModelRegistry()
+    registry.add_version(metadata("3"), FakeSetFitModel(weight=1.0, threshold=10))
+    registry.add_version(metadata("4"), FakeSetFitModel(weight=1.0, threshold=30))
+    engine = InferenceEngine(registry=registry)
+
+    sentences = ["short", "a sentence of medium len"]
+
+    async def run():
+        await engine.start()
+        try:
+            return await asyncio.gather(
+                engine.predict(sentences),
+                engine.predict(sentences, "4"),
+                engine.predict_versions(sentences, ["3", "4"]),
+            )
+        finally:
+            await engine.stop()
+
+    default, v4, both = asyncio.run(run())
+
+    assert default == [0, 1]
+    assert v4 == [0, 0]
+    assert both == {"3": [0, 1], "4": [0, 0]}
+    assert engine.build_response(v4, "4")["model_metadata"]["model_version"] == "4"
+
+
+class FakePythonModel:
+    def __init__(self, model):
+        self.model = model
+
+
+class FakeHeadOnlyPythonModel:
+    head_only = True
+
+    def __init__(self, body_model_uri: str, threshold: float):
+        self.body_model_uri = body_model_uri
+        self.head = FakeHead(threshold)
+        self.model = None
+
+    def attach_body(self, body_model):
+        self.model = FakeSetFitModel(weight=0.0, threshold=0)
+        self.model.model_body = body_model.model_body
+        self.model.model_head = self.head
+
+
+def test_head_only_version_reuses_loaded_body(monkeypatch):
+    import model_registry
+
+    python_models = {
+        "runs:/full/setfit_model": FakePythonModel(FakeSetFitModel(weight=1.0, threshold=10)),
+        "runs:/refresh/setfit_head": FakeHeadOnlyPythonModel("runs:/full/setfit_model", threshold=30),
+    }
+    loaded = []
+
+    class FakePyfuncModel:
+        def __init__(self, uri):
+            loaded.append(uri)
+            self.uri = uri
+
+        def unwrap_python_model(self):
+            return python_models[self.uri]
+
+    monkeypatch.setattr(model_registry.mlflow.pyfunc, "load_model", FakePyfuncModel)
+    monkeypatch.setattr(model_registry, "load_model_metadata", metadata)
+
+    registry = ModelRegistry()
+    registry.load_version("runs:/full/setfit_model", "3")
+    registry.load_version("runs:/refresh/setfit_head", "4")
+
+    assert loaded == ["runs:/full/setfit_model", "runs:/refresh/setfit_head"]
+    assert len(registry.bodies) == 1
+    assert registry.predict(["a sentence of medium len"], ["3", "4"]) == {"3": [1], "4": [0]}
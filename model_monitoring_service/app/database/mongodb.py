@@ -1,9 +1,25 @@
 import motor.motor_asyncio
 
-from datetime import datetime
+import asyncio
 import time
+from datetime import datetime, timedelta
 from typing import List, Dict, Any
 
+from pymongo import ASCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database.rollups import (
+    MONITORING_ROLLUP_DEDUP_HOURS,
+    claim_move_updates,
+    claim_vote_updates,
+    evidence_rollup_updates,
+    event_time,
+    is_settled,
+    rollup_query,
+    to_naive_utc,
+    utc_now,
+)
+
 import os
 import dotenv
 
@@ -16,6 +32,28 @@ MONGO_HOST = os.getenv("MONGO_HOST")
 MONGO_DB = os.getenv("MONGO_PORT")
 MONGO_URI = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}/{MONGO_DB}"
 
+# Raw events read per batch when the rollups are rebuilt or their dates migrated
+ROLLUP_REBUILD_BATCH = 1000
+
+# Days raw metric events are kept; the rollups keep the metrics of older events. 0 keeps them forever
+MONITORING_RAW_TTL_DAYS = float(os.getenv("MONITORING_RAW_TTL_DAYS", "90"))
+
+# Seconds between prunes of the applied claim document ids of the claim votes
+ROLLUP_PRUNE_INTERVAL_S = 600
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def only_duplicate_keys(error: BulkWriteError) -> bool:
+    """
+    Whether a bulk write only failed on duplicate keys: events stored by an
+    earlier attempt of a retried batch.
+    """
+    details = error.details
+    return not details.get("writeConcernErrors") and all(
+        write_error["code"] == DUPLICATE_KEY_ERROR for write_error in details.get("writeErrors", [])
+    )
+
 
 class MongoDBManager:
     def __init__(self, max_retries: int = 5, retry_delay: int = 3):
@@ -24,30 +62,38 @@ class MongoDBManager:
         self.max_retries = max_retries
         self.retry_delay = retry_delay
         self.is_connected = False
+        self.pruned_at = float("-inf")
 
-    def connect_to_db(self) -> motor.motor_asyncio.AsyncIOMotorClient:
-        for attempt in range(self.max_retries):
-            try:
-                # Use motor's async client instead of PyMongo
-                # Make sure authSource is specified properly
-                connection_uri = MONGO_URI
+    def create_client(self) -> motor.motor_asyncio.AsyncIOMotorClient:
+        """
+        Create the Motor client. It connects in the background and reconnects
+        by itself, so one client is shared by all requests and batches.
+        """
+        # Make sure authSource is specified properly
+        connection_uri = MONGO_URI
+
+        if "authSource" not in connection_uri and "?" not in connection_uri:
+            connection_uri += "?authSource=admin"
+        elif "authSource" not in connection_uri and "?" in connection_uri:
+            connection_uri += "&authSource=admin"
 
-                if "authSource" not in connection_uri and "?" not in connection_uri:
-                    connection_uri += "?authSource=admin"
-                elif "authSource" not in connection_uri and "?" in connection_uri:
-                    connection_uri += "&authSource=admin"
+        print(
+            f"Connecting to MongoDB with URI: {connection_uri.replace(connection_uri.split('@')[0], '***:***@')}"
+        )
 
-                print(
-                    f"Connecting to MongoDB with URI: {connection_uri.replace(connection_uri.split('@')[0], '***:***@')}"
-                )
+        # Create async MongoDB client
+        return motor.motor_asyncio.AsyncIOMotorClient(
+            connection_uri, serverSelectionTimeoutMS=5000  # 5 second timeout
+        )
 
-                # Create async MongoDB client
-                self.client = motor.motor_asyncio.AsyncIOMotorClient(
-                    connection_uri, serverSelectionTimeoutMS=5000  # 5 second timeout
-                )
+    async def connect_to_db(self) -> motor.motor_asyncio.AsyncIOMotorClient:
+        if self.client is None:
+            self.client = self.create_client()
 
+        for attempt in range(self.max_retries):
+            try:
                 # Test the connection using async operation
-                self.client.admin.command("ping")
+                await self.client.admin.command("ping")
                 print("Successfully connected to MongoDB")
                 self.is_connected = True
                 return self.client
@@ -56,14 +102,15 @@ class MongoDBManager:
                 print(f"Connection attempt {attempt+1}/{self.max_retries} failed: {e}")
                 if attempt < self.max_retries - 1:
                     print(f"Retrying in {self.retry_delay} seconds...")
-                    time.sleep(self.retry_delay)
+                    await asyncio.sleep(self.retry_delay)
                 else:
                     print("Failed to connect to MongoDB after maximum retries")
                     raise
 
     def get_db(self) -> motor.motor_asyncio.AsyncIOMotorDatabase:
-        if not self.is_connected:
-            self.connect_to_db()
+        # Operations wait for the server themselves: no blocking connection check here
+        if self.client is None:
+            self.client = self.create_client()
         self.db = self.client["model_monitoring"]
         return self.db
 
@@ -88,14 +135,23 @@ class MongoDBManager:
         """
         return self.get_collection("claim_detection_metrics")  # not a coroutine
 
+    @staticmethod
+    def standardize_created_at(metrics: dict) -> None:
+        """
+        Store the event time as a BSON date (UTC) in created_at
+        """
+        if "created_at" not in metrics and "timestamp" in metrics:
+            metrics["created_at"] = metrics["timestamp"]
+        if "created_at" in metrics:
+            metrics["created_at"] = event_time(metrics["created_at"])
+
     async def insert_evidence_metrics(self, metrics: dict) -> str:
         """
         Insert evidence retrieval metrics into MongoDB
         """
         try:
             # Add timestamp standardization
-            if "created_at" not in metrics and "timestamp" in metrics:
-                metrics["created_at"] = metrics["timestamp"]
+            self.standardize_created_at(metrics)
 
             collection = self.get_evidence_collection()
             result = await collection.insert_one(metrics)  # coroutine -> await
@@ -105,22 +161,77 @@ class MongoDBManager:
             print(f"Error inserting evidence metrics: {e}")
             raise
 
+    async def insert_pending(self, collection: motor.motor_asyncio.AsyncIOMotorCollection, documents: List[dict]) -> List[dict]:
+        """
+        Insert raw metric documents, whose _id is their event id, with one
+        write and flag them as pending_rollup until clear_pending_rollup.
+        Returns the documents to fold into the rollups: the inserted ones
+        and those an earlier attempt stored but did not fold
+        """
+        for document in documents:
+            document["pending_rollup"] = True
+        try:
+            await collection.insert_many(documents, ordered=False)
+            return documents
+        except BulkWriteError as e:
+            if not only_duplicate_keys(e):
+                raise
+            duplicates = {write_error["index"] for write_error in e.details["writeErrors"]}
+
+        inserted = [document for i, document in enumerate(documents) if i not in duplicates]
+        inserted_ids = {document["_id"] for document in inserted}
+        cursor = collection.find({
+            "_id": {"$in": [documents[i]["_id"] for i in duplicates]},
+            "pending_rollup": True,
+        })
+        stored = [document for document in await cursor.to_list(length=None) if document["_id"] not in inserted_ids]
+        return inserted + stored
+
+    async def clear_pending_rollup(self, collection: motor.motor_asyncio.AsyncIOMotorCollection, documents: List[dict]) -> None:
+        """
+        Unflag raw metric documents folded into the rollups
+        """
+        if documents:
+            await collection.update_many(
+                {"_id": {"$in": [document["_id"] for document in documents]}}, {"$unset": {"pending_rollup": ""}}
+            )
+
+    async def insert_evidence_metrics_many(self, batch: List[dict]) -> List[dict]:
+        """
+        Insert a batch of evidence retrieval metrics with one write and
+        return those to fold into the rollups (see insert_pending)
+        """
+        for metrics in batch:
+            self.standardize_created_at(metrics)
+
+        return await self.insert_pending(self.get_evidence_collection(), batch)
+
+    @staticmethod
+    def claim_documents(metrics: dict) -> List[dict]:
+        """
+        One document per claim of a claim annotation event, with the event id
+        and claim index as _id when the event has an id
+        """
+        event_id = metrics.get("event_id")
+        return [
+            {
+                **({"_id": f"{event_id}:{i}"} if event_id else {}),
+                "created_at": event_time(metrics["timestamp"]),
+                "claim_model_id": metrics["claim_model_ids"][i],
+                "claim_id": metrics["claim_ids"][i],
+                "annotation": metrics["claim_annotations"][i],
+                "prediction": metrics["claim_model_inferences"][i],
+            }
+            for i in range(len(metrics["claim_ids"]))
+        ]
+
     async def insert_claim_metrics(self, metrics: dict) -> List[str]:
         """
         Insert claim detection metrics into MongoDB
         Each claim is inserted as a separate document
         """
         try:
-            processed_metrics = [
-                {
-                    "created_at": metrics["timestamp"],
-                    "claim_model_id": metrics["claim_model_ids"][i],
-                    "claim_id": metrics["claim_ids"][i],
-                    "annotation": metrics["claim_annotations"][i],
-                    "prediction": metrics["claim_model_inferences"][i],
-                }
-                for i in range(len(metrics["claim_ids"]))
-            ]
+            processed_metrics = self.claim_documents(metrics)
 
             collection = self.get_claim_collection()
             results = await collection.insert_many(
@@ -134,6 +245,279 @@ class MongoDBManager:
             print(f"Error inserting claim metrics: {e}")
             raise
 
+    async def insert_claim_metrics_many(self, batch: List[dict]) -> List[dict]:
+        """
+        Insert the claims of a batch of claim annotation events with one write
+        and return those to fold into the rollups (see insert_pending)
+        """
+        documents = [document for metrics in batch for document in self.claim_documents(metrics)]
+
+        return await self.insert_pending(self.get_claim_collection(), documents)
+
+    def get_claim_votes_collection(self) -> motor.motor_asyncio.AsyncIOMotorCollection:
+        """
+        Get the majority votes per claim model and claim. Needed to update the
+        claim rollups: never expire or prune it without rebuilding them.
+        """
+        return self.get_collection("claim_votes")
+
+    def get_claim_rollup_collection(self) -> motor.motor_asyncio.AsyncIOMotorCollection:
+        """
+        Get the hourly and daily claim detection rollups
+        """
+        return self.get_collection("claim_metric_rollups")
+
+    def get_evidence_rollup_collection(self) -> motor.motor_asyncio.AsyncIOMotorCollection:
+        """
+        Get the hourly and daily evidence retrieval rollups
+        """
+        return self.get_collection("evidence_metric_rollups")
+
+    def get_rollup_state_collection(self) -> motor.motor_asyncio.AsyncIOMotorCollection:
+        """
+        Get the rollup generation, bumped by updates to settled hours
+        """
+        return self.get_collection("rollup_state")
+
+    async def bump_rollup_generation(self) -> None:
+        await self.get_rollup_state_collection().update_one(
+            {"_id": "generation"}, {"$inc": {"value": 1}}, upsert=True
+        )
+
+    async def get_rollup_generation(self) -> int:
+        state = await self.get_rollup_state_collection().find_one({"_id": "generation"})
+        return state["value"] if state else 0
+
+    async def apply_claim_moves(self, votes: List[dict]) -> None:
+        """
+        Apply the pending moves of claim votes to the claim rollups and clear them
+        """
+        updates = claim_move_updates(votes)
+        if not updates:
+            return
+        await self.get_claim_rollup_collection().bulk_write(updates, ordered=False)
+        await self.get_claim_votes_collection().update_many(
+            {"_id": {"$in": [vote["_id"] for vote in votes]}}, {"$set": {"pending": []}}
+        )
+        if any(is_settled(vote["first_at"]) for vote in votes if vote.get("pending")):
+            await self.bump_rollup_generation()
+
+    async def update_claim_rollups(self, documents: List[dict], dedup: bool = True) -> None:
+        """
+        Fold claim metric documents into the claim votes and rollups, once
+        per document unless dedup is off (rebuilds)
+        """
+        if not documents:
+            return
+        vote_ids = list({f"{document['claim_model_id']}|{document['claim_id']}" for document in documents})
+        cursor = self.get_claim_votes_collection().find({"_id": {"$in": vote_ids}})
+        votes = {vote["_id"]: vote for vote in await cursor.to_list(length=None)}
+
+        # Votes with moves left pending by a failed attempt are applied again
+        pending_votes = {vote["_id"] for vote in votes.values() if vote.get("pending")}
+        changed_votes = claim_vote_updates(documents, votes, utc_now() if dedup else None)
+        changed_ids = {vote["_id"] for vote in changed_votes}
+
+        # The votes (with the moves) first: a retry then finds and applies the same moves
+        if changed_votes:
+            await self.get_claim_votes_collection().bulk_write(
+                [ReplaceOne({"_id": vote["_id"]}, vote, upsert=True) for vote in changed_votes], ordered=False
+            )
+        await self.apply_claim_moves(changed_votes + [votes[vote_id] for vote_id in pending_votes - changed_ids])
+        await self.prune_applied()
+
+    async def update_evidence_rollups(self, batch: List[dict]) -> None:
+        """
+        Fold evidence retrieval metrics into the rollups
+        """
+        if not batch:
+            return
+        updates, example_updates = evidence_rollup_updates(batch)
+        await self.get_evidence_rollup_collection().bulk_write(updates, ordered=False)
+        # After the counts: an example is only set once its rollup exists
+        if example_updates:
+            await self.get_evidence_rollup_collection().bulk_write(example_updates, ordered=False)
+        if any(is_settled(event_time(metrics["created_at"])) for metrics in batch):
+            await self.bump_rollup_generation()
+
+    async def prune_applied(self) -> None:
+        """
+        Drop the claim document ids applied to the claim votes longer than
+        MONITORING_ROLLUP_DEDUP_HOURS ago, at most every ROLLUP_PRUNE_INTERVAL_S
+        """
+        if time.monotonic() - self.pruned_at < ROLLUP_PRUNE_INTERVAL_S:
+            return
+        self.pruned_at = time.monotonic()
+        cutoff = utc_now() - timedelta(hours=MONITORING_ROLLUP_DEDUP_HOURS)
+        await self.get_claim_votes_collection().update_many(
+            {"applied.at": {"$lt": cutoff}}, {"$pull": {"applied": {"at": {"$lt": cutoff}}}}
+        )
+
+    async def get_claim_rollups(
+        self, start_date: datetime, end_date: datetime
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the claim detection rollups combining to a date range
+        """
+        cursor = self.get_claim_rollup_collection().find(rollup_query(start_date, end_date))
+        return await cursor.to_list(length=None)
+
+    async def get_evidence_rollups(
+        self, start_date: datetime, end_date: datetime
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the evidence retrieval rollups combining to a date range
+        """
+        cursor = self.get_evidence_rollup_collection().find(rollup_query(start_date, end_date))
+        return await cursor.to_list(length=None)
+
+    async def migrate_string_dates(self, collection: motor.motor_asyncio.AsyncIOMotorCollection) -> int:
+        """
+        Convert created_at values stored as ISO strings to BSON dates
+        """
+        migrated = 0
+        while True:
+            cursor = collection.find({"created_at": {"$type": "string"}}, {"created_at": 1}).limit(ROLLUP_REBUILD_BATCH)
+            documents = await cursor.to_list(length=None)
+            if not documents:
+                return migrated
+            await collection.bulk_write(
+                [
+                    UpdateOne({"_id": document["_id"]}, {"$set": {"created_at": event_time(document["created_at"])}})
+                    for document in documents
+                ],
+                ordered=False,
+            )
+            migrated += len(documents)
+
+    async def ensure_ttl_index(self, collection: motor.motor_asyncio.AsyncIOMotorCollection, ttl_days: float) -> None:
+        """
+        Expire raw events ttl_days after created_at, or drop the expiry if ttl_days is 0
+        """
+        indexes = await collection.index_information()
+        ttl_index = indexes.get("created_at_1")
+        if not ttl_days:
+            if ttl_index and "expireAfterSeconds" in ttl_index:
+                await collection.drop_index("created_at_1")
+            await collection.create_index([("created_at", ASCENDING)])
+            return
+
+        expire_after_seconds = int(ttl_days * 24 * 3600)
+        if ttl_index is None:
+            await collection.create_index([("created_at", ASCENDING)], expireAfterSeconds=expire_after_seconds)
+        elif ttl_index.get("expireAfterSeconds") != expire_after_seconds:
+            # collMod sets the TTL on the existing index, which keeps serving range queries meanwhile
+            await self.get_db().command(
+                "collMod", collection.name, index={"name": "created_at_1", "expireAfterSeconds": expire_after_seconds}
+            )
+
+    async def rebuild_rollups(self) -> None:
+        """
+        Recompute the claim votes and all rollups from the raw metrics
+        """
+        for collection in (
+            self.get_claim_votes_collection(),
+            self.get_claim_rollup_collection(),
+            self.get_evidence_rollup_collection(),
+        ):
+            await collection.delete_many({})
+
+        await self.fold_raw_metrics({}, dedup=False)
+        await self.bump_rollup_generation()
+
+    async def fold_raw_metrics(self, query: dict, dedup: bool = True) -> None:
+        """
+        Fold the raw metrics matching query into the rollups and clear their
+        pending_rollup flags
+        """
+        for collection, update in (
+            (self.get_claim_collection(), lambda batch: self.update_claim_rollups(batch, dedup=dedup)),
+            (self.get_evidence_collection(), self.update_evidence_rollups),
+        ):
+            # Oldest first: a claim's first event decides its bucket
+            cursor = collection.find(query).sort("created_at", ASCENDING).batch_size(ROLLUP_REBUILD_BATCH)
+            batch = []
+            async for document in cursor:
+                batch.append(document)
+                if len(batch) == ROLLUP_REBUILD_BATCH:
+                    await update(batch)
+                    await self.clear_pending_rollup(collection, batch)
+                    batch = []
+            await update(batch)
+            await self.clear_pending_rollup(collection, batch)
+
+    async def raw_metrics_expire(self, ttl_days: float) -> bool:
+        """
+        Whether raw metrics are (or are about to be) expired by a TTL index
+        """
+        if ttl_days:
+            return True
+        for collection in (self.get_evidence_collection(), self.get_claim_collection()):
+            indexes = await collection.index_information()
+            if "expireAfterSeconds" in indexes.get("created_at_1", {}):
+                return True
+        return False
+
+    async def ensure_rollups(
+        self, rebuild: bool = False, force: bool = False, ttl_days: float = MONITORING_RAW_TTL_DAYS
+    ) -> None:
+        """
+        Create the rollup indexes, and rebuild the rollups if asked to or if
+        there are raw metrics but no rollups yet (before the rollups existed).
+        A rebuild only recomputes the raw metrics still stored: while they
+        expire, the rollups are the only record of older metrics, so an
+        explicit rebuild is refused unless forced
+        """
+        for collection in (self.get_claim_rollup_collection(), self.get_evidence_rollup_collection()):
+            await collection.create_index([("granularity", ASCENDING), ("bucket_start", ASCENDING)])
+        await self.get_claim_votes_collection().create_index([("applied.at", ASCENDING)])
+        for collection in (self.get_claim_collection(), self.get_evidence_collection()):
+            # Sparse: only the few raw metrics not folded yet have the flag
+            await collection.create_index([("pending_rollup", ASCENDING)], sparse=True)
+
+        if rebuild and not force and await self.raw_metrics_expire(ttl_days):
+            print(
+                "Not rebuilding the metric rollups: raw metrics expire after MONITORING_RAW_TTL_DAYS and the "
+                "rollups of older metrics would be lost. Set MONITORING_REBUILD_ROLLUPS=force to rebuild anyway"
+            )
+            rebuild = False
+
+        if not rebuild:
+            has_rollups = await self.get_claim_rollup_collection().find_one() or await self.get_evidence_rollup_collection().find_one()
+            has_metrics = await self.get_claim_collection().find_one() or await self.get_evidence_collection().find_one()
+            rebuild = not has_rollups and bool(has_metrics)
+
+        if rebuild:
+            print("Rebuilding metric rollups from the raw metrics")
+            await self.rebuild_rollups()
+            print("Metric rollups rebuilt")
+
+        # Raw metrics and claim vote moves a stopped consumer stored but did not fold yet
+        await self.fold_raw_metrics({"pending_rollup": True})
+        cursor = self.get_claim_votes_collection().find({"pending.0": {"$exists": True}})
+        await self.apply_claim_moves(await cursor.to_list(length=None))
+
+    async def prepare_collections(
+        self, rebuild_rollups: bool = False, force_rebuild: bool = False, ttl_days: float = MONITORING_RAW_TTL_DAYS
+    ) -> None:
+        """
+        Migrate string created_at values to BSON dates, bring the rollups up
+        to date and create the raw metric indexes: created_at (with the raw
+        event TTL) for range queries, and claim_model_id with created_at for
+        per-model claim queries
+        """
+        for collection in (self.get_evidence_collection(), self.get_claim_collection()):
+            migrated = await self.migrate_string_dates(collection)
+            if migrated:
+                print(f"Migrated {migrated} {collection.name} dates from strings to BSON dates")
+
+        # Before the TTL index: rollups missing for old events are rebuilt before those expire
+        await self.ensure_rollups(rebuild=rebuild_rollups, force=force_rebuild, ttl_days=ttl_days)
+
+        for collection in (self.get_evidence_collection(), self.get_claim_collection()):
+            await self.ensure_ttl_index(collection, ttl_days)
+        await self.get_claim_collection().create_index([("claim_model_id", ASCENDING), ("created_at", ASCENDING)])
+
     async def get_claim_metrics(
         self, start_date: datetime, end_date: datetime
     ) -> List[Dict[str, Any]]:
@@ -147,8 +531,8 @@ class MongoDBManager:
             cursor = collection.find(
                 {
                     "created_at": {
-                        "$gte": start_date.isoformat(),
-                        "$lte": end_date.isoformat(),
+                        "$gte": to_naive_utc(start_date),
+                        "$lte": to_naive_utc(end_date),
                     }
                 }
             )  # -> return a MotorCursor
@@ -173,8 +557,8 @@ class MongoDBManager:
             cursor = collection.find(
                 {
                     "created_at": {
-                        "$gte": start_date.isoformat(),
-                        "$lte": end_date.isoformat(),
+                        "$gte": to_naive_utc(start_date),
+                        "$lte": to_naive_utc(end_date),
                     }
                 }
             )  # -> return a MotorCursor
@@ -190,7 +574,8 @@ class MongoDBManager:
         """
         Close the MongoDB connection
         """
-        if self.client and self.is_connected:
+        if self.client:
             self.client.close()
+            self.client = None
             self.is_connected = False
             print("MongoDB connection closed")
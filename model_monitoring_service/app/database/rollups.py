@@ -0,0 +1,358 @@
+"""
+Hourly and daily rollups of the monitoring events.
+
+The consumer folds every batch of events into rollup documents keyed by
+granularity and bucket start, so /pipeline_metrics reads a few rollups per day
+of the requested range instead of the raw events:
+
+- claim_metric_rollups: confusion-matrix counts per claim model. A claim's
+  annotations and model predictions are majority-voted over all its events
+  (claim_votes keeps the votes), and the claim counts in the bucket of its
+  first event; a vote that changes the majority moves the claim to another
+  cell.
+- evidence_metric_rollups: query count, empty-result and close-match counts,
+  cache hits, score maxima, the first example claim of each kind and the
+  merged score sketches (score_sketch.py) of the vector-DB and web searches.
+
+Ranges are combined from daily rollups for whole days and hourly rollups for
+the hours around them, so the resolution of /pipeline_metrics is one hour.
+
+A batch the consumer retries after a failed or partial write is not counted
+twice. Raw events are stored with their event id as _id and a
+`pending_rollup` flag that is cleared once they are folded in, so a retry only
+folds the events it inserted and those an earlier attempt stored but did not
+fold (see MongoDBManager.insert_pending). A claim vote records the claim
+documents applied to it (`applied`, pruned after MONITORING_ROLLUP_DEDUP_HOURS)
+and its confusion-matrix moves until they are applied to the rollups
+(`pending`). The hourly and daily rollups themselves keep no per-event state.
+
+An hour is settled MONITORING_ROLLUP_SETTLE_S after it ends, once the events
+of the hour have gone through the queue. Updates to settled hours (a late
+event, a new vote on an older claim or a rebuild) bump the rollup generation,
+which tells the API to drop the metrics it cached for past ranges.
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from database.score_sketch import empty_sketch, increments, merge
+
+import dotenv
+import os
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+# Seconds after the end of an hour from which its events are expected to be ingested
+MONITORING_ROLLUP_SETTLE_S = float(os.getenv("MONITORING_ROLLUP_SETTLE_S", "300"))
+# Hours the claim votes keep the ids of the claim documents applied to them
+MONITORING_ROLLUP_DEDUP_HOURS = float(os.getenv("MONITORING_ROLLUP_DEDUP_HOURS", "6"))
+
+GRANULARITIES = ("hour", "day")
+
+# TODO: Justify these magic numbers
+CLOSE_MATCH_WEB_SIMILARITY = 0.6
+CLOSE_MATCH_VECTOR_DB_SCORE = 0.03
+
+EVIDENCE_COUNTS = (
+    "query_count",
+    "empty_vector_db",
+    "empty_web",
+    "close_match_web",
+    "close_match_vector_db",
+    "exact_match_web",
+    "vector_db_cache_hits",
+    "web_search_cache_hits",
+)
+
+EVIDENCE_MAXIMA = ("vector_db_score_max", "web_search_score_max")
+
+# Rollup sketch -> sketch field of the evidence retrieval metrics
+EVIDENCE_SKETCHES = {
+    "vector_db": "vector_db_search_scores_sketch",
+    "web_search": "web_search_cosine_similarity_sketch",
+}
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """
+    Event times are naive: aware datetimes are compared in UTC.
+    """
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def event_time(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return to_naive_utc(value)
+
+
+def bucket_start(value: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_id(granularity: str, start: datetime, *keys: str) -> str:
+    return "|".join([granularity, start.isoformat(), *keys])
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def is_settled(value: datetime, settle_s: float = MONITORING_ROLLUP_SETTLE_S) -> bool:
+    """
+    Whether the hour of an event time is settled.
+    """
+    return bucket_start(value, "hour") + timedelta(hours=1, seconds=settle_s) <= utc_now()
+
+
+def is_range_settled(end_date: datetime, settle_s: float = MONITORING_ROLLUP_SETTLE_S) -> bool:
+    """
+    Whether all hours the range ending at end_date combines are settled.
+    """
+    return is_settled(to_naive_utc(end_date) - timedelta(microseconds=1), settle_s)
+
+
+def rollup_ranges(start_date: datetime, end_date: datetime) -> List[Tuple[str, datetime, datetime]]:
+    """
+    (granularity, first bucket start, end) segments covering the buckets
+    that start in [start_date floored to the hour, end_date): whole days from
+    daily rollups, the hours before and after them from hourly rollups.
+    """
+    start = bucket_start(to_naive_utc(start_date), "hour")
+    end = to_naive_utc(end_date)
+
+    first_day = bucket_start(start, "day")
+    if first_day < start:
+        first_day += timedelta(days=1)
+    last_day_end = bucket_start(end, "day")
+
+    if first_day >= last_day_end:
+        return [("hour", start, end)]
+
+    ranges = [("day", first_day, last_day_end)]
+    if start < first_day:
+        ranges.append(("hour", start, first_day))
+    if last_day_end < end:
+        ranges.append(("hour", last_day_end, end))
+    return ranges
+
+
+def rollup_query(start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    return {
+        "$or": [
+            {"granularity": granularity, "bucket_start": {"$gte": start, "$lt": end}}
+            for granularity, start, end in rollup_ranges(start_date, end_date)
+        ]
+    }
+
+
+def majority(votes: Dict[str, int]) -> Optional[str]:
+    """
+    Most frequent label; ties go to the smallest label, as pandas mode()[0].
+    """
+    if not votes:
+        return None
+    top = max(votes.values())
+    return min((label for label, count in votes.items() if count == top), key=int)
+
+
+def label_key(value) -> str:
+    return str(int(value))
+
+
+def claim_vote_updates(
+    documents: Iterable[Dict[str, Any]], votes: Dict[str, Dict[str, Any]], applied_at: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """
+    Fold claim metric documents into the claim votes and return the changed
+    vote documents. `votes` holds the stored votes of the claims in the
+    documents, keyed by vote id, and is updated. Documents already applied
+    to their vote are skipped; a document that changes the majority adds its
+    move of the claim to the vote's pending moves (see claim_move_updates).
+    """
+    changed = set()
+
+    for document in documents:
+        model_id = str(document["claim_model_id"])
+        vote_id = f"{model_id}|{document['claim_id']}"
+        created_at = event_time(document["created_at"])
+        event_id = str(document["_id"])
+
+        state = votes.setdefault(vote_id, {
+            "_id": vote_id,
+            "claim_model_id": model_id,
+            "claim_id": str(document["claim_id"]),
+            "first_at": created_at,
+            "annotations": {},
+            "predictions": {},
+        })
+        state.setdefault("applied", [])
+        state.setdefault("pending", [])
+        if any(applied["id"] == event_id for applied in state["applied"]):
+            continue
+        old_cell = (majority(state["predictions"]), majority(state["annotations"]))
+
+        annotation, prediction = label_key(document["annotation"]), label_key(document["prediction"])
+        state["annotations"][annotation] = state["annotations"].get(annotation, 0) + 1
+        state["predictions"][prediction] = state["predictions"].get(prediction, 0) + 1
+        new_cell = (majority(state["predictions"]), majority(state["annotations"]))
+        if applied_at is not None:
+            state["applied"].append({"id": event_id, "at": applied_at})
+        changed.add(vote_id)
+
+        if new_cell == old_cell:
+            continue
+        move = {f"confusion.{'_'.join(new_cell)}": 1}
+        if old_cell[0] is not None:
+            move[f"confusion.{'_'.join(old_cell)}"] = -1
+        state["pending"].append({"id": event_id, "inc": move})
+
+    return [votes[vote_id] for vote_id in changed]
+
+
+def claim_move_updates(votes: Iterable[Dict[str, Any]]) -> List[UpdateOne]:
+    """
+    Rollup updates applying the pending moves of the claim votes.
+    """
+    deltas = Counter()
+    for vote in votes:
+        for move in vote.get("pending", []):
+            for granularity in GRANULARITIES:
+                key = (granularity, bucket_start(vote["first_at"], granularity), vote["claim_model_id"])
+                for field, delta in move["inc"].items():
+                    deltas[(*key, field)] += delta
+
+    return [
+        UpdateOne(
+            {"_id": rollup_id(granularity, start, model_id)},
+            {
+                "$inc": {field: delta},
+                "$setOnInsert": {"granularity": granularity, "bucket_start": start, "claim_model_id": model_id},
+            },
+            upsert=True,
+        )
+        for (granularity, start, model_id, field), delta in deltas.items()
+        if delta
+    ]
+
+
+def evidence_values(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "query_count": 1,
+        "empty_vector_db": int(data["vector_db_search_size"] == 0),
+        "empty_web": int(data["web_search_size"] == 0),
+        "close_match_web": int(data["web_search_cosine_similarity_max"] > CLOSE_MATCH_WEB_SIMILARITY),
+        "close_match_vector_db": int(data["vector_db_search_scores_max"] > CLOSE_MATCH_VECTOR_DB_SCORE),
+        "exact_match_web": int(data["web_search_cosine_similarity_max"] == 1),
+        # Events before the evidence retrieval cache have no flag
+        "vector_db_cache_hits": int(bool(data.get("vector_db_cache_hit"))),
+        "web_search_cache_hits": int(bool(data.get("web_search_cache_hit"))),
+    }
+
+
+def evidence_examples(values: Dict[str, Any]) -> List[str]:
+    examples = []
+    if values["empty_vector_db"]:
+        examples.append("no_evidence_milvus_hybrid_search")
+    if values["empty_web"]:
+        examples.append("no_evidence_web_search")
+    if values["close_match_web"]:
+        examples.append("high_match_websearch")
+    if values["close_match_vector_db"]:
+        examples.append("high_match_milvus_hybrid_search")
+    return examples
+
+
+def evidence_rollup_updates(events: Iterable[Dict[str, Any]]) -> Tuple[List[UpdateOne], List[UpdateOne]]:
+    """
+    Rollup updates for evidence retrieval events (documents with `data`
+    and `created_at`): (count updates, example updates), one per rollup.
+    Examples are only set on rollups that have none yet, so they are
+    written after the counts.
+    """
+    buckets: Dict[Tuple[str, datetime], Dict[str, Any]] = {}
+    examples: Dict[Tuple[str, datetime], Dict[str, Any]] = {}
+    for event in events:
+        data = event["data"]
+        created_at = event_time(event["created_at"])
+        values = evidence_values(data)
+        example_data = {key: value for key, value in data.items() if key not in EVIDENCE_SKETCHES.values()}
+        for granularity in GRANULARITIES:
+            start = bucket_start(created_at, granularity)
+            bucket = buckets.setdefault(
+                (granularity, start),
+                {"counts": Counter(), "maxima": {}, "sketches": {name: empty_sketch() for name in EVIDENCE_SKETCHES}},
+            )
+            bucket["counts"].update(values)
+            for field, value in (
+                ("vector_db_score_max", data["vector_db_search_scores_max"]),
+                ("web_search_score_max", data["web_search_cosine_similarity_max"]),
+            ):
+                bucket["maxima"][field] = max(bucket["maxima"].get(field, value), value)
+            for name, field in EVIDENCE_SKETCHES.items():
+                # Events before the sketches have none
+                merge(bucket["sketches"][name], data.get(field))
+            for example in evidence_examples(values):
+                examples.setdefault((granularity, start), {}).setdefault(example, example_data)
+
+    updates = []
+    for (granularity, start), bucket in buckets.items():
+        sketch_increments = {}
+        for name, sketch in bucket["sketches"].items():
+            if sketch["count"]:
+                sketch_increments.update(increments(sketch, f"sketches.{name}"))
+        updates.append(UpdateOne(
+            {"_id": rollup_id(granularity, start)},
+            {
+                "$inc": {**bucket["counts"], **sketch_increments},
+                "$max": bucket["maxima"],
+                "$setOnInsert": {"granularity": granularity, "bucket_start": start},
+            },
+            upsert=True,
+        ))
+    example_updates = [
+        UpdateOne(
+            {"_id": rollup_id(granularity, start), f"examples.{example}": {"$exists": False}},
+            {"$set": {f"examples.{example}": data}},
+        )
+        for (granularity, start), bucket_examples in examples.items()
+        for example, data in bucket_examples.items()
+    ]
+    return updates, example_updates
+
+
+def combine_claim_rollups(rollups: Iterable[Dict[str, Any]]) -> Counter:
+    """
+    Confusion-matrix counts of the rollups, keyed by (prediction, annotation).
+    """
+    confusion = Counter()
+    for rollup in rollups:
+        for cell, count in rollup.get("confusion", {}).items():
+            prediction, annotation = cell.split("_")
+            confusion[(int(prediction), int(annotation))] += count
+    return Counter({cell: count for cell, count in confusion.items() if count > 0})
+
+
+def combine_evidence_rollups(rollups: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    combined = {field: 0 for field in EVIDENCE_COUNTS + EVIDENCE_MAXIMA}
+    examples = {}
+    sketches = {name: empty_sketch() for name in EVIDENCE_SKETCHES}
+    for rollup in sorted(rollups, key=lambda rollup: rollup["bucket_start"]):
+        for field in EVIDENCE_COUNTS:
+            combined[field] += rollup.get(field, 0)
+        for field in EVIDENCE_MAXIMA:
+            if field in rollup:
+                combined[field] = max(combined[field], rollup[field])
+        for example, data in rollup.get("examples", {}).items():
+            examples.setdefault(example, data)
+        for name, sketch in rollup.get("sketches", {}).items():
+            merge(sketches[name], sketch)
+    combined["examples"] = examples
+    combined["sketches"] = sketches
+    return combined
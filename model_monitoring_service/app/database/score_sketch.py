@@ -0,0 +1,178 @@
+"""
+Mergeable quantile sketches of search scores.
+
+A sketch is a histogram over logarithmic bins (as in DDSketch): a value x > 0
+falls in bin ceil(log(x) / log(GAMMA)), negative values in the same bins of
+-x, and values close to 0 in a zero count. The bins are fixed, so sketches
+merge by adding their counts (a $inc in the monitoring rollups), and any
+quantile is answered within RELATIVE_ACCURACY of a true value. Scores in
+[1e-4, 1] use at most ~460 bins per sign.
+
+The evidence retrieval service builds a sketch per search and publishes it
+with the other metrics; the monitoring service merges them per rollup. This
+module is duplicated in both services and must stay the same in both.
+
+    {"count": 12, "zero": 0, "positive": {"-188": 3, "-170": 9}, "negative": {}}
+
+Bin indexes are strings, as MongoDB document keys.
+"""
+import bisect
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+# Values of smaller magnitude count as 0
+MIN_VALUE = 1e-9
+
+Sketch = Dict[str, object]
+
+
+def empty_sketch() -> Sketch:
+    return {"count": 0, "zero": 0, "positive": {}, "negative": {}}
+
+
+def is_valid_sketch(sketch) -> bool:
+    """
+    Whether a received sketch has the layout of empty_sketch with integer
+    counts and bin indexes.
+    """
+    if not isinstance(sketch, dict) or set(sketch) != {"count", "zero", "positive", "negative"}:
+        return False
+    counts = [sketch["count"], sketch["zero"]]
+    for sign in ("positive", "negative"):
+        if not isinstance(sketch[sign], dict):
+            return False
+        for index, count in sketch[sign].items():
+            if not isinstance(index, str) or not index.lstrip("-").isdigit():
+                return False
+            counts.append(count)
+    return all(isinstance(count, int) and not isinstance(count, bool) and count >= 0 for count in counts)
+
+
+def bin_index(magnitude: float) -> str:
+    return str(math.ceil(math.log(magnitude) / LOG_GAMMA))
+
+
+def bin_value(index: str) -> float:
+    # Point of the bin (GAMMA^(i-1), GAMMA^i] with the lowest relative error
+    return 2 * GAMMA ** int(index) / (GAMMA + 1)
+
+
+def add(sketch: Sketch, value: float, count: int = 1) -> None:
+    sketch["count"] += count
+    if abs(value) < MIN_VALUE:
+        sketch["zero"] += count
+        return
+    bins = sketch["positive"] if value > 0 else sketch["negative"]
+    index = bin_index(abs(value))
+    bins[index] = bins.get(index, 0) + count
+
+
+def build_sketch(values: Iterable[float]) -> Sketch:
+    sketch = empty_sketch()
+    for value in values:
+        add(sketch, float(value))
+    return sketch
+
+
+def merge(target: Sketch, sketch: Optional[Sketch]) -> Sketch:
+    """
+    Add the counts of sketch to target.
+    """
+    if not sketch:
+        return target
+    target["count"] += sketch.get("count", 0)
+    target["zero"] += sketch.get("zero", 0)
+    for sign in ("positive", "negative"):
+        bins = target[sign]
+        for index, count in sketch.get(sign, {}).items():
+            bins[index] = bins.get(index, 0) + count
+    return target
+
+
+def increments(sketch: Sketch, prefix: str) -> Dict[str, int]:
+    """
+    The sketch as $inc operations on the sketch stored at `prefix`.
+    """
+    fields = {f"{prefix}.count": sketch["count"], f"{prefix}.zero": sketch["zero"]}
+    for sign in ("positive", "negative"):
+        for index, count in sketch[sign].items():
+            fields[f"{prefix}.{sign}.{index}"] = count
+    return fields
+
+
+def ordered_bins(sketch: Sketch) -> List[Tuple[float, int]]:
+    """
+    (bin value, count) of the non-empty bins, in ascending value order.
+    """
+    bins = [(-bin_value(index), count) for index, count in sketch["negative"].items() if count > 0]
+    if sketch["zero"] > 0:
+        bins.append((0.0, sketch["zero"]))
+    bins += [(bin_value(index), count) for index, count in sketch["positive"].items() if count > 0]
+    return sorted(bins)
+
+
+def quantile(sketch: Sketch, q: float) -> Optional[float]:
+    if sketch["count"] <= 0:
+        return None
+    rank = q * (sketch["count"] - 1)
+    seen = 0
+    bins = ordered_bins(sketch)
+    for value, count in bins:
+        seen += count
+        if seen > rank:
+            return value
+    return bins[-1][0]
+
+
+def cdf(sketch: Sketch) -> Callable[[float], float]:
+    """
+    Empirical distribution function of the sketch: fraction of the values <= x.
+    """
+    values, cumulative, seen = [], [], 0
+    for value, count in ordered_bins(sketch):
+        seen += count
+        values.append(value)
+        cumulative.append(seen / sketch["count"])
+
+    def fraction(x: float) -> float:
+        position = bisect.bisect_right(values, x)
+        return cumulative[position - 1] if position else 0.0
+
+    return fraction
+
+
+def ks_statistic(sketch: Sketch, reference: Sketch) -> Optional[float]:
+    """
+    Largest distance between the two empirical distributions (Kolmogorov-Smirnov).
+    """
+    if sketch["count"] <= 0 or reference["count"] <= 0:
+        return None
+    sketch_cdf, reference_cdf = cdf(sketch), cdf(reference)
+    values = {value for value, _ in ordered_bins(sketch)} | {value for value, _ in ordered_bins(reference)}
+    return max(abs(sketch_cdf(value) - reference_cdf(value)) for value in values)
+
+
+def population_stability_index(sketch: Sketch, reference: Sketch, buckets: int = 10) -> Optional[float]:
+    """
+    PSI of the sketch against the reference, over the reference's deciles
+    (or `buckets` quantiles). Below 0.1 is usually read as stable, above 0.25
+    as a significant shift.
+    """
+    if sketch["count"] <= 0 or reference["count"] <= 0:
+        return None
+    edges = sorted({quantile(reference, k / buckets) for k in range(1, buckets)})
+
+    def fractions(sketch):
+        fraction = cdf(sketch)
+        cumulative = [fraction(edge) for edge in edges] + [1.0]
+        return [high - low for low, high in zip([0.0] + cumulative[:-1], cumulative)]
+
+    # Empty buckets would make the index infinite
+    epsilon = 1e-4
+    return sum(
+        (actual - expected) * math.log((actual + epsilon) / (expected + epsilon))
+        for actual, expected in zip(fractions(sketch), fractions(reference))
+    )
@@ -1,4 +1,6 @@
-from fastapi import FastAPI, HTTPException, Depends
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Depends, Request
 
 from pydantic.functional_validators import BeforeValidator
 
@@ -8,25 +10,37 @@ from dateutil.parser import parse
 
 from datetime import datetime
 
+from pymongo.errors import ConnectionFailure
+
 from database.mongodb import MongoDBManager
 
-from pipeline_metric_service import PipelineMetricService
+from metrics_cache import PipelineMetricsCache
+
+from pipeline_metric_service import DEFAULT_PERCENTILES, PipelineMetricService
 
 from model import PipelineMetricsResponse
 
-import motor.motor_asyncio
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One MongoDBManager and Motor client for all requests
+    mongo_manager = MongoDBManager()
+    try:
+        await mongo_manager.connect_to_db()
+    except Exception as e:
+        print(f"Error initializing MongoDBManager: {e}")
+        raise
+    app.state.mongo_manager = mongo_manager
+    app.state.metrics_cache = PipelineMetricsCache(mongo_manager.get_rollup_generation)
+    yield
+    mongo_manager.close()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
-# Initialize MongoDBManager and load collections
-try:
-    mongo_manager = MongoDBManager()
-    client = mongo_manager.connect_to_db()
-    db = client.model_monitoring
-    
-except Exception as e:
-    print(f"Error initializing MongoDBManager: {e}")
-    raise
+def get_mongo_manager(request: Request) -> MongoDBManager:
+    return request.app.state.mongo_manager
+
+def get_metrics_cache(request: Request) -> PipelineMetricsCache:
+    return request.app.state.metrics_cache
 
 # Represents an ObjectId field in the database.
 # It will be represented as a `str` on the model so that it can be serialized to JSON.
@@ -41,7 +55,13 @@ def read_root():
     "/pipeline_metrics",
     response_model=PipelineMetricsResponse,
 )
-async def get_pipeline_metrics(start_date: str, end_date: str, db: motor.motor_asyncio.AsyncIOMotorDatabase = Depends(MongoDBManager)):
+async def get_pipeline_metrics(
+    start_date: str,
+    end_date: str,
+    percentiles: str = ",".join(f"{percentile:g}" for percentile in DEFAULT_PERCENTILES),
+    db: MongoDBManager = Depends(get_mongo_manager),
+    metrics_cache: PipelineMetricsCache = Depends(get_metrics_cache),
+):
     # validate start_date and end_date
     try:
         
@@ -59,12 +79,44 @@ async def get_pipeline_metrics(start_date: str, end_date: str, db: motor.motor_a
     except ValueError as e:
     
         raise HTTPException(status_code=400, detail=f"Invalid date format: {e}")
+    
+    # validate percentiles, e.g. "50,90,99.9"
+    try:
         
-    # validate start_date and end_date
-    pipeline_metric_service = PipelineMetricService(
-        db, 
-        start_date, 
-        end_date
-        )
+        percentiles = tuple(float(percentile) for percentile in percentiles.split(","))
+    
+    except ValueError as e:
+    
+        raise HTTPException(status_code=400, detail=f"Invalid percentiles: {e}")
+    
+    if not all(0 <= percentile <= 100 for percentile in percentiles):
+        
+        raise HTTPException(status_code=400, detail="Percentiles must be between 0 and 100")
+        
+    try:
+        
+        cached = await metrics_cache.get(start_date, end_date, percentiles)
         
-    return await pipeline_metric_service.get_metrics()
\ No newline at end of file
+        if cached is not None:
+            return cached
+        
+        # Generation the response is computed at: it is not cached if the rollups change meanwhile
+        generation = metrics_cache.generation
+        
+        # Combine the rollups of the range
+        pipeline_metric_service = PipelineMetricService(
+            db, 
+            start_date, 
+            end_date,
+            percentiles
+            )
+        
+        response = await pipeline_metric_service.get_metrics()
+        
+        await metrics_cache.set(start_date, end_date, percentiles, response, generation)
+    
+    except ConnectionFailure as e:
+        # The client reconnects by itself: later requests succeed once MongoDB is back
+        raise HTTPException(status_code=503, detail=f"MongoDB unavailable: {e}")
+    
+    return response
\ No newline at end of file
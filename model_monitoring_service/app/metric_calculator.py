@@ -1,9 +1,10 @@
 from sklearn.metrics import f1_score, precision_score, recall_score, accuracy_score
-from typing import List
+from typing import List, Optional
 
-def calculate_metrics(y_true: List[int], y_pred: List[int]):
+def calculate_metrics(y_true: List[int], y_pred: List[int], sample_weight: Optional[List[int]] = None):
     """
     Calculate the metrics for the model
+    sample_weight counts each (y_true, y_pred) pair, e.g. a confusion-matrix cell
     """
     if len(y_true) == 0 or len(y_pred) == 0:
         return {
@@ -16,11 +17,11 @@ def calculate_metrics(y_true: List[int], y_pred: List[int]):
             "accuracy": 0
         }
     return {
-        "f1_score": f1_score(y_true, y_pred),
-        "f1_micro": f1_score(y_true, y_pred, average="micro"),
-        "f1_macro": f1_score(y_true, y_pred, average="macro"),
-        "f1_weighted": f1_score(y_true, y_pred, average="weighted"),
-        "precision": precision_score(y_true, y_pred),
-        "recall": recall_score(y_true, y_pred),
-        "accuracy": accuracy_score(y_true, y_pred)
+        "f1_score": f1_score(y_true, y_pred, sample_weight=sample_weight),
+        "f1_micro": f1_score(y_true, y_pred, average="micro", sample_weight=sample_weight),
+        "f1_macro": f1_score(y_true, y_pred, average="macro", sample_weight=sample_weight),
+        "f1_weighted": f1_score(y_true, y_pred, average="weighted", sample_weight=sample_weight),
+        "precision": precision_score(y_true, y_pred, sample_weight=sample_weight),
+        "recall": recall_score(y_true, y_pred, sample_weight=sample_weight),
+        "accuracy": accuracy_score(y_true, y_pred, sample_weight=sample_weight)
     }
\ No newline at end of file
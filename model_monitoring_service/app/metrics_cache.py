@@ -0,0 +1,108 @@
+"""
+Cache of computed /pipeline_metrics responses, keyed by the requested range
+and percentiles.
+
+Ranges that reach into an unsettled hour (see database/rollups.py) can still
+change with every ingested batch and expire after MONITORING_CACHE_TTL_S.
+Settled ranges are kept until they are evicted or the rollup generation
+changes, which happens when a late event, a new vote on an older claim or a
+rebuild updates a settled hour. A response is only stored if the generation
+did not change while it was computed, otherwise it could hold the rollups
+from before the update.
+"""
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional, Sequence, Tuple
+
+from database.rollups import is_range_settled
+from model import PipelineMetricsResponse
+
+import dotenv
+import os
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+MONITORING_CACHE_SIZE = int(os.getenv("MONITORING_CACHE_SIZE", "256"))
+MONITORING_CACHE_TTL_S = float(os.getenv("MONITORING_CACHE_TTL_S", "60"))
+MONITORING_CACHE_GENERATION_CHECK_S = float(os.getenv("MONITORING_CACHE_GENERATION_CHECK_S", "30"))
+
+
+class PipelineMetricsCache:
+    """
+    LRU cache of PipelineMetricsResponse per (start_date, end_date, percentiles).
+
+    `get_generation` returns the current rollup generation; it is awaited at
+    most every `generation_check_s` seconds.
+    """
+
+    def __init__(
+        self,
+        get_generation: Callable[[], Awaitable[Any]],
+        max_size: int = MONITORING_CACHE_SIZE,
+        ttl_s: float = MONITORING_CACHE_TTL_S,
+        generation_check_s: float = MONITORING_CACHE_GENERATION_CHECK_S,
+    ):
+        self.get_generation = get_generation
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.generation_check_s = generation_check_s
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self.generation = None
+        self.generation_checked_at = float("-inf")
+
+    @staticmethod
+    def key(start_date: datetime, end_date: datetime, percentiles: Sequence[float]) -> Tuple[str, str, Tuple[float, ...]]:
+        return start_date.isoformat(), end_date.isoformat(), tuple(percentiles)
+
+    async def check_generation(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if force or now - self.generation_checked_at >= self.generation_check_s:
+            generation = await self.get_generation()
+            if generation != self.generation:
+                # Settled hours were updated: drop everything computed before
+                self.entries.clear()
+                self.generation = generation
+            self.generation_checked_at = now
+
+    async def get(
+        self, start_date: datetime, end_date: datetime, percentiles: Sequence[float]
+    ) -> Optional[PipelineMetricsResponse]:
+        await self.check_generation()
+        key = self.key(start_date, end_date, percentiles)
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    async def set(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        percentiles: Sequence[float],
+        response: PipelineMetricsResponse,
+        generation: Any,
+    ) -> None:
+        """
+        Store a response computed at `generation`, the cache's generation
+        right after the get that missed, if it is still current.
+        """
+        await self.check_generation(force=True)
+        if generation != self.generation:
+            return
+        key = self.key(start_date, end_date, percentiles)
+        expires_at = float("inf") if is_range_settled(end_date) else time.monotonic() + self.ttl_s
+        self.entries[key] = (response, expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"generation": self.generation, "size": len(self.entries), "hits": self.hits, "misses": self.misses}
@@ -14,6 +14,20 @@ class ModelMetrics(BaseModel):
     f1_macro: float = 0.0
     f1_weighted: float = 0.0
 
+class DistributionDrift(BaseModel):
+    """Drift of a score distribution against the same-length range before it"""
+    reference_start_date: datetime
+    reference_end_date: datetime
+    reference_count: int = 0
+    ks_statistic: Optional[float] = None
+    psi: Optional[float] = None
+
+class ScoreDistribution(BaseModel):
+    """Percentiles of a search score, from the merged score sketches (within 1%)"""
+    count: int = 0
+    percentiles: Dict[str, Optional[float]] = {}
+    drift: Optional[DistributionDrift] = None
+
 class EvidenceRetrievalMetrics(BaseModel):
     """Metrics for evidence retrieval model"""
     start_date: datetime
@@ -30,6 +44,10 @@ class EvidenceRetrievalMetrics(BaseModel):
     example_claim_no_evidence_web_search: Optional[Dict[str, Any]]
     example_claim_high_match_websearch: Optional[Dict[str, Any]]
     example_claim_high_match_milvus_hybrid_search: Optional[Dict[str, Any]]
+    vector_db_cache_hit_rate: float = 0.0
+    web_search_cache_hit_rate: float = 0.0
+    vector_db_score_distribution: Optional[ScoreDistribution] = None
+    web_search_similarity_distribution: Optional[ScoreDistribution] = None
     
 class PipelineMetricsResponse(BaseModel):
     """Response model for pipeline metrics endpoint"""
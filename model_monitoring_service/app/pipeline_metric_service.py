@@ -1,52 +1,58 @@
 from datetime import datetime
-import pandas as pd
+from typing import Dict, Optional, Sequence
 
 import motor.motor_asyncio
 
+from database.rollups import combine_claim_rollups, combine_evidence_rollups
+from database.score_sketch import Sketch, population_stability_index, ks_statistic, quantile
 from metric_calculator import calculate_metrics
-from model import ModelMetrics, EvidenceRetrievalMetrics, PipelineMetricsResponse
+from model import (
+    DistributionDrift,
+    ModelMetrics,
+    EvidenceRetrievalMetrics,
+    PipelineMetricsResponse,
+    ScoreDistribution,
+)
 
-# Set display options
-pd.set_option('display.max_columns', None)  # Show all columns
-pd.set_option('display.max_rows', None)     # Show all rows
-pd.set_option('display.width', None)        # Width of the display in characters
-pd.set_option('display.max_colwidth', None) # Full width of each column
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
 
 class PipelineMetricService:
+    """
+    Pipeline metrics of a date range, combined from the hourly and daily
+    rollups the monitoring consumer maintains (database/rollups.py), so the
+    range is aligned to whole hours. Score distributions drift against the
+    range of the same length right before it.
+    """
     def __init__(
         self, 
         db: motor.motor_asyncio.AsyncIOMotorDatabase, 
         start_date: datetime, 
-        end_date: datetime
+        end_date: datetime,
+        percentiles: Sequence[float] = DEFAULT_PERCENTILES
         ):
         self.db = db
         self.start_date= start_date
         self.end_date = end_date
+        self.percentiles = percentiles
+        self.reference_start_date = start_date - (end_date - start_date)
+        self.reference_end_date = start_date
     
     async def get_claim_metrics(self) -> ModelMetrics:
-        claim_metrics = await self.db.get_claim_metrics(self.start_date, self.end_date)
+        claim_rollups = await self.db.get_claim_rollups(self.start_date, self.end_date)
         
-        print(f"*** MYDEBUG claim_metrics: {claim_metrics}")
+        # Claims per (prediction, annotation), both majority-voted over the claim's events: e.g. if 2 out of 3 annotations for same claim_model_id and claim_id are positive, then the annotation is positive
+        confusion = combine_claim_rollups(claim_rollups)
         
-        if claim_metrics and isinstance(claim_metrics, list) and len(claim_metrics) > 0:
-            claim_metrics_df = pd.DataFrame(claim_metrics)
-            
-            # For annotations: use majority voting: e.g. if 2 out of 3 annotations for same claim_model_id and claim_id are positive, then the annotation is positive
-            claim_mv_annotation_prediction_df = claim_metrics_df.groupby(['claim_model_id', 'claim_id']).agg({
-                    'annotation': lambda x: x.mode()[0], # Majority voting
-                    'prediction': lambda x: x.mode()[0] # Majority voting
-                }).reset_index()
-            
-            print(f"*** MYDEBUG claim_mv_annotation_prediction_df: {claim_mv_annotation_prediction_df}")
-            
+        if confusion:
             # Number of claims
-            sample_count = claim_mv_annotation_prediction_df.shape[0]
+            sample_count = sum(confusion.values())
             
-            # Calculate metrics
-            prediction_list = claim_mv_annotation_prediction_df["prediction"].tolist()
-            annotation_list = claim_mv_annotation_prediction_df["annotation"].tolist()
+            # Calculate metrics, one weighted sample per confusion-matrix cell
+            cells = list(confusion.items())
+            prediction_list = [prediction for (prediction, _), _ in cells]
+            annotation_list = [annotation for (_, annotation), _ in cells]
             
-            metrics = calculate_metrics(prediction_list, annotation_list)
+            metrics = calculate_metrics(prediction_list, annotation_list, sample_weight=[count for _, count in cells])
             
             model_metrics = ModelMetrics(
                 start_date=self.start_date,
@@ -65,47 +71,74 @@ class PipelineMetricService:
             
         return model_metrics
     
+    def score_distribution(self, sketch: Sketch, reference: Sketch) -> ScoreDistribution:
+        percentiles: Dict[str, Optional[float]] = {
+            f"p{percentile:g}": quantile(sketch, percentile / 100) for percentile in self.percentiles
+        }
+        drift = DistributionDrift(
+            reference_start_date=self.reference_start_date,
+            reference_end_date=self.reference_end_date,
+            reference_count=reference["count"],
+            ks_statistic=ks_statistic(sketch, reference),
+            psi=population_stability_index(sketch, reference),
+        )
+        return ScoreDistribution(count=sketch["count"], percentiles=percentiles, drift=drift)
+    
     async def get_evidence_metrics(self) -> EvidenceRetrievalMetrics:
-        evidence_metrics = await self.db.get_evidence_metrics(self.start_date, self.end_date)
+        evidence_rollups = await self.db.get_evidence_rollups(self.start_date, self.end_date)
+        
+        combined = combine_evidence_rollups(evidence_rollups)
         
-        metrics_data = [evidence_metric["data"] for evidence_metric in evidence_metrics]
+        reference_sketches = combine_evidence_rollups(
+            await self.db.get_evidence_rollups(self.reference_start_date, self.reference_end_date)
+        )["sketches"]
         
-        query_count = len(metrics_data)
+        query_count = combined["query_count"]
+        
+        def frequency(count: int) -> float:
+            return count / query_count if query_count > 0 else 0
         
         sample_metrics = {}
         
         # Are we more likely to find empty search results from milvus_hybrid_search? vector_db_search_size = web_search_size = 0
-        sample_metrics["freq_empty_milvus_hybrid_search"] = sum(1 if metric["vector_db_search_size"] == 0 else 0 for metric in metrics_data) / len(metrics_data) if len(metrics_data) > 0 else 0
+        sample_metrics["freq_empty_milvus_hybrid_search"] = frequency(combined["empty_vector_db"])
         
         # Are we more likely to find empty search results from web_search? vector_db_search_size = web_search_size = 0
-        sample_metrics["freq_empty_web_search"] = sum(1 if metric["web_search_size"] == 0 else 0 for metric in metrics_data) / len(metrics_data) if len(metrics_data) > 0 else 0
+        sample_metrics["freq_empty_web_search"] = frequency(combined["empty_web"])
         
         # Are we more likely to find close match in websearch? Frequency of cosine similarity > 0.6 <= TODO: Justify this magic number
-        sample_metrics["frq_close_match_websearch"] = sum(1 if metric["web_search_cosine_similarity_max"] > 0.6 else 0 for metric in metrics_data) / len(metrics_data) if len(metrics_data) > 0 else 0
+        sample_metrics["frq_close_match_websearch"] = frequency(combined["close_match_web"])
         
         # Are we more likely to find close match in websearch? Frequency of reranker score > 0.03 <= TODO: Justify this magic number
-        sample_metrics["frq_close_match_milvus_hybrid_search"] = sum(1 if metric["vector_db_search_scores_max"] > 0.03 else 0 for metric in metrics_data) / len(metrics_data) if len(metrics_data) > 0 else 0
+        sample_metrics["frq_close_match_milvus_hybrid_search"] = frequency(combined["close_match_vector_db"])
 
         # How many exact match we found from websearch? 
-        sample_metrics["n_exact_match_websearch"] = sum(1 if metric["web_search_cosine_similarity_max"] == 1 else 0 for metric in metrics_data)
+        sample_metrics["n_exact_match_websearch"] = combined["exact_match_web"]
         
         # What is the max score of the milvus_hybrid_search? >> Do we have high match in the search at all
-        sample_metrics["milvus_hybrid_search_score_max"] = max(metric["vector_db_search_scores_max"] for metric in metrics_data) if len(metrics_data) > 0 else 0
+        sample_metrics["milvus_hybrid_search_score_max"] = combined["vector_db_score_max"]
         
         # What is the max score of the web_search? >> Do we have high match in the search at all
-        sample_metrics["web_search_score_max"] = max(metric["web_search_cosine_similarity_max"] for metric in metrics_data) if len(metrics_data) > 0 else 0
+        sample_metrics["web_search_score_max"] = combined["web_search_score_max"]
+        
+        # Example query claims: with no evidence found from milvus_hybrid_search or web_search, and with high match in websearch or milvus_hybrid_search
+        for example in (
+            "no_evidence_milvus_hybrid_search",
+            "no_evidence_web_search",
+            "high_match_websearch",
+            "high_match_milvus_hybrid_search",
+        ):
+            sample_metrics[f"example_claim_{example}"] = combined["examples"].get(example)
         
-        # Give an example of query claim with no evidence found from milvus_hybrid_search
-        sample_metrics["example_claim_no_evidence_milvus_hybrid_search"] = next((metric for metric in metrics_data if metric["vector_db_search_size"] == 0), None)
+        # How often were the results served from the evidence retrieval result cache? Events before the cache have no flag
+        sample_metrics["vector_db_cache_hit_rate"] = frequency(combined["vector_db_cache_hits"])
         
-        # Give an example of query claim with no evidence found from web_search
-        sample_metrics["example_claim_no_evidence_web_search"] = next((metric for metric in metrics_data if metric["web_search_size"] == 0), None)
+        sample_metrics["web_search_cache_hit_rate"] = frequency(combined["web_search_cache_hits"])
         
-        # Give an example of query claim with high match in websearch
-        sample_metrics["example_claim_high_match_websearch"] = next((metric for metric in metrics_data if metric["web_search_cosine_similarity_max"] > 0.6), None)
+        # What do the scores look like beyond the max, and have they shifted since the previous range? Only events with score sketches count
+        sample_metrics["vector_db_score_distribution"] = self.score_distribution(combined["sketches"]["vector_db"], reference_sketches["vector_db"])
         
-        # Give an example of query claim with high match in milvus_hybrid_search
-        sample_metrics["example_claim_high_match_milvus_hybrid_search"] = next((metric for metric in metrics_data if metric["vector_db_search_scores_max"] > 0.03), None)
+        sample_metrics["web_search_similarity_distribution"] = self.score_distribution(combined["sketches"]["web_search"], reference_sketches["web_search"])
         
         evidence_retrieval_metrics = EvidenceRetrievalMetrics(
             start_date=self.start_date,
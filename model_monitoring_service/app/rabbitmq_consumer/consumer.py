@@ -1,4 +1,5 @@
 import asyncio
+import time
 
 import aio_pika
 from aio_pika import ExchangeType
@@ -22,6 +23,98 @@ RABBITMQ_URL = (
 )
 
 
+# Unacknowledged messages RabbitMQ delivers at a time; a full window is flushed
+MONITORING_PREFETCH = int(os.getenv("MONITORING_PREFETCH", "100"))
+# A batch that does not fill the window is flushed after this many seconds
+MONITORING_FLUSH_INTERVAL_S = float(os.getenv("MONITORING_FLUSH_INTERVAL_S", "1"))
+MONITORING_RETRY_DELAY_S = float(os.getenv("MONITORING_RETRY_DELAY_S", "5"))
+MONITORING_STATS_INTERVAL_S = float(os.getenv("MONITORING_STATS_INTERVAL_S", "60"))
+# Recompute the metric rollups from the raw metrics at start (they are rebuilt anyway when missing).
+# Only raw events younger than MONITORING_RAW_TTL_DAYS are left to recompute them from, so while
+# they expire "true" is refused and "force" rebuilds anyway, dropping the metrics of older events
+MONITORING_REBUILD_ROLLUPS = os.getenv("MONITORING_REBUILD_ROLLUPS", "false").lower()
+
+
+class MessageBatch:
+    """
+    Messages received since the last flush with their handler key and
+    prepared payload (None for messages acknowledged without being stored).
+    """
+
+    def __init__(self):
+        self.entries: list[tuple[AbstractIncomingMessage, tuple | None, object]] = []
+        self.started = time.monotonic()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def messages(self) -> list[AbstractIncomingMessage]:
+        return [message for message, _, _ in self.entries]
+
+    @property
+    def groups(self) -> dict[tuple, list]:
+        """Payloads grouped by handler key."""
+        groups = {}
+        for _, key, payload in self.entries:
+            if key is not None:
+                groups.setdefault(key, []).append(payload)
+        return groups
+
+    def add(self, message: AbstractIncomingMessage, key: tuple | None, payload) -> None:
+        if not self.entries:
+            self.started = time.monotonic()
+        self.entries.append((message, key, payload))
+
+
+class ConsumerStats:
+    """
+    Throughput, batch sizes and flush latency since the last report.
+    """
+
+    def __init__(self, interval_s: float = MONITORING_STATS_INTERVAL_S):
+        self.interval_s = interval_s
+        self.reset()
+
+    def reset(self) -> None:
+        self.start = time.monotonic()
+        self.messages = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.rejected = 0
+        self.max_batch_size = 0
+        self.write_s = 0.0
+        self.max_write_s = 0.0
+        self.max_batch_age_s = 0.0
+
+    def flushed(self, batch_size: int, write_s: float, batch_age_s: float) -> None:
+        self.messages += batch_size
+        self.batches += 1
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.write_s += write_s
+        self.max_write_s = max(self.max_write_s, write_s)
+        self.max_batch_age_s = max(self.max_batch_age_s, batch_age_s)
+
+    def failed(self, rejected: int) -> None:
+        self.failed_batches += 1
+        self.rejected += rejected
+
+    def maybe_report(self) -> None:
+        elapsed = time.monotonic() - self.start
+        if elapsed < self.interval_s:
+            return
+        if self.batches or self.failed_batches:
+            print(
+                "Monitoring consumer: "
+                f"{self.messages} messages ({self.messages / elapsed:.1f}/s) in {self.batches} batches, "
+                f"mean batch size {self.messages / max(self.batches, 1):.1f} (max {self.max_batch_size}), "
+                f"write {1000 * self.write_s / max(self.batches, 1):.1f} ms mean / {1000 * self.max_write_s:.1f} ms max, "
+                f"oldest message acked after {1000 * self.max_batch_age_s:.1f} ms, "
+                f"{self.failed_batches} failed batches, {self.rejected} messages rejected"
+            )
+        self.reset()
+
+
 class MonitoringConsumer:
     def __init__(
         self,
@@ -30,6 +123,8 @@ class MonitoringConsumer:
         queue_name: str = "logging_queue",
         exchange_name: str = "model_monitoring_exchange",
         binding_keys: list[str] = None,
+        prefetch_count: int = MONITORING_PREFETCH,
+        flush_interval_s: float = MONITORING_FLUSH_INTERVAL_S,
     ):
         self.queue_name = queue_name
 
@@ -44,9 +139,31 @@ class MonitoringConsumer:
 
         self.monitoring_service = monitoring_service
 
+        self.prefetch_count = prefetch_count
+
+        self.flush_interval_s = flush_interval_s
+
+        # (event_type, module_name) -> (prepare one message, store a batch)
+        self.handlers = {
+            ("complete", "evidence_retrieval"): (
+                self.monitoring_service.prepare_evidence_retrieval_metrics,
+                self.monitoring_service.store_evidence_retrieval_metrics,
+            ),
+            ("created", "claim_annotation"): (
+                self.monitoring_service.prepare_claim_annotation_metrics,
+                self.monitoring_service.store_claim_annotation_metrics,
+            ),
+        }
+
+        self.batch = MessageBatch()
+
+        self.batch_full = asyncio.Event()
+
+        self.stats = ConsumerStats()
+
     async def consume(self, channel: aio_pika.Channel):
 
-        await channel.set_qos(10)
+        await channel.set_qos(self.prefetch_count)
 
         exchange = await channel.declare_exchange(
             self.exchange_name, ExchangeType.TOPIC
@@ -58,58 +175,157 @@ class MonitoringConsumer:
 
             await queue.bind(exchange, key)
 
+        # Messages are acknowledged by flush once their batch is stored
+        await queue.consume(self.receive_message)
+
         print(" [*] Waiting for messages.")
 
-        async with queue.iterator() as queue_iter:
+        await self.flush_periodically()
+
+    def route_message(self, message: AbstractIncomingMessage):
+        """
+        Handler key and prepared payload of a message, or (None, None) for
+        messages that are acknowledged without being stored.
+        """
+        parsed_message = self.monitoring_service.parse_message_body(message.body)
+
+        if not parsed_message or not self.monitoring_service.validate_message(
+            parsed_message
+        ):
+
+            print("Invalid message format")
+
+            return None, None
+
+        key = (parsed_message["event_type"], parsed_message["module_name"])
+
+        if key not in self.handlers:
+
+            print(f"Unsupported event type: {key[0]} or module: {key[1]}")
+
+            return None, None
+
+        prepare, _ = self.handlers[key]
+
+        try:
+            payload = prepare(parsed_message)
+        except Exception as e:
+            print(f"Error preparing {key[0]}.{key[1]} message: {e}")
+            payload = None
+
+        if payload is None:
+
+            return None, None
+
+        return key, payload
+
+    async def receive_message(self, message: AbstractIncomingMessage):
+        """Add a message to the current batch"""
+
+        self.batch.add(message, *self.route_message(message))
 
-            async for message in queue_iter:
+        if len(self.batch) >= self.prefetch_count:
 
-                await self.process_message(message)
+            self.batch_full.set()
 
-    async def process_message(self, message: AbstractIncomingMessage):
-        """Process individual messages"""
+    async def flush_periodically(self):
 
-        async with message.process():
-            # Parse and validate
-            parsed_message = self.monitoring_service.parse_message_body(message.body)
+        while True:
 
-            if not parsed_message or not self.monitoring_service.validate_message(
-                parsed_message
-            ):
+            try:
+                await asyncio.wait_for(self.batch_full.wait(), self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
 
-                print("Invalid message format")
+            self.batch_full.clear()
 
-                return
+            await self.flush()
 
-            event_type = parsed_message["event_type"]
+            self.stats.maybe_report()
 
-            module_name = parsed_message["module_name"]
+    async def flush(self):
+        """
+        Store the current batch with one write per handler and acknowledge all
+        its messages at once. When a write fails, the messages are stored and
+        settled one at a time instead (see settle_each).
+        """
+        batch, self.batch = self.batch, MessageBatch()
 
-            # Route to appropriate handler
-            handlers = {
-                (
-                    "complete",
-                    "evidence_retrieval",
-                ): self.monitoring_service.handle_evidence_retrieval_metrics,
-                (
-                    "created",
-                    "claim_annotation",
-                ): self.monitoring_service.handle_claim_annotation_metrics,
-            }
+        if not batch:
 
-            handler = handlers.get((event_type, module_name))
+            return
 
-            if handler:
+        # Later messages have higher delivery tags: ack/nack with multiple=True
+        # settles exactly the messages of this batch
+        last_message = batch.messages[-1]
 
-                success = await handler(self.mongodb_manager, parsed_message)
+        write_start = time.monotonic()
 
-                print(
-                    f"Message processing {'succeeded' if success else 'failed'}: {event_type}.{module_name}"
+        try:
+            await asyncio.gather(
+                *(
+                    self.handlers[key][1](self.mongodb_manager, payloads)
+                    for key, payloads in batch.groups.items()
                 )
+            )
 
-            else:
+        except Exception as e:
 
-                print(f"Unsupported event type: {event_type} or module: {module_name}")
+            print(f"Storing a batch of {len(batch)} messages failed, storing them one at a time: {e}")
+
+            rejected = await self.settle_each(batch)
+
+            self.stats.failed(rejected)
+
+            await asyncio.sleep(MONITORING_RETRY_DELAY_S)
+
+            return
+
+        await last_message.ack(multiple=True)
+
+        self.stats.flushed(len(batch), time.monotonic() - write_start, time.monotonic() - batch.started)
+
+    async def settle_each(self, batch: MessageBatch) -> int:
+        """
+        Store the messages of a failed batch one at a time and settle each on
+        its own: stored messages are acknowledged, a message that fails is
+        requeued on its first delivery and rejected once redelivered, so one
+        bad message neither holds back the others nor loops in the queue.
+        The writes are idempotent, so messages the failed batch write already
+        stored are not counted twice. Returns the number of rejected messages.
+        """
+        rejected = 0
+
+        for message, key, payload in batch.entries:
+
+            if key is None:
+
+                await message.ack()
+
+                continue
+
+            try:
+                await self.handlers[key][1](self.mongodb_manager, [payload])
+
+            except Exception as e:
+
+                if message.redelivered:
+
+                    print(f"Rejecting a redelivered {key[0]}.{key[1]} message that failed again: {e}")
+
+                    await message.reject(requeue=False)
+
+                    rejected += 1
+
+                else:
+
+                    await message.nack(requeue=True)
+
+                continue
+
+            await message.ack()
+
+        return rejected
 
 
 async def main():
@@ -121,7 +337,13 @@ async def main():
 
     try:
         # Connect to DB
-        db_manager.connect_to_db()
+        await db_manager.connect_to_db()
+
+        # Before consuming: a migration or rollup rebuild must not race with new events
+        await db_manager.prepare_collections(
+            rebuild_rollups=MONITORING_REBUILD_ROLLUPS in ("true", "force"),
+            force_rebuild=MONITORING_REBUILD_ROLLUPS == "force",
+        )
 
         # Initialize consumer
         consumer = MonitoringConsumer(
@@ -1,8 +1,51 @@
+import hashlib
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 
 from database.mongodb import MongoDBManager
+from database.rollups import EVIDENCE_SKETCHES, event_time
+from database.score_sketch import is_valid_sketch
+
+# Fields of the evidence retrieval metrics the rollups read
+EVIDENCE_NUMERIC_FIELDS = (
+    "vector_db_search_size",
+    "vector_db_search_scores_max",
+    "web_search_size",
+    "web_search_cosine_similarity_max",
+)
+
+# Parallel lists of the claim annotation metrics, one item per claim
+CLAIM_LIST_FIELDS = ("claim_ids", "claim_annotations", "claim_model_inferences", "claim_model_ids")
+
+
+def event_id(message: Dict[str, Any]) -> str:
+    """
+    Id of a received event: a redelivered message gets the same id, so its
+    metrics are stored and counted once (publishers timestamp every event).
+    """
+    return hashlib.sha1(json.dumps(message, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_label(value: Any) -> bool:
+    # Labels are stored as int(value) in the votes
+    try:
+        int(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def is_timestamp(value: Any) -> bool:
+    try:
+        event_time(value)
+    except (TypeError, ValueError):
+        return False
+    return True
 
 class MonitoringService:
     """
@@ -28,15 +71,9 @@ class MonitoringService:
             else:
                 message_str = message_body
             
-            # Debug the raw message
-            print(f"Raw message before parsing: {message_str}")
-            
             # Parse the message with proper encoding
             parsed_message = json.loads(message_str)
             
-            # Debug the parsed message
-            print(f"Parsed message: {parsed_message}")
-            
             return parsed_message
         except json.JSONDecodeError as e:
             print(f"Error parsing message: {e}")
@@ -78,6 +115,125 @@ class MonitoringService:
                 
         return True
     
+    @staticmethod
+    def prepare_evidence_retrieval_metrics(metrics: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Validate evidence retrieval metrics and add the timestamp.
+        
+        Args:
+            metrics: Evidence retrieval metrics data
+            
+        Returns:
+            The document to store, or None if invalid
+        """
+        # Before the timestamp is added: it would differ between deliveries of a message without one
+        message_id = event_id(metrics)
+        
+        # Add timestamp if not present
+        if "timestamp" not in metrics:
+            metrics["timestamp"] = datetime.now().isoformat()
+        
+        # Additional validation specific to evidence retrieval
+        required_fields = ["event_type", "module_name"]
+        for field in required_fields:
+            if field not in metrics:
+                print(f"Evidence metrics missing required field: {field}")
+                return None
+        
+        if not is_timestamp(metrics["timestamp"]):
+            print(f"Evidence metrics have an invalid timestamp: {metrics['timestamp']}")
+            return None
+        
+        # Everything the rollups read: a message that would fail while its batch is stored is dropped here
+        data = metrics.get("data")
+        if not isinstance(data, dict):
+            print("Evidence metrics missing data field")
+            return None
+        
+        for field in EVIDENCE_NUMERIC_FIELDS:
+            if not is_number(data.get(field)):
+                print(f"Evidence metrics missing numeric field: {field}")
+                return None
+        
+        for field in EVIDENCE_SKETCHES.values():
+            # Events published before the sketches have none
+            if field in data and not is_valid_sketch(data[field]):
+                print(f"Evidence metrics have an invalid sketch: {field}")
+                return None
+        
+        metrics["_id"] = message_id
+        return metrics
+    
+    @staticmethod
+    def prepare_claim_annotation_metrics(metrics: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Validate claim annotation metrics and add the timestamp.
+        
+        Args:
+            metrics: Claim annotation metrics data
+            
+        Returns:
+            The claim annotation data with its timestamp, or None if invalid
+        """
+        # Before the timestamp is added: it would differ between deliveries of a message without one
+        message_id = event_id(metrics)
+        
+        # Add timestamp if not present
+        if "timestamp" not in metrics:
+            metrics["timestamp"] = datetime.now().isoformat()
+        
+        if not is_timestamp(metrics["timestamp"]):
+            print(f"Claim metrics have an invalid timestamp: {metrics['timestamp']}")
+            return None
+        
+        # Additional validation specific to claim annotations
+        data = metrics.get("data")
+        if not isinstance(data, dict):
+            print("Claim metrics missing data field")
+            return None
+        
+        for field in CLAIM_LIST_FIELDS:
+            if not isinstance(data.get(field), list) or not data[field]:
+                print(f"Claim metrics missing {field} field")
+                return None
+            
+        # Check that arrays have the same length
+        if len({len(data[field]) for field in CLAIM_LIST_FIELDS}) != 1:
+            print("Claim metrics arrays have different lengths")
+            return None
+        
+        if any(claim_id is None for claim_id in data["claim_ids"] + data["claim_model_ids"]):
+            print("Claim metrics have a missing claim or model id")
+            return None
+        
+        if not all(is_label(label) for label in data["claim_annotations"] + data["claim_model_inferences"]):
+            print("Claim metrics have a non-integer label")
+            return None
+        
+        return {**data, "timestamp": metrics["timestamp"], "event_id": message_id}
+    
+    @staticmethod
+    async def store_evidence_retrieval_metrics(db_manager: MongoDBManager, batch: List[Dict[str, Any]]) -> None:
+        """
+        Store a batch of prepared evidence retrieval metrics with one write
+        and fold it into the metric rollups. Events stored and folded by an
+        earlier attempt of the batch are skipped.
+        """
+        events = await db_manager.insert_evidence_metrics_many(batch)
+        await db_manager.update_evidence_rollups(events)
+        await db_manager.clear_pending_rollup(db_manager.get_evidence_collection(), events)
+    
+    @staticmethod
+    async def store_claim_annotation_metrics(db_manager: MongoDBManager, batch: List[Dict[str, Any]]) -> None:
+        """
+        Store a batch of prepared claim annotation metrics with one write
+        and fold it into the metric rollups. Claims stored and folded by an
+        earlier attempt of the batch are skipped.
+        """
+        documents = await db_manager.insert_claim_metrics_many(batch)
+        await db_manager.update_claim_rollups(documents)
+        await db_manager.clear_pending_rollup(db_manager.get_claim_collection(), documents)
+    
     @staticmethod
     async def handle_evidence_retrieval_metrics(db_manager:MongoDBManager, metrics: Dict[str, Any]) -> bool:
         """
@@ -90,23 +246,13 @@ class MonitoringService:
             True if successful, False otherwise
         """
         try:
-            # Add timestamp if not present
-            if "timestamp" not in metrics:
-                metrics["timestamp"] = datetime.now().isoformat()
-            
-            
-            # Log the metrics for debugging
-            print(f"Processing evidence retrieval metrics: {metrics}")
-            
-            # Additional validation specific to evidence retrieval
-            required_fields = ["event_type", "module_name"]
-            for field in required_fields:
-                if field not in metrics:
-                    print(f"Evidence metrics missing required field: {field}")
-                    return False
+            metrics = MonitoringService.prepare_evidence_retrieval_metrics(metrics)
+            if metrics is None:
+                return False
             
             # Store in database
             await db_manager.insert_evidence_metrics(metrics)
+            await db_manager.update_evidence_rollups([metrics])
             print(f"Successfully stored evidence retrieval metrics in database")
             return True
         except Exception as e:
@@ -125,35 +271,13 @@ class MonitoringService:
             True if successful, False otherwise
         """
         try:
-            # Add timestamp if not present
-            if "timestamp" not in metrics:
-                metrics["timestamp"] = datetime.now().isoformat()
-            
-            # Log the metrics for debugging
-            print(f"Processing claim annotation metrics: {metrics}")
-            
-            # Additional validation specific to claim annotations
-            data = metrics["data"]
-            if "claim_ids" not in data or not data["claim_ids"]:
-                print("Claim metrics missing claim_ids field")
-                return False
-                
-            if "claim_annotations" not in data or not data["claim_annotations"]:
-                print("Claim metrics missing claim_annotations field")
-                return False
-                
-            if "claim_model_inferences" not in data or not data["claim_model_inferences"]:
-                print("Claim metrics missing claim_model_inferences field")
-                return False
-                
-            # Check that arrays have the same length
-            if len(data["claim_ids"]) != len(data["claim_annotations"]) or \
-               len(data["claim_ids"]) != len(data["claim_model_inferences"]):
-                print("Claim metrics arrays have different lengths")
+            claim_metrics = MonitoringService.prepare_claim_annotation_metrics(metrics)
+            if claim_metrics is None:
                 return False
             
             # The database function handles the transformation to individual records
-            await db_manager.insert_claim_metrics({**data, "timestamp": metrics["timestamp"]})
+            await db_manager.insert_claim_metrics(claim_metrics)
+            await db_manager.update_claim_rollups(db_manager.claim_documents(claim_metrics))
             print(f"Successfully stored claim annotation metrics in database")
             return True
         except Exception as e:
@@ -0,0 +1,291 @@
+"""
+Head-only refresh of the SetFit claim detection model.
+
+Instead of fine-tuning the whole sentence-transformer body (model_training.py),
+this mode keeps the body of an existing model version, encodes the labelled
+corpus with it once and caches the embeddings in a memory-mapped array keyed by
+text hash. Only texts that are not in the cache yet are encoded, so refreshing
+the classification head with new annotations takes seconds.
+
+The new head is registered in MLflow as a new version of the registered model.
+The version stores only the head and the URI of the model providing the body;
+the inference service attaches the already loaded body to it.
+
+Usage:
+    python model/head_training.py --body-model-uri models:/claim-detection-setfit-TurkuNLP/3 \
+        --new-data data/finetuning_data.parquet
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import argparse
+import tempfile
+
+sys.path.append(os.path.join(
+                os.path.dirname(os.path.dirname(os.path.abspath("__file__"))),
+                'model_training_service')
+               )
+
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+from data.data_processing import get_text_label, get_data_splits
+
+import numpy as np
+import pandas as pd
+
+from setfit import SetFitModel
+
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import f1_score, balanced_accuracy_score, accuracy_score
+
+import mlflow
+from mlflow.pyfunc import PythonModel
+
+REGISTERED_MODEL_NAME = os.getenv("REGISTERED_MODEL_NAME", "claim-detection-setfit-TurkuNLP")
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+
+
+class SetFitHeadOnlyModel(PythonModel):
+    """
+    MLflow pyfunc model that stores only a SetFit classification head.
+
+    The body comes from the model at `body_model_uri`. Services that already
+    hold that body call `attach_body`; otherwise it is loaded on first predict.
+    """
+    head_only = True
+
+    def __init__(self, body_model_uri):
+        self.body_model_uri = body_model_uri
+        self.model = None
+
+    def load_context(self, context):
+        with open(context.artifacts['head'], 'rb') as f:
+            self.head = pickle.load(f)
+        self.model = None
+
+    def attach_body(self, body_model):
+        """
+        Build the SetFit model from the body of an already loaded SetFitModel.
+        """
+        self.model = SetFitModel(
+            model_body=body_model.model_body,
+            model_head=self.head,
+            normalize_embeddings=body_model.normalize_embeddings,
+        )
+
+    def predict(self, context, model_input):
+        if self.model is None:
+            self.attach_body(load_setfit_model(self.body_model_uri))
+        return self.model.predict(model_input)
+
+
+def load_setfit_model(model_uri):
+    """
+    Load the SetFitModel behind an MLflow pyfunc model, following head-only
+    versions to the model that provides their body.
+    """
+    python_model = mlflow.pyfunc.load_model(model_uri).unwrap_python_model()
+    if getattr(python_model, "head_only", False):
+        python_model.attach_body(load_setfit_model(python_model.body_model_uri))
+    return python_model.model
+
+
+def resolve_body_model_uri(model_uri):
+    """
+    URI of the model that owns the body weights, so chains of head refreshes
+    all point at the fully fine-tuned version.
+    """
+    python_model = mlflow.pyfunc.load_model(model_uri).unwrap_python_model()
+    if getattr(python_model, "head_only", False):
+        return resolve_body_model_uri(python_model.body_model_uri)
+    return model_uri
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Append-only store of embeddings in a memory-mapped float32 file, with a
+    JSON index from text hash to row. One cache directory per body.
+    """
+
+    def __init__(self, cache_dir, dim):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.vectors_path = os.path.join(cache_dir, 'embeddings.f32')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.dim = dim
+
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        self.n_rows = self._truncate_partial_row()
+
+    def _truncate_partial_row(self):
+        # A crash while appending can leave a partial row at the end of the file
+        if not os.path.exists(self.vectors_path):
+            return 0
+        row_bytes = 4 * self.dim
+        size = os.path.getsize(self.vectors_path)
+        if size % row_bytes:
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(size - size % row_bytes)
+        return size // row_bytes
+
+    def __len__(self):
+        return len(self.index)
+
+    def missing(self, hashes):
+        return [h for h in dict.fromkeys(hashes) if h not in self.index]
+
+    def append(self, hashes, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        assert vectors.shape == (len(hashes), self.dim)
+
+        # Rows written by a crashed run without an index entry are skipped
+        with open(self.vectors_path, 'ab') as f:
+            f.write(vectors.tobytes())
+        for i, h in enumerate(hashes):
+            self.index[h] = self.n_rows + i
+        self.n_rows += len(hashes)
+
+        # Write the index after the vectors
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def get(self, hashes):
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(self.n_rows, self.dim))
+        return np.asarray(vectors[[self.index[h] for h in hashes]])
+
+
+def get_embeddings(model, cache, texts, batch_size=64):
+    """
+    Return embeddings for `texts`, encoding only texts missing from the cache.
+    """
+    hashes = [text_hash(t) for t in texts]
+    missing = cache.missing(hashes)
+
+    if missing:
+        text_by_hash = dict(zip(hashes, texts))
+        vectors = model.encode([text_by_hash[h] for h in missing], batch_size=batch_size, show_progress_bar=True)
+        if hasattr(vectors, 'cpu'):
+            vectors = vectors.cpu().numpy()
+        cache.append(missing, vectors)
+
+    print(f"Embeddings: {len(texts)} texts, {len(missing)} newly encoded, {len(cache)} in cache")
+    return cache.get(hashes), len(missing)
+
+
+def load_new_annotations(path):
+    """
+    Read extra labelled sentences (columns `text` and `label`) from parquet or csv.
+    """
+    df = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+    df = df[df['text'].notna() & df['label'].notna()]
+    return df['text'].astype(str).tolist(), df['label'].astype(int).tolist()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--body-model-uri", type=str, required=True,
+                        help="MLflow URI of the model whose body is reused")
+    parser.add_argument("--new-data", type=str, action="append", default=[],
+                        help="Extra annotations with text and label columns (parquet or csv)")
+    parser.add_argument("--cache-dir", type=str, default=EMBEDDING_CACHE_DIR)
+    parser.add_argument("--random-state", type=int, default=7)
+    parser.add_argument("--registered-model-name", type=str, default=REGISTERED_MODEL_NAME)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Load data: original annotations plus new ones
+    data_path = os.path.join(
+                os.path.dirname(os.path.dirname(os.path.abspath("__file__"))),
+                'model_training_service',
+                os.environ.get("DATA_PATH")
+    )
+    texts, labels = get_text_label(data_path)
+    for path in args.new_data:
+        new_texts, new_labels = load_new_annotations(path)
+        print(f"Loaded {len(new_texts)} new annotations from {path}")
+        texts, labels = texts + new_texts, labels + new_labels
+    texts = [str(t) for t in texts]
+
+    train_df, test_df, dev_df, _ = get_data_splits(args.random_state, texts, labels)
+    train_df = pd.concat([train_df, dev_df])
+
+    # Load the body once and encode what is not cached yet
+    body_model_uri = resolve_body_model_uri(args.body_model_uri)
+    model = load_setfit_model(body_model_uri)
+    dim = model.model_body.get_sentence_embedding_dimension()
+    cache = EmbeddingCache(os.path.join(args.cache_dir, text_hash(body_model_uri)), dim)
+
+    experiment_name = f"/Users/{os.getenv('MLFLOW_TRACKING_USERNAME')}/claim-detection-setfit-head-refresh"
+    experiment = mlflow.get_experiment_by_name(experiment_name)
+    experiment_id = experiment.experiment_id if experiment else mlflow.create_experiment(experiment_name)
+
+    with mlflow.start_run(experiment_id=experiment_id, run_name="setfit-head-refresh"):
+        start_time = time.time()
+        x_train, n_encoded = get_embeddings(model, cache, train_df['text'].tolist())
+        x_test, _ = get_embeddings(model, cache, test_df['text'].tolist())
+        encode_seconds = time.time() - start_time
+
+        # Retrain only the head
+        start_time = time.time()
+        head = LogisticRegression(max_iter=1000)
+        head.fit(x_train, train_df['label'].values)
+        train_seconds = time.time() - start_time
+
+        y_pred = head.predict(x_test)
+        y_true = test_df['label'].values
+        metrics = {
+            "f1-score micro": f1_score(y_true, y_pred, average='micro'),
+            "f1-score macro": f1_score(y_true, y_pred, average='macro'),
+            "f1-score weighted": f1_score(y_true, y_pred, average='weighted'),
+            "balanced accuracy": balanced_accuracy_score(y_true, y_pred),
+            "accuracy": accuracy_score(y_true, y_pred),
+            "encode_seconds": encode_seconds,
+            "head_train_seconds": train_seconds,
+        }
+        print(metrics)
+
+        mlflow.log_params({
+            "mode": "head_only",
+            "body_model_uri": body_model_uri,
+            "train_size": len(train_df),
+            "test_size": len(test_df),
+            "newly_encoded": n_encoded,
+            "train_test_split_random_state": args.random_state,
+        })
+        mlflow.log_metrics(metrics)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            head_path = os.path.join(tmp_dir, 'model_head.pkl')
+            with open(head_path, 'wb') as f:
+                pickle.dump(head, f)
+
+            artifact_path = "setfit_head"
+            mlflow.pyfunc.log_model(
+                artifact_path=artifact_path,
+                artifacts={'head': head_path},
+                python_model=SetFitHeadOnlyModel(body_model_uri),
+                conda_env='conda-env.yml',
+                registered_model_name=args.registered_model_name,
+            )
+
+        print(f"MLFLOW model_uri: {mlflow.get_artifact_uri(artifact_path)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, Optional
 import asyncio
 from model import Claim
 from google_cse import get_cse_search_results
@@ -22,7 +22,7 @@ async def mock_request():
     await asyncio.sleep(3)
     return []
 
-async def concurrent_search(claim: Claim) -> Dict:
+async def concurrent_search(claim: Claim, english_claim: Optional[str] = None) -> Dict:
     """
     Perform concurrent searches across multiple fact-checking sources
     """
@@ -30,7 +30,8 @@ async def concurrent_search(claim: Claim) -> Dict:
         
     logger.info(f"Original Claim: {claim}")
     
-    english_claim = translate_claim(claim.claim, "en")
+    if english_claim is None:
+        english_claim = await translate_claim(claim.claim, "en")
     logger.info(f"Translated claim: {english_claim}")
     
     # Create tasks for all searches
@@ -4,6 +4,8 @@ from model import Claim, WebScrapResult
 
 from concurrent_search import concurrent_search
 
+from translator import translate_claim
+
 from utils import logger
 
 app = fastapi.FastAPI()
@@ -11,7 +13,9 @@ app = fastapi.FastAPI()
 @app.post("/search", response_model=WebScrapResult)
 async def search(search_input: Claim):
     logger.info(f"Received search request for claim: {search_input.claim}")
+    english_claim = await translate_claim(search_input.claim, "en")
     return WebScrapResult(
         claim=search_input.claim, 
-        response=await concurrent_search(search_input)
+        translated_claim=english_claim,
+        response=await concurrent_search(search_input, english_claim)
     )
\ No newline at end of file
@@ -1,4 +1,4 @@
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 from pydantic import BaseModel
 from factchecked_data import PoliticFactData, FaktaBaari, GoogleCustomSearchEngine
 
@@ -14,4 +14,5 @@ class Claim(BaseModel):
 
 class WebScrapResult(BaseModel):
     claim: str
+    translated_claim: Optional[str] = None  # English claim used for the searches
     response: SourceSearchResults
@@ -1,13 +1,226 @@
-from deep_translator import GoogleTranslator
-from langdetect import detect
-
-def translate_claim(claim: str, target_language: str = "fi"):
-    try:
-        language = detect(claim)
-        if language != target_language:
-            return GoogleTranslator(source=language, target=target_language).translate(claim)
-        else:
-            return claim
-    except Exception as e:
-        print(f"Error translating claim: {e}")
-        return claim
+"""
+Cached, non-blocking claim translation.
+
+Translations are keyed by the target language and the text content and kept
+in an in-memory TTL cache in front of an optional SQLite tier that survives
+restarts. Backend calls run in a thread pool so the event loop is never
+blocked, and concurrent requests for the same text share one backend call.
+
+The backend is chosen with TRANSLATION_BACKEND: "google" (langdetect +
+deep_translator) or "local", a stand-in that returns the text unchanged after
+TRANSLATION_LOCAL_LATENCY_MS, for tests and benchmarks.
+
+The same module is used by web_scrape and evidence_retrieval.
+"""
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from utils import logger
+
+import dotenv
+import os
+
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "google")
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "10000"))
+TRANSLATION_CACHE_TTL_S = float(os.getenv("TRANSLATION_CACHE_TTL_S", "86400"))
+TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", "")
+TRANSLATION_PERSISTENT_TTL_S = float(os.getenv("TRANSLATION_PERSISTENT_TTL_S", str(30 * 86400)))
+TRANSLATION_WORKERS = int(os.getenv("TRANSLATION_WORKERS", "4"))
+TRANSLATION_LOCAL_LATENCY_MS = float(os.getenv("TRANSLATION_LOCAL_LATENCY_MS", "0"))
+
+
+class GoogleBackend:
+    def translate(self, text: str, target_language: str) -> str:
+        # Imported here so the local backend works without these packages
+        from deep_translator import GoogleTranslator
+        from langdetect import detect
+
+        # langdetect codes (e.g. "zh-cn", "he") do not always match Google's, so the
+        # detection only skips texts already in the target language
+        if detect(text) == target_language:
+            return text
+        return GoogleTranslator(source="auto", target=target_language).translate(text)
+
+
+class LocalBackend:
+    """
+    Stand-in for the Google backend: returns the text unchanged.
+    """
+
+    def __init__(self, latency_ms: float = TRANSLATION_LOCAL_LATENCY_MS):
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def translate(self, text: str, target_language: str) -> str:
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return text
+
+
+BACKENDS = {
+    "google": GoogleBackend,
+    "local": LocalBackend,
+}
+
+
+class PersistentCache:
+    """
+    SQLite tier of the translation cache.
+    """
+
+    def __init__(self, path: str, ttl_s: float = TRANSLATION_PERSISTENT_TTL_S):
+        self.path = path
+        self.ttl_s = ttl_s
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, translation TEXT, created_at REAL)")
+
+    def get(self, key: str) -> Optional[str]:
+        with sqlite3.connect(self.path) as conn:
+            row = conn.execute(
+                "SELECT translation FROM translations WHERE key = ? AND created_at > ?",
+                (key, time.time() - self.ttl_s),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, translation: str) -> None:
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO translations (key, translation, created_at) VALUES (?, ?, ?)",
+                (key, translation, time.time()),
+            )
+
+
+class Translator:
+    """
+    Translation with a TTL cache, a persistent tier and request coalescing.
+    """
+
+    def __init__(self, backend, cache_size: int = TRANSLATION_CACHE_SIZE, ttl_s: float = TRANSLATION_CACHE_TTL_S, persistent: Optional[PersistentCache] = None, workers: int = TRANSLATION_WORKERS):
+        self.backend = backend
+        self.cache_size = cache_size
+        self.ttl_s = ttl_s
+        self.persistent = persistent
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="translation")
+
+        self.cache: OrderedDict = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.counts = {"memory_hits": 0, "persistent_hits": 0, "coalesced": 0, "backend_calls": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls) -> "Translator":
+        if TRANSLATION_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown translation backend: {TRANSLATION_BACKEND}. Available: {list(BACKENDS)}")
+
+        persistent = PersistentCache(TRANSLATION_CACHE_PATH) if TRANSLATION_CACHE_PATH else None
+        logger.info(f"Translation backend: {TRANSLATION_BACKEND}, persistent cache: {TRANSLATION_CACHE_PATH or 'disabled'}")
+
+        return cls(BACKENDS[TRANSLATION_BACKEND](), persistent=persistent)
+
+    @staticmethod
+    def cache_key(text: str, target_language: str) -> str:
+        return hashlib.sha1(f"{target_language}\x00{text}".encode("utf-8")).hexdigest()
+
+    async def translate(self, text: str, target_language: str) -> str:
+        key = self.cache_key(text, target_language)
+
+        cached = self._memory_get(key)
+        if cached is not None:
+            self.counts["memory_hits"] += 1
+            return cached
+
+        if key in self.in_flight:
+            self.counts["coalesced"] += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            translation = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._lookup_or_translate, key, text, target_language
+            )
+            future.set_result(translation)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters receive the exception, mark it as retrieved here
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[key]
+
+        return translation
+
+    def translate_sync(self, text: str, target_language: str) -> str:
+        """
+        Blocking variant for synchronous callers, without coalescing.
+        """
+        key = self.cache_key(text, target_language)
+        cached = self._memory_get(key)
+        if cached is not None:
+            self.counts["memory_hits"] += 1
+            return cached
+        return self._lookup_or_translate(key, text, target_language)
+
+    def _lookup_or_translate(self, key: str, text: str, target_language: str) -> str:
+        translation = self.persistent.get(key) if self.persistent else None
+        if translation is not None:
+            self.counts["persistent_hits"] += 1
+            self._memory_set(key, translation)
+            return translation
+
+        self.counts["backend_calls"] += 1
+        try:
+            translation = self.backend.translate(text, target_language)
+        except Exception as e:
+            # Failed translations fall back to the original text and are not cached
+            self.counts["errors"] += 1
+            logger.error(f"Error translating text: {e}")
+            return text
+
+        self._memory_set(key, translation)
+        if self.persistent:
+            self.persistent.set(key, translation)
+        return translation
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self.cache_lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                return None
+            translation, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.cache[key]
+                return None
+            self.cache.move_to_end(key)
+            return translation
+
+    def _memory_set(self, key: str, translation: str) -> None:
+        # Called from the executor threads
+        with self.cache_lock:
+            self.cache[key] = (translation, time.monotonic() + self.ttl_s)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {**self.counts, "cache_size": len(self.cache)}
+
+
+translator = Translator.from_env()
+
+
+async def translate_claim(claim: str, target_language: str = "fi") -> str:
+    return await translator.translate(claim, target_language)